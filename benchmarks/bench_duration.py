@@ -0,0 +1,65 @@
+"""Compare strptime based flight duration with minutes arithmetic.
+
+Usage: python -m benchmarks.bench_duration [pairs]
+"""
+import sys
+from datetime import datetime, timedelta
+from benchmarks.harness import measure
+from src.script import calculate_flight_duration
+from src.times import duration_column, format_minutes
+from test.fixtures import generate_flights
+
+
+DEFAULT_PAIRS = 10000
+
+
+def strptime_flight_duration(departure_time: str, arrival_time: str) -> str:
+    """calculate_flight_duration before switching to minutes arithmetic."""
+    dep_time = datetime.strptime(departure_time, '%H:%M')
+    arr_time = datetime.strptime(arrival_time, '%H:%M')
+    duration = timedelta(
+        hours=arr_time.hour - dep_time.hour,
+        minutes=arr_time.minute - dep_time.minute
+    )
+
+    hours = duration.seconds // 3600
+    minutes = (duration.seconds - hours * 3600) // 60
+    formatted_hours = hours if hours >= 10 else f'0{hours}'
+    formatted_minutes = minutes if minutes >= 10 else f'0{minutes}'
+
+    return f'{formatted_hours}:{formatted_minutes}'
+
+
+def main(pairs: int):
+    flights = generate_flights(pairs * 2)
+    departures = [flight[2] for flight in flights]
+    arrivals = [flight[3] for flight in flights]
+    cases = {
+        'strptime': lambda: [
+            strptime_flight_duration(*pair) for pair in zip(departures, arrivals)
+        ],
+        'minutes': lambda: [
+            calculate_flight_duration(*pair) for pair in zip(departures, arrivals)
+        ],
+        'column': lambda: [
+            format_minutes(duration) for duration in duration_column(departures, arrivals)
+        ],
+        'column, no formatting': lambda: duration_column(departures, arrivals),
+    }
+    expected = cases['strptime']()
+
+    assert cases['minutes']() == expected and cases['column']() == expected
+
+    baseline = None
+    print('{:<24} {:>12} {:>9}'.format(f'{pairs} pairs', 'us/pair', 'Speedup'))
+
+    for name, function in cases.items():
+        seconds = measure(function)['min']
+        baseline = baseline or seconds
+        print('{:<24} {:>12.3f} {:>8.1f}x'.format(
+            name, seconds / pairs * 1e6, baseline / seconds
+        ))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PAIRS)
@@ -0,0 +1,43 @@
+"""Compare per-flight XPath lookups with single-pass quote table parsing.
+
+Usage: python -m benchmarks.bench_parser [rows ...]
+"""
+import sys
+import lxml.html
+from benchmarks.harness import measure
+from src.parser import parse_quotes_table
+from test.fixtures import build_quotes_page, generate_flights
+
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+
+
+def xpath_per_flight(table):
+    """Group rows the way the search did before parse_quotes_table."""
+    meta_info_about_flights = table.xpath('tr[contains(@id,"rinf")]')
+    flight_ids = tuple(item[-5:] for item in table.xpath('./tr[contains(@id,"rinf")]/@id'))
+
+    return [
+        table.xpath(
+            f'./tr[contains(@id,"{flight_id}")and not(contains(@id, "rinf"))]/td[text()]'
+        )
+        for flight_id in dict(zip(flight_ids, meta_info_about_flights))
+    ]
+
+
+def main(sizes):
+    print('{:>8} {:>14} {:>14} {:>9}'.format('Rows', 'XPath, ms', 'Single, ms', 'Speedup'))
+
+    for rows in sizes:
+        page = lxml.html.document_fromstring(build_quotes_page(generate_flights(rows)))
+        table = page.xpath('//table[@id="flywiz_tblQuotes"]')[0]
+        xpath_time = measure(lambda: xpath_per_flight(table))['min']
+        single_time = measure(lambda: parse_quotes_table(table))['min']
+
+        print('{:>8} {:>14.3f} {:>14.3f} {:>8.1f}x'.format(
+            rows, xpath_time * 1000, single_time * 1000, xpath_time / single_time
+        ))
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
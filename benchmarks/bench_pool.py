@@ -0,0 +1,79 @@
+"""Measure how parsing of recorded pages scales with number of worker processes.
+
+Usage: python -m benchmarks.bench_pool [--pages N] [--chunk-size N] [workers ...]
+"""
+import argparse
+import os
+import time
+from datetime import datetime
+from typing import List
+from src.pool import ParserPool, PageJob
+from src.search import SearchQuery
+from test.fixtures import PAGES_DIR
+
+
+def recorded_jobs() -> List[PageJob]:
+    """Return job for every recorded page, query is taken from file name."""
+    jobs = []
+
+    for name in sorted(os.listdir(PAGES_DIR)):
+        if not name.endswith('.html'):
+            continue
+
+        # e.g. boj_bll_01.07.2019_rt_05.08.2019.html
+        dep_city, dest_city, dep_date, kind, *rest = name[:-5].split('_')
+        return_date = datetime.strptime(rest[0], '%d.%m.%Y') if kind == 'rt' else None
+
+        with open(os.path.join(PAGES_DIR, name), 'rb') as page:
+            jobs.append(PageJob(
+                SearchQuery(
+                    dep_city.upper(), dest_city.upper(),
+                    datetime.strptime(dep_date, '%d.%m.%Y'), 1, return_date
+                ),
+                page.read()
+            ))
+
+    return jobs
+
+
+def measure(workers: int, jobs: List[PageJob], chunk_size: int) -> float:
+    """Return seconds to parse all jobs, pool start up is not included."""
+    with ParserPool(workers, chunk_size) as pool:
+        # Start worker processes before measuring
+        list(pool.map(jobs[:max(workers, 1)], ordered=False))
+        start = time.perf_counter()
+        results = list(pool.map(jobs, ordered=False))
+        elapsed = time.perf_counter() - start
+
+    assert all(result.error is None for result in results)
+
+    return elapsed
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Parser pool scaling')
+    argument_parser.add_argument(
+        'workers', nargs='*', type=int,
+        default=sorted({0, 1, 2, 4, os.cpu_count() or 1}),
+        help='numbers of worker processes, 0 parses in the main process'
+    )
+    argument_parser.add_argument('--pages', type=int, default=2000, help='number of pages')
+    argument_parser.add_argument('--chunk-size', type=int, default=16, help='pages per task')
+    args = argument_parser.parse_args()
+
+    recorded = recorded_jobs()
+    jobs = [recorded[index % len(recorded)] for index in range(args.pages)]
+    baseline = None
+    print(f'{len(jobs)} pages, {os.cpu_count()} CPUs')
+    print('{:>8} {:>10} {:>12} {:>9}'.format('Workers', 'Time, s', 'Pages/s', 'Speedup'))
+
+    for workers in args.workers:
+        elapsed = measure(workers, jobs, args.chunk_size)
+        baseline = baseline or elapsed
+        print('{:>8} {:>10.3f} {:>12.0f} {:>8.2f}x'.format(
+            workers, elapsed, len(jobs) / elapsed, baseline / elapsed
+        ))
+
+
+if __name__ == '__main__':
+    main()
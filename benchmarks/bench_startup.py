@@ -0,0 +1,86 @@
+"""Measure CLI startup for arguments rejected before any request is made.
+
+Runs main.py under `python -X importtime` and reports wall time, total
+import time and whether network or parsing libraries were loaded.
+
+Usage: python -m benchmarks.bench_startup [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('lxml', 'numpy', 'requests', 'sqlite3')
+CASES = {
+    'invalid city code': ('BOJ', 'XXX', '01.07.2099', '2'),
+    'date in the past': ('BOJ', 'BLL', '01.07.2019', '2'),
+    'unknown route': ('CPH', 'BLL', '01.07.2099', '2'),
+    'invalid passengers': ('BOJ', 'BLL', '01.07.2099', '9'),
+}
+DEFAULT_RUNS = 10
+
+
+def parse_importtime(stderr: str):
+    """Return total import time in microseconds and imported top-level modules."""
+    total = 0
+    modules = set()
+
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+
+        # Top-level imports are not indented
+        if not name.startswith('  '):
+            total += int(cumulative)
+
+        modules.add(name.strip().split('.')[0])
+
+    return total, modules
+
+
+def run_case(arguments, runs: int):
+    """Run main.py with arguments, return median wall and import times."""
+    wall_times = []
+    import_times = []
+    modules = set()
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.run(
+            (sys.executable, '-X', 'importtime', 'main.py', *arguments),
+            cwd=ROOT, capture_output=True, text=True
+        )
+        wall_times.append(time.perf_counter() - start)
+        import_time, modules = parse_importtime(process.stderr)
+        import_times.append(import_time)
+
+    return statistics.median(wall_times), statistics.median(import_times), modules
+
+
+def main(runs: int):
+    start = time.perf_counter()
+
+    for _ in range(runs):
+        subprocess.run((sys.executable, '-c', 'pass'), cwd=ROOT)
+
+    interpreter = (time.perf_counter() - start) / runs
+
+    print(f'Bare interpreter startup: {interpreter * 1000:.1f} ms')
+    print('{:<20} {:>10} {:>12}  {}'.format('Case', 'Wall, ms', 'Imports, ms', 'Heavy modules'))
+
+    for name, arguments in CASES.items():
+        wall_time, import_time, modules = run_case(arguments, runs)
+        heavy = ', '.join(module for module in HEAVY_MODULES if module in modules) or '-'
+
+        print('{:<20} {:>10.1f} {:>12.1f}  {}'.format(
+            name, wall_time * 1000, import_time / 1000, heavy
+        ))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RUNS)
@@ -0,0 +1,110 @@
+"""Compare validation of batch queries by parse_arguments and by QueryValidator.
+
+Usage: python -m benchmarks.bench_validate [rows]
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List
+import src.script as script
+from src.batch import QueryValidator, to_query
+from src.search import SearchQuery
+
+
+DEFAULT_ROWS = 100000
+ROUTES = (('BOJ', 'BLL'), ('BLL', 'BOJ'), ('CPH', 'BOJ'), ('BOJ', 'CPH'))
+
+
+def generate_records(rows: int) -> List[Dict[str, Any]]:
+    """Return raw queries over a year of dates, so dates repeat many times."""
+    generator = random.Random(rows)
+    start = date.today() + timedelta(days=1)
+    records = []
+
+    for _ in range(rows):
+        dep_date = start + timedelta(days=generator.randrange(365))
+        record = {
+            'dep_city': '', 'dest_city': '',
+            'dep_date': f'{dep_date:%d.%m.%Y}',
+            'passengers': str(generator.randrange(1, 9)),
+            'return_date': None
+        }
+        record['dep_city'], record['dest_city'] = generator.choice(ROUTES)
+
+        if generator.random() < 0.5:
+            record['return_date'] = f'{dep_date + timedelta(days=generator.randrange(30)):%d.%m.%Y}'
+
+        records.append(record)
+
+    return records
+
+
+def parse_arguments_query(record: Dict[str, Any]) -> SearchQuery:
+    """Validate record as command line arguments of single search."""
+    arguments = [record['dep_city'], record['dest_city'], record['dep_date'], record['passengers']]
+
+    if record['return_date']:
+        arguments.append(f'-return_date={record["return_date"]}')
+
+    args = script.parse_arguments(arguments)
+
+    return SearchQuery(args.dep_city, args.dest_city, args.dep_date, args.passengers, args.return_date)
+
+
+def strptime_query(record: Dict[str, Any]) -> SearchQuery:
+    """Validate record with script validators, as batch mode did before QueryValidator."""
+    return_date = record['return_date']
+
+    return SearchQuery(
+        script.validate_city_code(record['dep_city']),
+        script.validate_city_code(record['dest_city']),
+        strptime_date(record['dep_date']),
+        script.validate_passengers(record['passengers']),
+        strptime_date(return_date) if return_date else None
+    )
+
+
+def strptime_date(flight_date: str) -> datetime:
+    """validate_date before parsing dates without strptime."""
+    parsed_date = datetime.strptime(flight_date, '%d.%m.%Y')
+
+    if datetime.today() > parsed_date:
+        raise argparse.ArgumentTypeError('Date in the past')
+
+    return parsed_date
+
+
+def measure(function: Callable[[Dict[str, Any]], SearchQuery], records: List[Dict[str, Any]]):
+    """Return seconds to validate all records and the queries."""
+    start = time.perf_counter()
+    queries = [function(record) for record in records]
+
+    return time.perf_counter() - start, queries
+
+
+def main(rows: int):
+    records = generate_records(rows)
+    validator = QueryValidator()
+    cases = {
+        'parse_arguments': parse_arguments_query,
+        'strptime validators': strptime_query,
+        'to_query': to_query,
+        'QueryValidator': validator.to_query,
+    }
+    expected = None
+    print(f'{rows} rows')
+    print('{:<20} {:>10} {:>12}'.format('Validation', 'Time, s', 'Rows/s'))
+
+    for name, function in cases.items():
+        elapsed, queries = measure(function, records)
+        expected = expected or queries
+
+        assert queries == expected
+
+        print('{:<20} {:>10.3f} {:>12.0f}'.format(name, elapsed, rows / elapsed))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS)
@@ -0,0 +1,153 @@
+"""Minimal benchmark registry, runner and JSON result storage."""
+import json
+import platform
+import statistics
+import subprocess
+import time
+import timeit
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+REPEAT = 5
+
+
+class Benchmark(NamedTuple):
+    """Registered benchmark, setup returns function measured for params."""
+
+    name: str
+    setup: Callable[[Any], Callable[[], Any]]
+    params: Tuple
+
+
+REGISTRY: List[Benchmark] = []
+
+
+def benchmark(name: str, params: Iterable = (None,)):
+    """Register setup function returning callable to measure for each param.
+
+    Arguments:
+        name -- unique benchmark name.
+        params -- values passed to setup, e.g. page sizes.
+    """
+    def register(setup):
+        REGISTRY.append(Benchmark(name, setup, tuple(params)))
+
+        return setup
+
+    return register
+
+
+def measure(function: Callable[[], Any], repeat: int = REPEAT) -> Dict[str, float]:
+    """Time function, number of calls per round is chosen by timeit.
+
+    Arguments:
+        function -- function without arguments.
+        repeat -- number of rounds.
+
+    Returns:
+        dict -- statistics of single call time in seconds.
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    rounds = [total / number for total in timer.repeat(repeat=repeat, number=number)]
+
+    return {
+        'min': min(rounds),
+        'median': statistics.median(rounds),
+        'mean': statistics.mean(rounds),
+        'stdev': statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+        'number': number,
+        'repeat': repeat
+    }
+
+
+def run(pattern: str = '', repeat: int = REPEAT, report: Callable = print) -> List[Dict[str, Any]]:
+    """Run registered benchmarks whose names contain pattern.
+
+    Arguments:
+        pattern -- substring of benchmark name, all benchmarks if empty.
+        repeat -- number of rounds.
+        report -- called with every result as soon as it is measured.
+
+    Returns:
+        list -- results with name, param and timing statistics.
+    """
+    results = []
+
+    for bench in REGISTRY:
+        if pattern not in bench.name:
+            continue
+
+        for param in bench.params:
+            result = {'name': bench.name, 'param': param}
+            result.update(measure(bench.setup(param), repeat))
+            results.append(result)
+            report(result)
+
+    return results
+
+
+def git_revision() -> Optional[str]:
+    """Return current commit hash or None outside git repository."""
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', 'HEAD'), capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(results: List[Dict[str, Any]], path: str) -> None:
+    """Write results with environment description to JSON file."""
+    document = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timer': 'timeit.default_timer',
+            'unix_time': time.time()
+        },
+        'benchmarks': results
+    }
+
+    with open(path, 'w') as results_file:
+        json.dump(document, results_file, indent=2)
+
+
+def load(path: str) -> List[Dict[str, Any]]:
+    """Read results saved by save."""
+    with open(path) as results_file:
+        return json.load(results_file)['benchmarks']
+
+
+def compare(
+        baseline: List[Dict[str, Any]],
+        current: List[Dict[str, Any]],
+        threshold: float = 0.1
+) -> List[Tuple[str, Any, float, float, bool]]:
+    """Compare median times of benchmarks present in both result sets.
+
+    Arguments:
+        baseline -- previous results.
+        current -- new results.
+        threshold -- relative slowdown treated as regression.
+
+    Returns:
+        list -- name, param, baseline median, current median and
+            regression flag for every common benchmark.
+    """
+    previous = {(result['name'], str(result['param'])): result for result in baseline}
+    comparison = []
+
+    for result in current:
+        old = previous.get((result['name'], str(result['param'])))
+
+        if old is not None:
+            comparison.append((
+                result['name'], result['param'], old['median'], result['median'],
+                result['median'] > old['median'] * (1 + threshold)
+            ))
+
+    return comparison
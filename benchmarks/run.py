@@ -0,0 +1,65 @@
+"""Run benchmark suite and store results as JSON.
+
+Usage: python -m benchmarks.run [-k PATTERN] [-o RESULTS] [--compare BASELINE]
+"""
+import argparse
+import sys
+from typing import List
+import benchmarks.suite  # noqa: F401, registers benchmarks
+from benchmarks import harness
+
+
+def parse_arguments(args: List) -> argparse.Namespace:
+    """Handle command line arguments."""
+    argument_parser = argparse.ArgumentParser(description='Flights info benchmarks')
+    argument_parser.add_argument(
+        '-k', dest='pattern', default='', help='run benchmarks containing pattern'
+    )
+    argument_parser.add_argument('-o', '--output', help='save results to JSON file')
+    argument_parser.add_argument(
+        '--compare', metavar='BASELINE', help='JSON file with previous results'
+    )
+    argument_parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='relative slowdown reported as regression'
+    )
+    argument_parser.add_argument(
+        '--repeat', type=int, default=harness.REPEAT, help='number of rounds'
+    )
+
+    return argument_parser.parse_args(args)
+
+
+def report(result):
+    print('{:<28} {:>10} {:>14.3f} us'.format(
+        result['name'], str(result['param']), result['median'] * 1e6
+    ))
+
+
+def main(arguments: List) -> int:
+    args = parse_arguments(arguments)
+    print('{:<28} {:>10} {:>17}'.format('Benchmark', 'Param', 'Median'))
+    results = harness.run(args.pattern, args.repeat, report)
+
+    if args.output:
+        harness.save(results, args.output)
+
+    if not args.compare:
+        return 0
+
+    regressions = 0
+    print('\n{:<28} {:>10} {:>9}'.format('Benchmark', 'Param', 'Change'))
+
+    for name, param, old, new, regression in harness.compare(
+            harness.load(args.compare), results, args.threshold
+    ):
+        regressions += regression
+        print('{:<28} {:>10} {:>+8.1%}{}'.format(
+            name, str(param), new / old - 1, '  REGRESSION' if regression else ''
+        ))
+
+    return int(bool(regressions))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
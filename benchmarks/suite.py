@@ -0,0 +1,198 @@
+"""Benchmarks of the search pipeline replaying pages without network access."""
+import contextlib
+import io
+import os
+import random
+import tempfile
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+import lxml.html
+import src.script as script
+from src.archive import QuoteArchive, ReplaySession as ArchiveReplaySession
+from src.columns import FareTable
+from src.flight import Flight
+from src.parser import parse_quotes_table
+from src.search import SearchQuery
+from src.times import duration_column
+from benchmarks.harness import benchmark
+from test.fixtures import PAGES_DIR, build_quotes_page, generate_flights
+
+
+RECORDED_PAGE = 'cph_boj_26.06.2019_rt_04.07.2019.html'
+RECORDED_QUERY = SearchQuery('CPH', 'BOJ', datetime(2019, 6, 26), 4, datetime(2019, 7, 4))
+# Number of table rows in synthetic pages, 'recorded' is RECORDED_PAGE
+PAGE_SIZES = ('recorded', 100, 1000, 10000)
+
+
+class ReplayResponse:
+    """Response of requests library replaying page bytes."""
+
+    ok = True
+    status_code = 200
+    encoding = 'utf-8'
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    @property
+    def text(self) -> str:
+        return self.body.decode(self.encoding)
+
+    def iter_content(self, chunk_size: int = 1):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class ReplaySession:
+    """Replacement of requests.Session answering every request with one page."""
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def get(self, url, params=None, **kwargs):
+        return ReplayResponse(self.body)
+
+
+@lru_cache(maxsize=None)
+def load_page(size) -> bytes:
+    """Return recorded page or synthetic page with size table rows."""
+    if size == 'recorded':
+        with open(os.path.join(PAGES_DIR, RECORDED_PAGE), 'rb') as page:
+            return page.read()
+
+    return build_quotes_page(generate_flights(size)).encode()
+
+
+def page_query(size) -> SearchQuery:
+    """Return query matching the first flight of the page."""
+    if size == 'recorded':
+        return RECORDED_QUERY
+
+    _, flight_date, _, _, dep_city, dest_city, _, _ = generate_flights(2)[0]
+
+    return SearchQuery(
+        dep_city[-4:-1], dest_city[-4:-1], datetime.strptime(flight_date, '%a, %d %b %y'), 2
+    )
+
+
+@benchmark('extract_flights', PAGE_SIZES)
+def bench_extract_flights(size):
+    page = load_page(size).decode()
+    query = page_query(size)
+
+    return lambda: script.extract_flights(page, query)
+
+
+@benchmark('stream_flights', PAGE_SIZES)
+def bench_stream_flights(size):
+    session = ReplaySession(load_page(size))
+    query = page_query(size)
+    parameters = script.create_url_parameters(query)
+
+    return lambda: script.stream_flights(parameters, query, session)
+
+
+@benchmark('parse_quotes_table', PAGE_SIZES)
+def bench_parse_quotes_table(size):
+    html_page = lxml.html.document_fromstring(load_page(size))
+    table = html_page.xpath('//table[@id="flywiz_tblQuotes"]')[0]
+
+    return lambda: parse_quotes_table(table)
+
+
+@benchmark('write_flight_information')
+def bench_write_flight_information(_):
+    flight = parse_quotes_table(
+        lxml.html.document_fromstring(load_page('recorded')).xpath(
+            '//table[@id="flywiz_tblQuotes"]'
+        )[0]
+    )[0]
+    flight_date = RECORDED_QUERY.dep_date.date()
+
+    return lambda: script.write_flight_information(
+        flight_date, *flight['info'][2:6], flight['price_and_extra_info'], 4
+    )
+
+
+@benchmark('calculate_flight_duration')
+def bench_calculate_flight_duration(_):
+    return lambda: script.calculate_flight_duration('23:30', '00:15')
+
+
+@benchmark('duration_column', (100, 10000))
+def bench_duration_column(size):
+    flights = generate_flights(size * 2)
+    departures = [flight[2] for flight in flights]
+    arrivals = [flight[3] for flight in flights]
+
+    return lambda: duration_column(departures, arrivals)
+
+
+@benchmark('print_flights_information')
+def bench_print_flights_information(_):
+    flights = script.extract_flights(load_page('recorded').decode(), RECORDED_QUERY)
+    output = io.StringIO()
+
+    def print_flights():
+        output.seek(0)
+
+        with contextlib.redirect_stdout(output):
+            script.print_flights_information(flights)
+
+    return print_flights
+
+
+@lru_cache(maxsize=None)
+def fare_table(size: int) -> FareTable:
+    """Return table of size random flights of 4 routes over 90 days."""
+    generator = random.Random(size)
+    routes = (('BOJ', 'BLL'), ('BLL', 'BOJ'), ('CPH', 'BOJ'), ('BOJ', 'CPH'))
+    table = FareTable()
+
+    for _ in range(size):
+        departure = generator.randrange(24 * 60)
+        table.append(Flight(
+            date(2019, 6, 1) + timedelta(days=generator.randrange(90)),
+            departure, (departure + 150) % (24 * 60), 150,
+            *generator.choice(routes), generator.randrange(5000, 50000)
+        ))
+
+    return table
+
+
+@benchmark('fare_table_filter', (10000, 100000))
+def bench_fare_table_filter(size):
+    table = fare_table(size)
+
+    return lambda: table.filter(dep_city='BOJ', departs_after=600, max_price=20000)
+
+
+@benchmark('fare_table_aggregate', (10000, 100000))
+def bench_fare_table_aggregate(size):
+    table = fare_table(size)
+
+    return table.fares_by_route_date
+
+
+@benchmark('replay_search')
+def bench_replay_search(_):
+    parameters = script.create_url_parameters(RECORDED_QUERY)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'quotes.zip')
+
+        with QuoteArchive(path, 'a') as archive:
+            archive.put(parameters, 200, load_page('recorded'), 'utf-8')
+
+        with QuoteArchive(path) as archive:
+            archive.load()
+
+    session = ArchiveReplaySession(archive)
+
+    return lambda: script.stream_flights(parameters, RECORDED_QUERY, session)
@@ -1,10 +1,29 @@
+import importlib
 import sys
 import src.script as source
+from src.profiling import PROFILER
+
+
+# Modules with main function which run instead of single search
+# if command is passed as the first argument
+COMMANDS = {
+    'batch': 'src.batch',
+    'calendar': 'src.fares',
+    'connect': 'src.connections',
+    'history': 'src.history',
+    'serve': 'src.server',
+    'watch': 'src.watch',
+}
 
 
 def main():
     """Flights_info demo."""
-    source.print_flights_information(source.find_flight_info(sys.argv[1:]))
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        command = importlib.import_module(COMMANDS[sys.argv[1]])
+        sys.exit(command.main(sys.argv[2:]))
+
+    source.print_flights_information(source.find_flights(sys.argv[1:]))
+    PROFILER.finish()
 
 
 if __name__ == '__main__':
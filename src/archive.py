@@ -0,0 +1,219 @@
+import contextlib
+import json
+import threading
+import zipfile
+from typing import Dict, Any, Iterator, Optional
+import requests
+from src.cache import QuoteCache
+from src.fetch import Fetcher, default_fetcher
+
+
+class NotRecordedError(requests.RequestException):
+    """Replayed request is missing in archive."""
+
+
+class ArchivedResponse:
+    """Recorded response with the part of requests.Response API used by search."""
+
+    def __init__(self, status_code: int, content: bytes, encoding: Optional[str] = None):
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+        self.headers = {}
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or 'utf-8', 'replace')
+
+    def iter_content(self, chunk_size: int = 1) -> Iterator[bytes]:
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class QuoteArchive:
+    """Zip archive of responses keyed by normalized url parameters.
+
+    Every response is one entry, its key, status and encoding are stored
+    in the entry comment, so zip central directory is the index and
+    archive can be appended to by later recordings.
+    """
+
+    def __init__(self, path: str, mode: str = 'r'):
+        """Open archive.
+
+        Arguments:
+            path -- zip file.
+            mode -- 'r' to replay, 'a' to record into new or existing archive.
+        """
+        self._zip = zipfile.ZipFile(path, mode, zipfile.ZIP_DEFLATED)
+        self._lock = threading.Lock()
+        self._index: Dict[str, zipfile.ZipInfo] = {}
+        self._bodies: Dict[str, bytes] = {}
+
+        for info in self._zip.infolist():
+            # Later recording of the same request wins
+            self._index[json.loads(info.comment)['key']] = info
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, parameters: Dict[str, Any]) -> bool:
+        return QuoteCache.make_key(parameters) in self._index
+
+    def load(self) -> None:
+        """Read all responses into memory, so replay does not touch the file."""
+        for key in self._index:
+            self._read(key)
+
+    def _read(self, key: str) -> bytes:
+        body = self._bodies.get(key)
+
+        if body is None:
+            with self._lock:
+                body = self._bodies[key] = self._zip.read(self._index[key])
+
+        return body
+
+    def get(self, parameters: Dict[str, Any]) -> Optional[ArchivedResponse]:
+        """Return recorded response or None if request was not recorded.
+
+        Arguments:
+            parameters -- url parameters.
+
+        Returns:
+            ArchivedResponse -- response with recorded status and body.
+        """
+        key = QuoteCache.make_key(parameters)
+        info = self._index.get(key)
+
+        if info is None:
+            return None
+
+        meta = json.loads(info.comment)
+
+        return ArchivedResponse(meta['status'], self._read(key), meta['encoding'])
+
+    def put(
+            self,
+            parameters: Dict[str, Any],
+            status: int,
+            content: bytes,
+            encoding: Optional[str] = None
+    ) -> None:
+        """Append response.
+
+        Arguments:
+            parameters -- url parameters.
+            status -- HTTP status.
+            content -- raw response body.
+            encoding -- response encoding.
+        """
+        key = QuoteCache.make_key(parameters)
+
+        with self._lock:
+            info = zipfile.ZipInfo(f'{len(self._zip.infolist()):08d}.html')
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.comment = json.dumps(
+                {'key': key, 'status': status, 'encoding': encoding}, separators=(',', ':')
+            ).encode()
+            self._zip.writestr(info, content)
+            self._index[key] = info
+            self._bodies[key] = content
+
+    def close(self) -> None:
+        """Write index and close file."""
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ReplaySession:
+    """Session answering requests from archive without network."""
+
+    def __init__(self, archive: QuoteArchive):
+        self.archive = archive
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None, **kwargs) -> ArchivedResponse:
+        """Return recorded response.
+
+        Raises:
+            NotRecordedError -- request is missing in archive.
+        """
+        response = self.archive.get(params or {})
+
+        if response is None:
+            raise NotRecordedError(
+                f'Response is not recorded for {QuoteCache.make_key(params or {})}'
+            )
+
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+class RecordingSession:
+    """Session downloading pages and appending every response to archive."""
+
+    def __init__(self, archive: QuoteArchive, session: Optional[Fetcher] = None):
+        self.archive = archive
+        self.session = session or default_fetcher()
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None, **kwargs) -> ArchivedResponse:
+        """Download whole page, record it and return it as ArchivedResponse."""
+        kwargs.pop('stream', None)
+        response = self.session.get(url, params=params, **kwargs)
+        recorded = ArchivedResponse(response.status_code, response.content, response.encoding)
+        self.archive.put(params or {}, recorded.status_code, recorded.content, recorded.encoding)
+
+        return recorded
+
+    def close(self) -> None:
+        # Wrapped session is closed by its owner
+        pass
+
+
+@contextlib.contextmanager
+def archive_session(
+        record: Optional[str] = None,
+        replay: Optional[str] = None,
+        session: Optional[Fetcher] = None
+) -> Iterator[Optional[Any]]:
+    """Open archive for recording or replaying.
+
+    Arguments:
+        record -- archive to append downloaded responses to.
+        replay -- archive to serve responses from, it is read into memory.
+        session -- session downloading pages while recording.
+
+    Yields:
+        RecordingSession, ReplaySession or passed session if no archive
+            is given.
+    """
+    if record is None and replay is None:
+        yield session
+        return
+
+    with QuoteArchive(replay or record, 'r' if replay else 'a') as archive:
+        if replay:
+            archive.load()
+            yield ReplaySession(archive)
+        else:
+            yield RecordingSession(archive, session)
@@ -0,0 +1,396 @@
+import argparse
+import asyncio
+import contextlib
+import csv
+import itertools
+import json
+import sys
+from datetime import date, datetime
+from functools import lru_cache
+from typing import ContextManager, Dict, Any, IO, Iterable, Iterator, List, Optional, Tuple, Union
+import src.script as script
+from src.archive import archive_session
+from src.cache import QuoteCache
+from src.flight import format_flights
+from src.history import FareHistory
+from src.output import WRITERS, FlightWriter, open_writer
+from src.passengers import PassengerFareCache
+from src.pool import DEFAULT_CHUNK_SIZE, ParserPool, search_parallel
+from src.search import (
+    DEFAULT_CONCURRENCY, SearchQuery, SearchResult, concurrency_arguments, create_session, search_many
+)
+
+
+# Max number of distinct date strings memoized by QueryValidator
+DATE_CACHE_SIZE = 4096
+
+
+def detect_format(first_line: str) -> str:
+    """Return 'jsonl' if line looks like JSON object and 'csv' otherwise."""
+    return 'jsonl' if first_line.lstrip().startswith('{') else 'csv'
+
+
+def iter_records(stream: IO[str], input_format: str = 'auto') -> Iterator[Dict[str, Any]]:
+    """Read raw queries from newline-delimited JSON or CSV with header.
+
+    Arguments:
+        stream -- text stream with queries.
+        input_format -- 'jsonl', 'csv' or 'auto' to detect by the first line.
+
+    Yields:
+        dict -- raw query fields.
+    """
+    lines = (line for line in stream if line.strip())
+    first_line = next(lines, None)
+
+    if first_line is None:
+        return
+
+    if input_format == 'auto':
+        input_format = detect_format(first_line)
+
+    if input_format == 'jsonl':
+        yield json.loads(first_line)
+
+        for line in lines:
+            yield json.loads(line)
+    else:
+        yield from csv.DictReader(itertools.chain((first_line,), lines))
+
+
+class QueryValidator:
+    """Validator of raw query fields built once per run.
+
+    Today is taken once and parsed dates are memoized, so repeated dates
+    of large inputs are parsed once. Checks are the same as of command
+    line arguments.
+    """
+
+    def __init__(
+            self,
+            today: Optional[date] = None,
+            cache_size: int = DATE_CACHE_SIZE,
+            allow_past: bool = False
+    ):
+        """Create validator.
+
+        Arguments:
+            today -- dates up to today are rejected, current date if None.
+            cache_size -- max number of memoized date strings.
+            allow_past -- accept past dates, e.g. of replayed searches.
+        """
+        self.today = today or date.today()
+        self.allow_past = allow_past
+        self.parse_date = lru_cache(maxsize=cache_size)(script.parse_flight_date)
+
+    def validate_date(self, flight_date: str) -> datetime:
+        """Parse date, raise argparse.ArgumentTypeError if it is not after today."""
+        parsed_date = self.parse_date(flight_date)
+
+        if not self.allow_past and parsed_date.date() <= self.today:
+            raise argparse.ArgumentTypeError('Date in the past')
+
+        return parsed_date
+
+    def to_query(self, record: Dict[str, Any]) -> SearchQuery:
+        """Validate raw query fields the same way as command line arguments.
+
+        Arguments:
+            record -- raw query fields.
+
+        Raises:
+            KeyError -- required field is missing.
+            ValueError -- invalid field value.
+            TypeError -- invalid passengers type.
+            argparse.ArgumentTypeError -- invalid field value.
+
+        Returns:
+            SearchQuery -- valid query.
+        """
+        return_date = record.get('return_date')
+
+        return SearchQuery(
+            dep_city=script.validate_city_code(record['dep_city']),
+            dest_city=script.validate_city_code(record['dest_city']),
+            dep_date=self.validate_date(record['dep_date']),
+            passengers=script.validate_passengers(record['passengers']),
+            return_date=self.validate_date(return_date) if return_date else None
+        )
+
+
+def to_query(record: Dict[str, Any], validator: Optional[QueryValidator] = None) -> SearchQuery:
+    """Validate raw query fields the same way as command line arguments.
+
+    Arguments:
+        record -- raw query fields.
+        validator -- validator shared by queries of one run, new one if None.
+
+    Raises:
+        KeyError -- required field is missing.
+        ValueError -- invalid field value.
+        TypeError -- invalid passengers type.
+        argparse.ArgumentTypeError -- invalid field value.
+
+    Returns:
+        SearchQuery -- valid query.
+    """
+    return (validator or QueryValidator()).to_query(record)
+
+
+def read_queries(
+        stream: IO[str],
+        input_format: str = 'auto',
+        validator: Optional[QueryValidator] = None
+) -> Iterator[Union[SearchQuery, Tuple[Dict[str, Any], Exception]]]:
+    """Read and validate queries one by one as they arrive.
+
+    Arguments:
+        stream -- text stream with queries.
+        input_format -- 'jsonl', 'csv' or 'auto'.
+        validator -- validator of raw fields, new QueryValidator if None.
+
+    Yields:
+        SearchQuery or tuple -- valid query or pair of invalid raw query
+            and error.
+    """
+    validator = validator or QueryValidator()
+
+    for record in iter_records(stream, input_format):
+        try:
+            yield validator.to_query(record)
+        except (KeyError, ValueError, TypeError, argparse.ArgumentTypeError) as error:
+            yield record, error
+
+
+def open_input(path: str) -> ContextManager[IO[str]]:
+    """Open file with queries as context manager, stdin stays open if path is '-'."""
+    if path == '-':
+        return contextlib.nullcontext(sys.stdin)
+
+    return open(path, newline='')
+
+
+def describe_query(query: SearchQuery) -> Dict[str, Any]:
+    """Convert query into JSON serializable dict in input format."""
+    return {
+        'dep_city': query.dep_city,
+        'dest_city': query.dest_city,
+        'dep_date': query.dep_date.strftime('%d.%m.%Y'),
+        'passengers': query.passengers,
+        'return_date': query.return_date.strftime('%d.%m.%Y') if query.return_date else None
+    }
+
+
+def format_result(result: Union[SearchResult, Tuple[Dict[str, Any], Exception]]) -> str:
+    """Convert search result or invalid query into one JSON line.
+
+    Arguments:
+        result -- search result or pair of raw query and validation error.
+
+    Returns:
+        str -- JSON object without trailing newline.
+    """
+    if isinstance(result, SearchResult):
+        line = {'query': describe_query(result.query)}
+
+        if result.error is None:
+            line['flights'] = format_flights(result.flights)
+
+            if result.status is not None:
+                line['status'] = result.status
+        else:
+            line['error'] = str(result.error)
+    else:
+        record, error = result
+        line = {'query': record, 'error': str(error)}
+
+    return json.dumps(line, ensure_ascii=False, default=str)
+
+
+async def run_batch(
+        queries: Iterable[SearchQuery],
+        output: IO[str],
+        concurrency: int = DEFAULT_CONCURRENCY,
+        cache: Optional[QuoteCache] = None,
+        fares: Optional[PassengerFareCache] = None,
+        url: str = script.QUOTES_URL,
+        rate: Optional[float] = None,
+        pool: Optional[ParserPool] = None,
+        session: Optional[Any] = None,
+        writer: Optional[FlightWriter] = None,
+        history: Optional[FareHistory] = None,
+        ordered: bool = False
+) -> int:
+    """Search flights for queries and stream results as they complete.
+
+    Arguments:
+        queries -- valid queries, taken as searches complete.
+        output -- text stream for JSON lines, only failed queries are
+            written to it if writer is passed.
+        concurrency -- max number of simultaneous requests.
+        cache -- cache of downloaded pages.
+        fares -- cache of one passenger fares.
+        url -- address of quote3.aspx.
+        rate -- max number of requests per second, unlimited if None.
+        pool -- parser worker processes, pages are parsed in download
+            threads if None. Not used with fares.
+        session -- session for downloading pages, new Fetcher with pool of
+            concurrency connections if None.
+        writer -- writer of flights of successful queries.
+        history -- fare history recording flights of successful queries.
+        ordered -- write results in order of queries, only with pool.
+
+    Returns:
+        int -- number of failed queries.
+    """
+    failed = 0
+    own_session = session is None
+    session = session or create_session(concurrency, rate)
+
+    if pool is not None and fares is None:
+        results = search_parallel(queries, pool, concurrency, session, url, cache, ordered)
+    else:
+        results = search_many(queries, concurrency, session, url, cache, fares)
+
+    try:
+        async for result in results:
+            failed += result.error is not None
+
+            if history is not None and result.error is None:
+                history.record(result.flights.values(), result.query.passengers)
+
+            if writer is not None and result.error is None:
+                writer.write_flights(result.flights)
+            else:
+                output.write(format_result(result) + '\n')
+                output.flush()
+    finally:
+        if own_session:
+            session.close()
+
+    return failed
+
+
+def parse_arguments(args: List) -> argparse.Namespace:
+    """Handle command line arguments of batch mode.
+
+    Arguments:
+        args -- command line arguments without 'batch' command.
+
+    Returns:
+        argparse.Namespace -- parsed arguments.
+    """
+    argument_parser = argparse.ArgumentParser(
+        prog='main.py batch',
+        description='Search flights for many queries, one JSON result per line',
+        parents=[script.cache_arguments(), concurrency_arguments()]
+    )
+    argument_parser.add_argument(
+        'input', nargs='?', default='-',
+        help='file with JSON lines or CSV queries, stdin if omitted or -'
+    )
+    argument_parser.add_argument(
+        '--format', choices=('auto', 'jsonl', 'csv'), default='auto',
+        help='input format, detected by the first line by default'
+    )
+    argument_parser.add_argument(
+        '--derive-passengers',
+        help='fetch fares for one passenger and multiply them locally',
+        action='store_true'
+    )
+    archive = argument_parser.add_mutually_exclusive_group()
+    archive.add_argument(
+        '--record', metavar='ARCHIVE', default=None,
+        help='download flights and append responses to zip archive'
+    )
+    archive.add_argument(
+        '--replay', metavar='ARCHIVE', default=None,
+        help='read responses from zip archive instead of network'
+    )
+    argument_parser.add_argument(
+        '--parse-workers', type=int, default=None, metavar='N',
+        help='parse pages in N worker processes, 0 for number of CPUs'
+    )
+    argument_parser.add_argument(
+        '--parse-chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, metavar='N',
+        help='max number of pages sent to parse worker at once'
+    )
+    argument_parser.add_argument(
+        '--ordered', help='with --parse-workers write results in order of queries',
+        action='store_true'
+    )
+    argument_parser.add_argument(
+        '--history', help='append found fares to fare history, see main.py history',
+        action='store_true'
+    )
+    argument_parser.add_argument(
+        '--output-format', choices=('results', *WRITERS), default='results',
+        help='JSON line per query by default, otherwise flights are written '
+             'in the format and failed queries to stderr'
+    )
+
+    return argument_parser.parse_args(args)
+
+
+def main(arguments: List) -> int:
+    """Run batch mode.
+
+    Arguments:
+        arguments -- command line arguments without 'batch' command.
+
+    Returns:
+        int -- exit status, 1 if any query failed.
+    """
+    args = parse_arguments(arguments)
+    # Replayed searches were recorded when their dates were ahead
+    validator = QueryValidator(allow_past=bool(args.replay))
+    writer = None
+    output = sys.stdout
+    invalid = 0
+
+    if args.output_format != 'results':
+        writer = open_writer(args.output_format, sys.stdout)
+        output = sys.stderr
+
+    def valid_queries(stream: IO[str]) -> Iterator[SearchQuery]:
+        nonlocal invalid
+
+        for item in read_queries(stream, args.format, validator):
+            if isinstance(item, SearchQuery):
+                yield item
+            else:
+                invalid += 1
+                output.write(format_result(item) + '\n')
+
+    archived = args.record or args.replay
+    cache = None if args.no_cache or archived else QuoteCache(ttl=args.cache_ttl)
+    fares = PassengerFareCache() if args.derive_passengers else None
+    history = FareHistory() if args.history else None
+    pool = None
+
+    if args.parse_workers is not None and fares is None:
+        pool = ParserPool(args.parse_workers or None, args.parse_chunk_size)
+
+    try:
+        with open_input(args.input) as stream, \
+                create_session(args.concurrency, args.rate) as fetcher, \
+                archive_session(args.record, args.replay, fetcher) as session:
+            failed = asyncio.run(run_batch(
+                valid_queries(stream), output, args.concurrency, cache, fares,
+                pool=pool, session=session, writer=writer, history=history,
+                ordered=args.ordered
+            ))
+    finally:
+        if writer is not None:
+            writer.close()
+
+        if history is not None:
+            history.close()
+
+        if cache is not None:
+            cache.close()
+
+        if pool is not None:
+            pool.close()
+
+    return int(bool(failed or invalid))
@@ -0,0 +1,237 @@
+import json
+import os
+import threading
+import time
+from datetime import date
+from typing import Dict, Any, NamedTuple, Optional
+from src.flight import Flight
+
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    'FLIGHTS_INFO_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'flights_info', 'quotes.sqlite3')
+)
+# Seconds
+DEFAULT_TTL = 15 * 60
+DEFAULT_MAX_ENTRIES = 1000
+
+
+class ParsedPage(NamedTuple):
+    """Flights extracted from page with digest and HTTP validators of the page."""
+
+    digest: str
+    flights: Dict[str, Flight]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class QuoteCache:
+    """SQLite cache of quote3.aspx pages with TTL and LRU eviction.
+
+    Pages are keyed by normalized url parameters, so identical searches
+    share one entry regardless of parameters order or types. Every page
+    keeps expiration time of the instance which stored it, so processes
+    with different TTL sharing one file do not expire pages of each other.
+    """
+
+    def __init__(
+            self,
+            path: str = DEFAULT_CACHE_PATH,
+            ttl: float = DEFAULT_TTL,
+            max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        """Open or create cache database.
+
+        Arguments:
+            path -- database file, ':memory:' for cache without file.
+            ttl -- seconds after which pages stored by this instance expire,
+                older pages are not returned by get either.
+            max_entries -- max number of pages, least recently used pages
+                are evicted first.
+        """
+        # sqlite3 takes noticeable time to import, load it only for caching
+        import sqlite3
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript('''
+            CREATE TABLE IF NOT EXISTS quotes (
+                key TEXT PRIMARY KEY,
+                page TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                expires REAL NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS quotes_accessed ON quotes (accessed);
+            CREATE TABLE IF NOT EXISTS parsed (
+                key TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                flights TEXT NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS parsed_accessed ON parsed (accessed);
+        ''')
+        columns = [row[1] for row in self._connection.execute('PRAGMA table_info(quotes)')]
+
+        if 'expires' not in columns:
+            # Pages of files created before pages had own expiration time expire at once
+            self._connection.execute(
+                'ALTER TABLE quotes ADD COLUMN expires REAL NOT NULL DEFAULT 0'
+            )
+
+    @staticmethod
+    def make_key(parameters: Dict[str, Any]) -> str:
+        """Normalize url parameters into cache key.
+
+        Arguments:
+            parameters -- url parameters created by create_url_parameters.
+
+        Returns:
+            str -- cache key.
+        """
+        normalized = {
+            name: str(value).upper() if name.startswith('aptcode') else str(value)
+            for name, value in parameters.items()
+            if value is not None
+        }
+
+        return json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+
+    def get(self, parameters: Dict[str, Any]) -> Optional[str]:
+        """Return cached page or None if it is missing or expired.
+
+        Arguments:
+            parameters -- url parameters.
+
+        Returns:
+            str -- cached HTML page.
+        """
+        key = self.make_key(parameters)
+        now = time.time()
+
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                'SELECT page FROM quotes WHERE key = ? AND expires > ? AND created > ?',
+                (key, now, now - self.ttl)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+
+                return None
+
+            self.hits += 1
+            self._connection.execute(
+                'UPDATE quotes SET accessed = ? WHERE key = ?', (now, key)
+            )
+
+        return row[0]
+
+    def put(self, parameters: Dict[str, Any], page: str) -> None:
+        """Store page and evict least recently used pages above the limit.
+
+        Arguments:
+            parameters -- url parameters.
+            page -- HTML page.
+        """
+        now = time.time()
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                '''INSERT OR REPLACE INTO quotes (key, page, created, accessed, expires)
+                VALUES (?, ?, ?, ?, ?)''',
+                (self.make_key(parameters), page, now, now, now + self.ttl)
+            )
+            # Pages of other instances are removed by their own expiration time
+            self._connection.execute('DELETE FROM quotes WHERE expires <= ?', (now,))
+            self._connection.execute(
+                '''DELETE FROM quotes WHERE key IN (
+                    SELECT key FROM quotes ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )''',
+                (self.max_entries,)
+            )
+
+    def get_parsed(self, parameters: Dict[str, Any]) -> Optional[ParsedPage]:
+        """Return flights parsed from the latest page, they do not expire.
+
+        Arguments:
+            parameters -- url parameters.
+
+        Returns:
+            ParsedPage -- flights, page digest and validators.
+        """
+        key = self.make_key(parameters)
+
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                'SELECT digest, flights, etag, last_modified FROM parsed WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            self._connection.execute(
+                'UPDATE parsed SET accessed = ? WHERE key = ?', (time.time(), key)
+            )
+
+        digest, flights, etag, last_modified = row
+        flights = {
+            direction: Flight(date.fromisoformat(flight[0]), *flight[1:])
+            for direction, flight in json.loads(flights).items()
+        }
+
+        return ParsedPage(digest, flights, etag, last_modified)
+
+    def put_parsed(self, parameters: Dict[str, Any], parsed: ParsedPage) -> None:
+        """Store flights parsed from page, evict least recently used above the limit.
+
+        Arguments:
+            parameters -- url parameters.
+            parsed -- flights, page digest and validators.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?, ?, ?)',
+                (
+                    self.make_key(parameters), parsed.digest, parsed.etag,
+                    parsed.last_modified, json.dumps(parsed.flights, default=str), time.time()
+                )
+            )
+            self._connection.execute(
+                '''DELETE FROM parsed WHERE key IN (
+                    SELECT key FROM parsed ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )''',
+                (self.max_entries,)
+            )
+
+    def purge(self) -> None:
+        """Remove all pages and parsed flights."""
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM quotes')
+            self._connection.execute('DELETE FROM parsed')
+
+    def stats(self) -> Dict[str, int]:
+        """Return number of hits, misses and stored pages."""
+        with self._lock:
+            entries = self._connection.execute('SELECT COUNT(*) FROM quotes').fetchone()[0]
+
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+    def close(self) -> None:
+        """Close database connection."""
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
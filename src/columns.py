@@ -0,0 +1,371 @@
+import csv
+from array import array
+from datetime import date, timedelta
+from itertools import compress
+from typing import Dict, IO, Iterable, List, Optional, Sequence
+from src.flight import Flight
+from src.search import SearchResult
+from src.times import format_minutes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+EPOCH = date(1970, 1, 1)
+# Column name, array typecode and numpy dtype
+COLUMNS = (
+    ('date', 'i', 'int32'),
+    ('departure', 'h', 'int16'),
+    ('arrival', 'h', 'int16'),
+    ('duration', 'h', 'int16'),
+    ('dep_city', 'I', 'uint32'),
+    ('dest_city', 'I', 'uint32'),
+    ('price', 'q', 'int64'),
+    ('extra_info', 'I', 'uint32'),
+)
+DTYPES = {name: dtype for name, _, dtype in COLUMNS}
+# Columns storing indexes of categories instead of values
+CATEGORIES = {'dep_city': 'city', 'dest_city': 'city', 'extra_info': 'extra_info'}
+
+
+class FareTable:
+    """Flights stored column by column in typed arrays.
+
+    Dates are days since 1970-01-01, times and durations are minutes,
+    prices are cents and city codes and additional information are indexes
+    of categories. Columns are numpy views when numpy is installed.
+
+    Views and Arrow buffers keep memory of arrays exported, and exported
+    arrays can not grow, so table is frozen once its columns are read by
+    indexing or to_arrow. Adding flights to frozen table raises ValueError.
+    """
+
+    def __init__(self):
+        self.frozen = False
+        self._columns = {name: array(typecode) for name, typecode, _ in COLUMNS}
+        self._categories: Dict[str, List[str]] = {'city': [], 'extra_info': []}
+        self._codes: Dict[str, Dict[str, int]] = {'city': {}, 'extra_info': {}}
+
+    @classmethod
+    def from_results(cls, results: Iterable[SearchResult]) -> 'FareTable':
+        """Collect flights of all successful search results."""
+        table = cls()
+
+        for result in results:
+            if result.flights:
+                table.extend(result.flights.values())
+
+        return table
+
+    def _encode(self, category: str, value: str) -> int:
+        codes = self._codes[category]
+        code = codes.get(value)
+
+        if code is None:
+            code = codes[value] = len(codes)
+            self._categories[category].append(value)
+
+        return code
+
+    def append(self, flight: Flight) -> None:
+        """Add one flight.
+
+        Raises:
+            ValueError -- table is frozen.
+        """
+        if self.frozen:
+            raise ValueError('Table is frozen, its columns were read')
+
+        columns = self._columns
+        columns['date'].append((flight.date - EPOCH).days)
+        columns['departure'].append(flight.departure)
+        columns['arrival'].append(flight.arrival)
+        columns['duration'].append(flight.duration)
+        columns['dep_city'].append(self._encode('city', flight.dep_city))
+        columns['dest_city'].append(self._encode('city', flight.dest_city))
+        columns['price'].append(flight.price)
+        columns['extra_info'].append(self._encode('extra_info', flight.extra_info))
+
+    def extend(self, flights: Iterable[Flight]) -> None:
+        """Add many flights."""
+        for flight in flights:
+            self.append(flight)
+
+    def __len__(self) -> int:
+        return len(self._columns['price'])
+
+    def __getitem__(self, name: str):
+        """Return column and freeze table.
+
+        Column is numpy array sharing memory with storage if numpy is
+        installed, the array itself otherwise.
+        """
+        self.frozen = True
+
+        return self._view(name)
+
+    def _view(self, name: str):
+        """Return column without freezing table, view must not outlive the call."""
+        column = self._columns[name]
+
+        if numpy is not None:
+            return numpy.frombuffer(column, dtype=DTYPES[name])
+
+        return column
+
+    def categories(self, name: str) -> List[str]:
+        """Return values of categorical column, index of value is its code."""
+        return self._categories[CATEGORIES[name]]
+
+    def decode(self, name: str) -> List[str]:
+        """Return values of categorical column."""
+        categories = self.categories(name)
+
+        return [categories[code] for code in self._columns[name]]
+
+    def code(self, name: str, value: str) -> Optional[int]:
+        """Return code of value in categorical column, None if it never occurs."""
+        return self._codes[CATEGORIES[name]].get(value)
+
+    def where(
+            self,
+            dep_city: Optional[str] = None,
+            dest_city: Optional[str] = None,
+            start: Optional[date] = None,
+            end: Optional[date] = None,
+            departs_after: Optional[int] = None,
+            departs_before: Optional[int] = None,
+            max_price: Optional[int] = None
+    ) -> Sequence[bool]:
+        """Build mask of flights matching all passed conditions.
+
+        Arguments:
+            dep_city -- departure city.
+            dest_city -- destination city.
+            start -- earliest flight date.
+            end -- latest flight date.
+            departs_after -- earliest departure in minutes since midnight.
+            departs_before -- latest departure in minutes since midnight.
+            max_price -- max price in cents.
+
+        Returns:
+            numpy.ndarray or list -- True for matching flights.
+        """
+        conditions = []
+
+        for name, city in (('dep_city', dep_city), ('dest_city', dest_city)):
+            if city is not None:
+                code = self.code(name, city)
+                conditions.append((name, code, code) if code is not None else (name, 1, 0))
+
+        for name, low, high in (
+                ('date', start and (start - EPOCH).days, end and (end - EPOCH).days),
+                ('departure', departs_after, departs_before),
+                ('price', None, max_price)
+        ):
+            if low is not None or high is not None:
+                conditions.append((name, low, high))
+
+        if numpy is not None:
+            mask = numpy.ones(len(self), dtype=bool)
+
+            for name, low, high in conditions:
+                column = self._view(name)
+
+                if low is not None:
+                    mask &= column >= low
+
+                if high is not None:
+                    mask &= column <= high
+
+            return mask
+
+        mask = [True] * len(self)
+
+        for name, low, high in conditions:
+            low = float('-inf') if low is None else low
+            high = float('inf') if high is None else high
+            mask = [
+                matches and low <= value <= high
+                for matches, value in zip(mask, self._columns[name])
+            ]
+
+        return mask
+
+    def select(self, mask: Sequence[bool]) -> 'FareTable':
+        """Return table with flights where mask is True and copy of categories."""
+        table = FareTable()
+        table._categories = {name: list(values) for name, values in self._categories.items()}
+        table._codes = {name: dict(codes) for name, codes in self._codes.items()}
+
+        if numpy is not None:
+            mask = numpy.asarray(mask, dtype=bool)
+
+        for name, _, _ in COLUMNS:
+            if numpy is not None:
+                table._columns[name].frombytes(self._view(name)[mask].tobytes())
+            else:
+                table._columns[name].extend(compress(self._columns[name], mask))
+
+        return table
+
+    def filter(self, **conditions) -> 'FareTable':
+        """Return table with flights matching conditions of where."""
+        return self.select(self.where(**conditions))
+
+    def fares_by_route_date(self) -> Dict[str, list]:
+        """Aggregate prices per route and date.
+
+        Returns:
+            dict -- columns dep_city, dest_city, date, min_price, mean_price
+                and count, routes are in order of first appearance of their
+                cities and dates of every route are sorted.
+        """
+        if numpy is not None and len(self):
+            dep, dest, days, prices = (
+                self._view(name) for name in ('dep_city', 'dest_city', 'date', 'price')
+            )
+            order = numpy.lexsort((days, dest, dep))
+            dep, dest, days, prices = dep[order], dest[order], days[order], prices[order]
+            changed = (dep[1:] != dep[:-1]) | (dest[1:] != dest[:-1]) | (days[1:] != days[:-1])
+            starts = numpy.concatenate(([0], numpy.flatnonzero(changed) + 1))
+            counts = numpy.diff(numpy.append(starts, len(prices)))
+            groups = zip(
+                dep[starts].tolist(), dest[starts].tolist(), days[starts].tolist(),
+                numpy.minimum.reduceat(prices, starts).tolist(),
+                (numpy.add.reduceat(prices, starts) / counts).tolist(),
+                counts.tolist()
+            )
+        else:
+            totals = {}
+            columns = self._columns
+
+            for key, price in zip(
+                    zip(columns['dep_city'], columns['dest_city'], columns['date']),
+                    columns['price']
+            ):
+                total = totals.get(key)
+
+                if total is None:
+                    totals[key] = [price, price, 1]
+                else:
+                    total[0] = min(total[0], price)
+                    total[1] += price
+                    total[2] += 1
+
+            groups = (
+                (*key, low, total / number, number)
+                for key, (low, total, number) in sorted(totals.items())
+            )
+
+        cities = self._categories['city']
+        aggregated = {
+            name: []
+            for name in ('dep_city', 'dest_city', 'date', 'min_price', 'mean_price', 'count')
+        }
+
+        for dep_city, dest_city, days, low, mean, number in groups:
+            aggregated['dep_city'].append(cities[dep_city])
+            aggregated['dest_city'].append(cities[dest_city])
+            aggregated['date'].append(EPOCH + timedelta(days=days))
+            aggregated['min_price'].append(low)
+            aggregated['mean_price'].append(mean)
+            aggregated['count'].append(number)
+
+        return aggregated
+
+    def to_numpy(self):
+        """Return numpy structured array with decoded categories.
+
+        Raises:
+            ImportError -- numpy is not installed.
+        """
+        if numpy is None:
+            raise ImportError('numpy is required for structured arrays')
+
+        records = numpy.empty(len(self), dtype=[
+            ('date', 'datetime64[D]'),
+            *((name, dtype) for name, _, dtype in COLUMNS[1:4]),
+            ('dep_city', 'U3'),
+            ('dest_city', 'U3'),
+            ('price', 'int64'),
+            ('extra_info', object)
+        ])
+        records['date'] = self._view('date').astype('datetime64[D]')
+
+        for name in ('departure', 'arrival', 'duration', 'price'):
+            records[name] = self._view(name)
+
+        for name in CATEGORIES:
+            records[name] = numpy.array(self.categories(name), dtype=object)[self._view(name)]\
+                if len(self) else []
+
+        return records
+
+    def write_csv(self, stream: IO[str]) -> None:
+        """Write flights as CSV with ISO dates, hh:mm times and prices in cents."""
+        columns = self._columns
+        cities = self._categories['city']
+        extra_info = self._categories['extra_info']
+        writer = csv.writer(stream)
+        writer.writerow([name for name, _, _ in COLUMNS])
+        writer.writerows(
+            (
+                (EPOCH + timedelta(days=days)).isoformat(),
+                format_minutes(departure), format_minutes(arrival), duration,
+                cities[dep_city], cities[dest_city], price, extra_info[extra]
+            )
+            for days, departure, arrival, duration, dep_city, dest_city, price, extra in zip(
+                *(columns[name] for name, _, _ in COLUMNS)
+            )
+        )
+
+    def to_arrow(self):
+        """Return pyarrow.Table sharing memory with columns and freeze table.
+
+        Categories are dictionaries.
+
+        Raises:
+            ImportError -- pyarrow is not installed.
+        """
+        import pyarrow
+
+        self.frozen = True
+
+        def column(name: str, arrow_type):
+            return pyarrow.Array.from_buffers(
+                arrow_type, len(self), [None, pyarrow.py_buffer(self._columns[name])]
+            )
+
+        arrays = [
+            column('date', pyarrow.date32()),
+            column('departure', pyarrow.int16()),
+            column('arrival', pyarrow.int16()),
+            column('duration', pyarrow.int16()),
+        ]
+
+        for name in ('dep_city', 'dest_city'):
+            arrays.append(pyarrow.DictionaryArray.from_arrays(
+                column(name, pyarrow.uint32()),
+                pyarrow.array(self.categories(name), pyarrow.string())
+            ))
+
+        arrays.append(column('price', pyarrow.int64()))
+        arrays.append(pyarrow.DictionaryArray.from_arrays(
+            column('extra_info', pyarrow.uint32()),
+            pyarrow.array(self.categories('extra_info'), pyarrow.string())
+        ))
+
+        return pyarrow.Table.from_arrays(arrays, names=[name for name, _, _ in COLUMNS])
+
+    def write_parquet(self, path: str) -> None:
+        """Write flights to Parquet file.
+
+        Raises:
+            ImportError -- pyarrow is not installed.
+        """
+        import pyarrow.parquet
+
+        pyarrow.parquet.write_table(self.to_arrow(), path)
@@ -0,0 +1,409 @@
+import argparse
+import heapq
+import sys
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import src.script as script
+from src.cache import QuoteCache
+from src.fares import parse_date
+from src.fetch import Fetcher
+from src.flight import Flight
+from src.output import TableWriter
+from src.routes import RouteIndex, load_route_index
+from src.search import (
+    DEFAULT_CONCURRENCY, SearchQuery, SearchResult, concurrency_arguments, create_session, search
+)
+from src.times import MINUTES_PER_DAY
+
+
+# Minutes between arrival and departure of the next leg at the same airport
+DEFAULT_MIN_CONNECTION = 60
+# Days after the first day of trip in which the last leg must arrive
+DEFAULT_MAX_DAYS = 14
+
+# Departure city, destination city and date of leg
+LegKey = Tuple[str, str, date]
+LegFetcher = Callable[[List[LegKey]], Dict[LegKey, Optional[Flight]]]
+
+
+def departure_time(flight: Flight) -> int:
+    """Return departure as minutes since 0001-01-01."""
+    return flight.date.toordinal() * MINUTES_PER_DAY + flight.departure
+
+
+def arrival_time(flight: Flight) -> int:
+    """Return arrival as minutes since 0001-01-01, overnight flights arrive next day."""
+    return departure_time(flight) + flight.duration
+
+
+def day_of(minutes: int) -> date:
+    """Return date of minutes since 0001-01-01."""
+    return date.fromordinal(minutes // MINUTES_PER_DAY)
+
+
+class Itinerary(NamedTuple):
+    """Legs of a trip in order of flying."""
+
+    legs: Tuple[Flight, ...]
+
+    @property
+    def price(self) -> int:
+        return sum(leg.price for leg in self.legs)
+
+    @property
+    def departure(self) -> int:
+        return departure_time(self.legs[0])
+
+    @property
+    def arrival(self) -> int:
+        return arrival_time(self.legs[-1])
+
+
+class LegGraph:
+    """Time-expanded graph of schedule, its nodes are legs.
+
+    Destinations of every city and sorted dates of every route are indexed
+    once, so connections from airport are found by bisection. Flights of
+    legs are fetched in batches on first use and kept for later searches.
+    """
+
+    def __init__(self, fetch_legs: LegFetcher, routes: Optional[RouteIndex] = None):
+        """Index schedule.
+
+        Arguments:
+            fetch_legs -- returns flight or None for every requested leg.
+            routes -- schedule, default one if None.
+        """
+        self.routes = routes or load_route_index()
+        self.fetch_legs = fetch_legs
+        self.fetched = 0
+        self._legs: Dict[LegKey, Optional[Flight]] = {}
+        self._destinations: Dict[str, List[str]] = {}
+
+        for dep_city, dest_city in self.routes.routes():
+            self._destinations.setdefault(dep_city, []).append(dest_city)
+
+    def destinations(self, city: str) -> List[str]:
+        """Return cities with direct route from city."""
+        return self._destinations.get(city, [])
+
+    def departures(self, city: str, first: date, last: date) -> Dict[str, List[date]]:
+        """Return flight dates from first to last inclusive of every route from city."""
+        return {
+            dest_city: self.routes.dates_between(city, dest_city, first, last)
+            for dest_city in self.destinations(city)
+        }
+
+    def load(self, keys: Iterable[LegKey]) -> None:
+        """Fetch flights of legs which are not loaded yet in one batch."""
+        missing = [key for key in dict.fromkeys(keys) if key not in self._legs]
+
+        if missing:
+            self._legs.update(dict.fromkeys(missing))
+            self._legs.update(self.fetch_legs(missing))
+            self.fetched += len(missing)
+
+    def leg(self, key: LegKey) -> Optional[Flight]:
+        """Return flight of leg, it must be loaded."""
+        return self._legs[key]
+
+
+def _itinerary(previous: Dict[str, Flight], dep_city: str, dest_city: str) -> Itinerary:
+    legs = []
+    city = dest_city
+
+    while city != dep_city or not legs:
+        legs.append(previous[city])
+        city = legs[-1].dep_city
+
+    return Itinerary(tuple(reversed(legs)))
+
+
+def earliest_arrival(
+        graph: LegGraph,
+        dep_city: str,
+        dest_city: str,
+        start: date,
+        end: Optional[date] = None,
+        min_connection: int = DEFAULT_MIN_CONNECTION
+) -> Optional[Itinerary]:
+    """Find itinerary arriving to destination as early as possible.
+
+    Dijkstra search over airports labelled by arrival time. Dates of every
+    route are scanned in order, and scanning stops once the next date
+    starts after the best known arrival, so only legs which can improve
+    an arrival are fetched.
+
+    Arguments:
+        graph -- schedule.
+        dep_city -- departure city.
+        dest_city -- destination city.
+        start -- earliest date of the first leg.
+        end -- latest arrival date, DEFAULT_MAX_DAYS after start if None.
+        min_connection -- min minutes between legs.
+
+    Returns:
+        Itinerary -- legs or None if destination is not reachable.
+    """
+    end = end or start + timedelta(days=DEFAULT_MAX_DAYS)
+    best = {dep_city: start.toordinal() * MINUTES_PER_DAY - min_connection}
+    previous: Dict[str, Flight] = {}
+    heap = [(best[dep_city], dep_city)]
+    done = set()
+
+    while heap:
+        arrival, city = heapq.heappop(heap)
+
+        if city in done:
+            continue
+
+        if city == dest_city and previous:
+            return _itinerary(previous, dep_city, dest_city)
+
+        done.add(city)
+        ready = arrival + min_connection
+        # Position of the next date to check on every route from city
+        cursors = {
+            next_city: [dates, 0]
+            for next_city, dates in graph.departures(city, day_of(ready), end).items()
+            if dates and next_city not in done
+        }
+
+        while cursors:
+            graph.load((city, next_city, dates[index]) for next_city, (dates, index) in cursors.items())
+
+            for next_city, cursor in list(cursors.items()):
+                dates, index = cursor
+                flight = graph.leg((city, next_city, dates[index]))
+
+                if flight is not None and departure_time(flight) >= ready\
+                        and day_of(arrival_time(flight)) <= end\
+                        and arrival_time(flight) < best.get(next_city, sys.maxsize):
+                    best[next_city] = arrival_time(flight)
+                    previous[next_city] = flight
+                    heapq.heappush(heap, (best[next_city], next_city))
+
+                cursor[1] = index = index + 1
+
+                if index == len(dates)\
+                        or dates[index].toordinal() * MINUTES_PER_DAY >= best.get(next_city, sys.maxsize):
+                    del cursors[next_city]
+
+    return None
+
+
+def cheapest_itinerary(
+        graph: LegGraph,
+        dep_city: str,
+        dest_city: str,
+        start: date,
+        end: Optional[date] = None,
+        min_connection: int = DEFAULT_MIN_CONNECTION,
+        max_layover: Optional[int] = None
+) -> Optional[Itinerary]:
+    """Find the cheapest itinerary, the earliest arriving one of equal price.
+
+    Dijkstra search over legs labelled by total price. Label is dropped
+    if an airport was already left after a cheaper arrival which was not
+    later, on the same day if layovers are limited, and legs from an
+    airport are fetched only when it is left.
+
+    Arguments:
+        graph -- schedule.
+        dep_city -- departure city.
+        dest_city -- destination city.
+        start -- earliest date of the first leg.
+        end -- latest arrival date, DEFAULT_MAX_DAYS after start if None.
+        min_connection -- min minutes between legs.
+        max_layover -- max days between arrival day and departure of the
+            next leg, unlimited if None.
+
+    Returns:
+        Itinerary -- legs or None if destination is not reachable.
+    """
+    end = end or start + timedelta(days=DEFAULT_MAX_DAYS)
+    # Earliest arrival of labels expanded at airport, or at airport on day
+    # if layovers are limited, they are not more expensive
+    expanded: Dict[Any, int] = {}
+    heap = []
+    pushed = 0
+
+    def expand(city: str, ready: int, last: date, path: Optional[tuple]) -> None:
+        nonlocal pushed
+        keys = [
+            (city, next_city, flight_date)
+            for next_city, dates in graph.departures(city, day_of(ready), last).items()
+            for flight_date in dates
+        ]
+        graph.load(keys)
+
+        for key in keys:
+            flight = graph.leg(key)
+
+            if flight is not None and departure_time(flight) >= ready\
+                    and day_of(arrival_time(flight)) <= end:
+                price = flight.price + (path[0] if path else 0)
+                heapq.heappush(heap, (price, arrival_time(flight), pushed, (price, flight, path)))
+                pushed += 1
+
+    # Returning to departure city is never cheaper nor earlier
+    departure = start.toordinal() * MINUTES_PER_DAY
+    expanded[dep_city] = expanded[dep_city, start] = departure
+    expand(dep_city, departure, end, None)
+
+    while heap:
+        _, arrival, _, path = heapq.heappop(heap)
+        city = path[1].dest_city
+
+        if city == dest_city:
+            legs = []
+
+            while path:
+                legs.append(path[1])
+                path = path[2]
+
+            return Itinerary(tuple(reversed(legs)))
+
+        key = city if max_layover is None else (city, day_of(arrival))
+
+        if arrival >= expanded.get(key, sys.maxsize):
+            continue
+
+        expanded[key] = arrival
+        last = end if max_layover is None else min(end, day_of(arrival) + timedelta(days=max_layover))
+        expand(city, arrival + min_connection, last, path)
+
+    return None
+
+
+class SearchLegFetcher:
+    """Fetch flights of legs concurrently with search, failed searches are kept."""
+
+    def __init__(
+            self,
+            passengers: int,
+            concurrency: int = DEFAULT_CONCURRENCY,
+            session: Optional[Fetcher] = None,
+            url: str = script.QUOTES_URL,
+            cache: Optional[QuoteCache] = None
+    ):
+        self.passengers = passengers
+        self.concurrency = concurrency
+        self.session = session
+        self.url = url
+        self.cache = cache
+        self.errors: List[SearchResult] = []
+
+    def __call__(self, keys: List[LegKey]) -> Dict[LegKey, Optional[Flight]]:
+        queries = [
+            SearchQuery(dep_city, dest_city, datetime.combine(flight_date, datetime.min.time()), self.passengers)
+            for dep_city, dest_city, flight_date in keys
+        ]
+        legs = {}
+
+        for result in search(queries, self.concurrency, self.session, self.url, self.cache):
+            query = result.query
+            flight = (result.flights or {}).get('Outbound')
+            legs[query.dep_city, query.dest_city, query.dep_date.date()] = flight
+
+            if flight is None:
+                self.errors.append(result)
+
+        return legs
+
+
+def print_itinerary(itinerary: Itinerary) -> None:
+    """Show table of legs with total cost."""
+    with TableWriter(sys.stdout) as writer:
+        writer.write_flights({
+            f'Leg {number}': flight for number, flight in enumerate(itinerary.legs, 1)
+        })
+
+
+def parse_arguments(args: List) -> argparse.Namespace:
+    """Handle command line arguments of connection search.
+
+    Arguments:
+        args -- command line arguments without 'connect' command.
+
+    Returns:
+        argparse.Namespace -- parsed arguments.
+    """
+    argument_parser = argparse.ArgumentParser(
+        prog='main.py connect',
+        description='Earliest or cheapest trip with connecting flights',
+        parents=[script.cache_arguments(), concurrency_arguments()]
+    )
+    argument_parser.add_argument(
+        'dep_city', help='departure city IATA code', type=script.validate_city_code
+    )
+    argument_parser.add_argument(
+        'dest_city', help='destination city IATA code', type=script.validate_city_code
+    )
+    argument_parser.add_argument('dep_date', help='earliest departure date', type=parse_date)
+    argument_parser.add_argument(
+        'passengers', help='total number of passengers', type=script.validate_passengers
+    )
+    argument_parser.add_argument(
+        '--by', dest='end', type=parse_date, default=None,
+        help=f'latest arrival date, {DEFAULT_MAX_DAYS} days after departure date by default'
+    )
+    argument_parser.add_argument(
+        '--cheapest', action='store_true', help='find the cheapest trip instead of the earliest'
+    )
+    argument_parser.add_argument(
+        '--min-connection', type=int, default=DEFAULT_MIN_CONNECTION,
+        help='min minutes between connecting flights'
+    )
+    argument_parser.add_argument(
+        '--max-layover', type=int, default=None,
+        help='max days between connecting flights of the cheapest trip, unlimited by default'
+    )
+
+    return argument_parser.parse_args(args)
+
+
+def main(arguments: List) -> int:
+    """Search and print trip with connecting flights.
+
+    Arguments:
+        arguments -- command line arguments without 'connect' command.
+
+    Returns:
+        int -- exit status, 1 if no trip was found.
+    """
+    args = parse_arguments(arguments)
+    cache = None if args.no_cache else QuoteCache(ttl=args.cache_ttl)
+
+    try:
+        with create_session(args.concurrency, args.rate) as session:
+            fetch_legs = SearchLegFetcher(args.passengers, args.concurrency, session, cache=cache)
+            graph = LegGraph(fetch_legs)
+
+            if args.cheapest:
+                itinerary = cheapest_itinerary(
+                    graph, args.dep_city, args.dest_city, args.dep_date, args.end,
+                    args.min_connection, args.max_layover
+                )
+            else:
+                itinerary = earliest_arrival(
+                    graph, args.dep_city, args.dest_city, args.dep_date, args.end,
+                    args.min_connection
+                )
+    finally:
+        if cache is not None:
+            cache.close()
+
+    for result in fetch_legs.errors:
+        if result.error is not None:
+            print(f'{result.query.dep_city}-{result.query.dest_city} '
+                  f'{result.query.dep_date:%d.%m.%Y}: {result.error}', file=sys.stderr)
+
+    if itinerary is None:
+        print('Trip for chosen dates not found.')
+
+        return 1
+
+    print_itinerary(itinerary)
+
+    return 0
@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import heapq
+import sys
+from bisect import bisect_left
+from collections import deque
+from datetime import date, datetime, timedelta
+from typing import Iterator, List, NamedTuple, Optional
+import src.script as script
+from src.cache import QuoteCache
+from src.flight import Flight, format_flight, format_price
+from src.routes import RouteIndex, load_route_index
+from src.search import (
+    DEFAULT_CONCURRENCY, SearchQuery, SearchResult, concurrency_arguments, create_session, search_many
+)
+
+
+class RoundTrip(NamedTuple):
+    """Outbound and inbound flights of one trip."""
+
+    outbound: Flight
+    inbound: Flight
+
+    @property
+    def price(self) -> int:
+        return self.outbound.price + self.inbound.price
+
+
+class FareCalendar(NamedTuple):
+    """One-way fares of both directions of a route and failed fetches."""
+
+    outbound: List[Flight]
+    inbound: List[Flight]
+    errors: List[SearchResult]
+
+
+def calendar_queries(
+        dep_city: str,
+        dest_city: str,
+        passengers: int,
+        start: date = date.min,
+        end: date = date.max,
+        routes: Optional[RouteIndex] = None
+) -> List[SearchQuery]:
+    """Create one-way query for every flight date of both directions.
+
+    Arguments:
+        dep_city -- departure city.
+        dest_city -- destination city.
+        passengers -- total number of passengers.
+        start -- earliest flight date.
+        end -- latest flight date.
+        routes -- schedule, default one if None.
+
+    Returns:
+        list -- outbound queries followed by inbound queries.
+    """
+    routes = routes or load_route_index()
+
+    return [
+        SearchQuery(leg_dep, leg_dest, datetime.combine(flight_date, datetime.min.time()), passengers)
+        for leg_dep, leg_dest in ((dep_city, dest_city), (dest_city, dep_city))
+        for flight_date in routes.dates_between(leg_dep, leg_dest, start, end)
+    ]
+
+
+async def fetch_calendar(
+        dep_city: str,
+        dest_city: str,
+        passengers: int,
+        start: date = date.min,
+        end: date = date.max,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        cache: Optional[QuoteCache] = None,
+        url: str = script.QUOTES_URL,
+        routes: Optional[RouteIndex] = None,
+        rate: Optional[float] = None
+) -> FareCalendar:
+    """Fetch every one-way leg of route once per date concurrently.
+
+    Arguments:
+        dep_city -- departure city.
+        dest_city -- destination city.
+        passengers -- total number of passengers.
+        start -- earliest flight date.
+        end -- latest flight date.
+        concurrency -- max number of simultaneous requests.
+        cache -- cache of downloaded pages.
+        url -- address of quote3.aspx.
+        routes -- schedule, default one if None.
+        rate -- max number of requests per second, unlimited if None.
+
+    Returns:
+        FareCalendar -- outbound and inbound flights sorted by date.
+    """
+    calendar = FareCalendar([], [], [])
+    queries = calendar_queries(dep_city, dest_city, passengers, start, end, routes)
+
+    with create_session(concurrency, rate) as session:
+        async for result in search_many(queries, concurrency, session, url, cache):
+            flight = (result.flights or {}).get('Outbound')
+
+            if flight is None:
+                calendar.errors.append(result)
+            elif result.query.dep_city == dep_city:
+                calendar.outbound.append(flight)
+            else:
+                calendar.inbound.append(flight)
+
+    calendar.outbound.sort()
+    calendar.inbound.sort()
+
+    return calendar
+
+
+def cheapest_round_trips(
+        outbound: List[Flight],
+        inbound: List[Flight],
+        min_stay: int = 0,
+        max_stay: Optional[int] = None
+) -> List[RoundTrip]:
+    """Find the cheapest inbound flight for every outbound flight.
+
+    Both lists are swept once by date with a sliding window minimum
+    of inbound prices, so it takes O(n log n) for sorting plus O(n).
+
+    Arguments:
+        outbound -- outbound flights.
+        inbound -- inbound flights.
+        min_stay -- min number of days between flights.
+        max_stay -- max number of days between flights, unlimited if None.
+
+    Returns:
+        list -- round trips ranked by total price, then by outbound date.
+    """
+    # Same day outbound flights by arrival, so same day returns leave window in order
+    outbound = sorted(outbound, key=lambda flight: (flight.date, flight.arrival))
+    inbound = sorted(inbound, key=lambda flight: (flight.date, flight.departure))
+    inbound_dates = [flight.date for flight in inbound]
+    # Indexes of inbound flights in window with increasing prices
+    window = deque()
+    added = 0
+    trips = []
+
+    for flight in outbound:
+        earliest = flight.date + timedelta(days=min_stay)
+        latest = len(inbound) if max_stay is None\
+            else bisect_left(inbound_dates, flight.date + timedelta(days=max_stay + 1))
+
+        while added < latest:
+            while window and inbound[window[-1]].price >= inbound[added].price:
+                window.pop()
+
+            window.append(added)
+            added += 1
+
+        while window and inbound_dates[window[0]] < earliest:
+            window.popleft()
+
+        # Same day return must depart after outbound arrival
+        while window and inbound_dates[window[0]] == flight.date\
+                and inbound[window[0]].departure < flight.arrival:
+            window.popleft()
+
+        if window:
+            trips.append(RoundTrip(flight, inbound[window[0]]))
+
+    return sorted(trips, key=lambda trip: (trip.price, trip.outbound.date))
+
+
+def rank_round_trips(
+        outbound: List[Flight],
+        inbound: List[Flight],
+        min_stay: int = 0,
+        max_stay: Optional[int] = None,
+        limit: int = 10
+) -> List[RoundTrip]:
+    """Rank all valid pairs of outbound and inbound flights by total price.
+
+    Arguments:
+        outbound -- outbound flights.
+        inbound -- inbound flights.
+        min_stay -- min number of days between flights.
+        max_stay -- max number of days between flights, unlimited if None.
+        limit -- number of the cheapest round trips.
+
+    Returns:
+        list -- the cheapest round trips.
+    """
+    inbound = sorted(inbound, key=lambda flight: flight.date)
+    inbound_dates = [flight.date for flight in inbound]
+
+    def pairs() -> Iterator[RoundTrip]:
+        for flight in outbound:
+            first = bisect_left(inbound_dates, flight.date + timedelta(days=min_stay))
+            last = len(inbound) if max_stay is None\
+                else bisect_left(inbound_dates, flight.date + timedelta(days=max_stay + 1))
+
+            for return_flight in inbound[first:last]:
+                if return_flight.date != flight.date or return_flight.departure >= flight.arrival:
+                    yield RoundTrip(flight, return_flight)
+
+    return heapq.nsmallest(limit, pairs(), key=lambda trip: (trip.price, trip.outbound.date))
+
+
+def print_round_trips(trips: List[RoundTrip]) -> None:
+    """Show ranked table of round trips."""
+    row = '{:<5} {:<17} {:<6} {:<6} {:<17} {:<6} {:<6} {}'
+    print(row.format('Rank', 'Outbound', 'Dep', 'Arr', 'Inbound', 'Dep', 'Arr', 'Total cost'))
+
+    for rank, trip in enumerate(trips, 1):
+        outbound = format_flight(trip.outbound)
+        inbound = format_flight(trip.inbound)
+        print(row.format(
+            rank, outbound['Date'], outbound['Departure'], outbound['Arrival'],
+            inbound['Date'], inbound['Departure'], inbound['Arrival'],
+            format_price(trip.price)
+        ))
+
+
+def parse_date(flight_date: str) -> date:
+    """Convert date in format dd.mm.yyyy, past dates are allowed."""
+    return script.parse_flight_date(flight_date).date()
+
+
+def parse_arguments(args: List) -> argparse.Namespace:
+    """Handle command line arguments of fare calendar.
+
+    Arguments:
+        args -- command line arguments without 'calendar' command.
+
+    Returns:
+        argparse.Namespace -- parsed arguments.
+    """
+    argument_parser = argparse.ArgumentParser(
+        prog='main.py calendar',
+        description='Cheapest round trips for all available dates of route',
+        parents=[script.cache_arguments(), concurrency_arguments()]
+    )
+    argument_parser.add_argument(
+        'dep_city', help='departure city IATA code', type=script.validate_city_code
+    )
+    argument_parser.add_argument(
+        'dest_city', help='destination city IATA code', type=script.validate_city_code
+    )
+    argument_parser.add_argument(
+        'passengers', help='total number of passengers', type=script.validate_passengers
+    )
+    argument_parser.add_argument(
+        '--from', dest='start', type=parse_date, default=date.min, help='earliest flight date'
+    )
+    argument_parser.add_argument(
+        '--to', dest='end', type=parse_date, default=date.max, help='latest flight date'
+    )
+    argument_parser.add_argument(
+        '--min-stay', type=int, default=0, help='min number of days between flights'
+    )
+    argument_parser.add_argument(
+        '--max-stay', type=int, default=None, help='max number of days between flights'
+    )
+    argument_parser.add_argument(
+        '--limit', type=int, default=10, help='number of round trips to show'
+    )
+    argument_parser.add_argument(
+        '--all-pairs', action='store_true',
+        help='rank every pair of dates, not only the cheapest return per departure'
+    )
+
+    return argument_parser.parse_args(args)
+
+
+def main(arguments: List) -> int:
+    """Fetch fare calendar of route and print the cheapest round trips.
+
+    Arguments:
+        arguments -- command line arguments without 'calendar' command.
+
+    Returns:
+        int -- exit status, 1 if no round trip was found.
+    """
+    args = parse_arguments(arguments)
+    cache = None if args.no_cache else QuoteCache(ttl=args.cache_ttl)
+
+    try:
+        calendar = asyncio.run(fetch_calendar(
+            args.dep_city, args.dest_city, args.passengers, args.start, args.end,
+            args.concurrency, cache, rate=args.rate
+        ))
+    finally:
+        if cache is not None:
+            cache.close()
+
+    for result in calendar.errors:
+        print(f'{result.query.dep_city}-{result.query.dest_city} '
+              f'{result.query.dep_date:%d.%m.%Y}: {result.error or "no flight"}', file=sys.stderr)
+
+    if args.all_pairs:
+        trips = rank_round_trips(
+            calendar.outbound, calendar.inbound, args.min_stay, args.max_stay, args.limit
+        )
+    else:
+        trips = cheapest_round_trips(
+            calendar.outbound, calendar.inbound, args.min_stay, args.max_stay
+        )[:args.limit]
+
+    if not trips:
+        print('Round trips for chosen dates not found.')
+
+        return 1
+
+    print_round_trips(trips)
+
+    return 0
@@ -0,0 +1,225 @@
+import random
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Any, Callable, List, NamedTuple, Optional, Tuple, Union
+import requests
+from requests.adapters import HTTPAdapter
+
+
+DEFAULT_POOL_SIZE = 8
+# Seconds to connect and to wait for every read from socket
+DEFAULT_TIMEOUT = (3.05, 15)
+DEFAULT_RETRIES = 3
+# Seconds, doubled after every failed attempt
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 10
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+# Number of latest requests kept for metrics
+TIMINGS_WINDOW = 1000
+
+
+class TokenBucket:
+    """Thread safe token bucket, rate tokens are added per second up to capacity."""
+
+    def __init__(
+            self,
+            rate: float,
+            capacity: float = 1,
+            clock: Callable[[], float] = time.monotonic,
+            sleep: Callable[[float], None] = time.sleep
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, wait until it is available.
+
+        Returns:
+            float -- seconds spent waiting.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            # Negative balance is the queue of callers already waiting
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait:
+            self._sleep(wait)
+
+        return wait
+
+
+class RequestTiming(NamedTuple):
+    """Metrics of one request including all its attempts.
+
+    elapsed is time until the last response headers were received,
+    so streamed body download is not included.
+    """
+
+    url: str
+    status: Optional[int]
+    attempts: int
+    elapsed: float
+    waited: float
+    error: Optional[str] = None
+
+
+class Fetcher:
+    """HTTP client with connection pool, timeouts, retries and rate limit.
+
+    Exposes get method compatible with requests.Session, so it can be used
+    everywhere session is expected.
+    """
+
+    def __init__(
+            self,
+            pool_size: int = DEFAULT_POOL_SIZE,
+            timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+            retries: int = DEFAULT_RETRIES,
+            backoff: float = DEFAULT_BACKOFF,
+            rate: Optional[float] = None,
+            burst: int = 1,
+            session: Optional[requests.Session] = None
+    ):
+        """Create fetcher with its own session.
+
+        Arguments:
+            pool_size -- max number of kept alive connections per host.
+            timeout -- connect and read timeouts in seconds.
+            retries -- number of repeated attempts after 5xx status,
+                429 status, connection error or timeout.
+            backoff -- seconds before the first retry, delay is doubled
+                after every attempt and randomized with full jitter.
+            rate -- max number of requests per second, unlimited if None.
+            burst -- number of requests allowed at once above rate.
+            session -- session to send requests with, new pooled one if None.
+        """
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+
+        self.session = session
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = TokenBucket(rate, burst) if rate else None
+        self.timings = deque(maxlen=TIMINGS_WINDOW)
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'attempts': 0, 'failures': 0}
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None, **kwargs) -> requests.Response:
+        """Send GET request, retry transient failures.
+
+        Arguments:
+            url -- requested address.
+            params -- url parameters.
+            kwargs -- passed to requests.Session.get, e.g. stream.
+
+        Raises:
+            requests.RequestException -- connection failed or timed out
+                after all attempts.
+
+        Returns:
+            requests.Response -- the last response, its status may be 5xx
+                if all attempts failed.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        waited = 0.0
+        start = time.perf_counter()
+
+        while True:
+            attempt += 1
+
+            if self.limiter is not None:
+                waited += self.limiter.acquire()
+
+            try:
+                response = self.session.get(url, params=params, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if attempt > self.retries:
+                    self._record(url, None, attempt, start, waited, repr(error))
+                    raise
+
+                waited += self._sleep(attempt)
+                continue
+
+            if response.status_code not in RETRY_STATUSES or attempt > self.retries:
+                self._record(url, response.status_code, attempt, start, waited)
+
+                return response
+
+            response.close()
+            waited += self._sleep(attempt, response.headers.get('Retry-After'))
+
+    def _sleep(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Wait before next attempt, return waited seconds."""
+        delay = random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** (attempt - 1)))
+
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, min(MAX_BACKOFF, int(retry_after)))
+
+        time.sleep(delay)
+
+        return delay
+
+    def _record(
+            self,
+            url: str,
+            status: Optional[int],
+            attempts: int,
+            start: float,
+            waited: float,
+            error: Optional[str] = None
+    ) -> None:
+        timing = RequestTiming(url, status, attempts, time.perf_counter() - start, waited, error)
+
+        with self._lock:
+            self.timings.append(timing)
+            self._counters['requests'] += 1
+            self._counters['attempts'] += attempts
+            self._counters['failures'] += error is not None or status in RETRY_STATUSES
+
+    def stats(self) -> Dict[str, Any]:
+        """Return request counters and latency of the latest requests in milliseconds."""
+        with self._lock:
+            stats = dict(self._counters)
+            elapsed: List[float] = sorted(timing.elapsed for timing in self.timings)
+
+        stats['retries'] = stats['attempts'] - stats['requests']
+
+        if elapsed:
+            stats['latency_ms'] = {
+                'p50': elapsed[(len(elapsed) - 1) // 2] * 1000,
+                'mean': sum(elapsed) / len(elapsed) * 1000,
+                'max': elapsed[-1] * 1000
+            }
+
+        return stats
+
+    def close(self) -> None:
+        """Close pooled connections."""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@lru_cache(maxsize=None)
+def default_fetcher() -> Fetcher:
+    """Return fetcher shared by calls without own session."""
+    return Fetcher()
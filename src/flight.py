@@ -0,0 +1,83 @@
+from datetime import date
+from typing import Dict, NamedTuple
+from src.times import format_minutes
+
+
+CITY_NAMES = {
+    'CPH': 'Copenhagen',
+    'BLL': 'Billund',
+    'PDV': 'Plovdiv',
+    'BOJ': 'Burgas',
+    'SOF': 'Sofia',
+    'VAR': 'Varna'
+}
+CURRENCY = 'EUR'
+
+
+class Flight(NamedTuple):
+    """Parsed flight, times are minutes since midnight and price is in cents."""
+
+    date: date
+    departure: int
+    arrival: int
+    duration: int
+    dep_city: str
+    dest_city: str
+    price: int
+    extra_info: str = ''
+
+
+def parse_price(price: str) -> int:
+    """Convert price cell text like 'Price: 105.00 EUR' into cents.
+
+    Arguments:
+        price -- price cell text.
+
+    Raises:
+        ValueError -- text does not contain price.
+
+    Returns:
+        int -- price in cents.
+    """
+    # First 7 chars contain "Price: ", last 4 chars contain " EUR"
+    whole, _, fraction = price[7:-4].strip().partition('.')
+
+    return int(whole) * 100 + int(fraction.ljust(2, '0')[:2])
+
+
+def format_price(price: int) -> str:
+    """Convert price in cents into text like '210.00 EUR'."""
+    return f'{price // 100}.{price % 100:02d} {CURRENCY}'
+
+
+def format_city(code: str) -> str:
+    """Convert IATA city code into text like 'Burgas (BOJ)'."""
+    return f'{CITY_NAMES.get(code, code)} ({code})'
+
+
+def format_flight(flight: Flight) -> Dict[str, str]:
+    """Convert flight into the table row shown to user.
+
+    Arguments:
+        flight -- parsed flight.
+
+    Returns:
+        dict -- formatted flight information.
+    """
+    flight_date = flight.date
+
+    return {
+        'Date': f'{flight_date:%a}, {flight_date.day} {flight_date:%b %y}',
+        'Departure': format_minutes(flight.departure),
+        'Arrival': format_minutes(flight.arrival),
+        'Flight duration': format_minutes(flight.duration),
+        'From': format_city(flight.dep_city),
+        'To': format_city(flight.dest_city),
+        'Price': format_price(flight.price),
+        'Additional information': flight.extra_info
+    }
+
+
+def format_flights(flights: Dict[str, Flight]) -> Dict[str, Dict[str, str]]:
+    """Format every flight of search result keeping directions."""
+    return {direction: format_flight(flight) for direction, flight in flights.items()}
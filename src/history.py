@@ -0,0 +1,389 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional
+import src.script as script
+from src.flight import Flight, format_price
+
+
+DEFAULT_HISTORY_PATH = os.environ.get(
+    'FLIGHTS_INFO_HISTORY',
+    os.path.join(os.path.expanduser('~'), '.cache', 'flights_info', 'history.sqlite3')
+)
+SECONDS_PER_HOUR = 60 * 60
+SECONDS_PER_DAY = 24 * SECONDS_PER_HOUR
+# Seconds
+DEFAULT_BUCKET = SECONDS_PER_DAY
+# Fields which must be equal for consecutive observations to be merged
+VALUE_FIELDS = ('departure', 'arrival', 'duration', 'price', 'extra_info')
+
+
+class FareObservation(NamedTuple):
+    """Fare seen unchanged by every search from observed to last_seen."""
+
+    dep_city: str
+    dest_city: str
+    flight_date: date
+    passengers: int
+    observed: float
+    last_seen: float
+    departure: int
+    arrival: int
+    duration: int
+    price: int
+    extra_info: str = ''
+
+    @property
+    def flight(self) -> Flight:
+        return Flight(
+            self.flight_date, self.departure, self.arrival, self.duration,
+            self.dep_city, self.dest_city, self.price, self.extra_info
+        )
+
+
+class TrendPoint(NamedTuple):
+    """Prices seen during one bucket of time, close is the last seen price."""
+
+    start: float
+    low: int
+    high: int
+    close: int
+
+
+class FareHistory:
+    """SQLite store of observed fares keyed by route, flight date and passengers.
+
+    Consecutive observations of the same fare are kept as one row whose
+    last_seen is moved forward, so the store grows with changes of fares
+    rather than with number of searches.
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH):
+        """Open or create history database.
+
+        Arguments:
+            path -- database file, ':memory:' for history without file.
+        """
+        # sqlite3 takes noticeable time to import, load it only for history
+        import sqlite3
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript('''
+            CREATE TABLE IF NOT EXISTS fares (
+                dep_city TEXT NOT NULL,
+                dest_city TEXT NOT NULL,
+                flight_date TEXT NOT NULL,
+                passengers INTEGER NOT NULL,
+                observed REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                departure INTEGER NOT NULL,
+                arrival INTEGER NOT NULL,
+                duration INTEGER NOT NULL,
+                price INTEGER NOT NULL,
+                extra_info TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS fares_key
+                ON fares (dep_city, dest_city, flight_date, passengers, observed);
+            CREATE INDEX IF NOT EXISTS fares_observed ON fares (observed);
+        ''')
+
+    def record(
+            self,
+            flights: Iterable[Flight],
+            passengers: int,
+            observed: Optional[float] = None
+    ) -> int:
+        """Append observation of flights.
+
+        Arguments:
+            flights -- flights found by one search.
+            passengers -- total number of passengers of the search.
+            observed -- seconds since epoch, current time if None.
+
+        Returns:
+            int -- number of new rows, flights equal to their latest row
+                only extend it.
+        """
+        observed = time.time() if observed is None else observed
+        added = 0
+
+        with self._lock, self._connection:
+            for flight in flights:
+                key = (flight.dep_city, flight.dest_city, flight.date.isoformat(), passengers)
+                latest = self._connection.execute(
+                    '''SELECT rowid, observed, departure, arrival, duration, price, extra_info
+                    FROM fares WHERE dep_city = ? AND dest_city = ? AND flight_date = ?
+                    AND passengers = ? ORDER BY observed DESC LIMIT 1''',
+                    key
+                ).fetchone()
+                values = (flight.departure, flight.arrival, flight.duration, flight.price, flight.extra_info)
+
+                if latest is not None and latest[2:] == values and latest[1] <= observed:
+                    self._connection.execute(
+                        'UPDATE fares SET last_seen = MAX(last_seen, ?) WHERE rowid = ?',
+                        (observed, latest[0])
+                    )
+                else:
+                    self._connection.execute(
+                        'INSERT INTO fares VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (*key, observed, observed, *values)
+                    )
+                    added += 1
+
+        return added
+
+    def history(
+            self,
+            dep_city: str,
+            dest_city: str,
+            flight_date: date,
+            passengers: Optional[int] = None,
+            start: Optional[float] = None,
+            end: Optional[float] = None
+    ) -> List[FareObservation]:
+        """Return fares of flight seen between start and end.
+
+        Arguments:
+            dep_city -- departure city.
+            dest_city -- destination city.
+            flight_date -- date of flight.
+            passengers -- number of passengers, all numbers if None.
+            start -- seconds since epoch, from the first observation if None.
+            end -- seconds since epoch, to the last observation if None.
+
+        Returns:
+            list -- observations overlapping the range, ordered by
+                passengers and observation time.
+        """
+        query = '''SELECT * FROM fares WHERE dep_city = ? AND dest_city = ? AND flight_date = ?'''
+        parameters = [dep_city, dest_city, flight_date.isoformat()]
+
+        for condition, value in (
+                ('passengers = ?', passengers), ('last_seen >= ?', start), ('observed <= ?', end)
+        ):
+            if value is not None:
+                query += f' AND {condition}'
+                parameters.append(value)
+
+        with self._lock:
+            rows = self._connection.execute(
+                query + ' ORDER BY passengers, observed', parameters
+            ).fetchall()
+
+        return [
+            FareObservation(dep, dest, date.fromisoformat(day), *values)
+            for dep, dest, day, *values in rows
+        ]
+
+    def trend(
+            self,
+            dep_city: str,
+            dest_city: str,
+            flight_date: date,
+            passengers: int,
+            start: float,
+            end: float,
+            bucket: float = DEFAULT_BUCKET
+    ) -> List[TrendPoint]:
+        """Downsample price of flight into buckets of time.
+
+        Every observation counts in all buckets from its first to its last
+        sighting, buckets without observations are skipped.
+
+        Arguments:
+            dep_city -- departure city.
+            dest_city -- destination city.
+            flight_date -- date of flight.
+            passengers -- number of passengers.
+            start -- seconds since epoch.
+            end -- seconds since epoch.
+            bucket -- seconds in one bucket.
+
+        Raises:
+            ValueError -- bucket is not positive.
+
+        Returns:
+            list -- lowest, highest and last price of every bucket.
+        """
+        if bucket <= 0:
+            raise ValueError('Bucket must be positive')
+
+        points: Dict[int, List[int]] = {}
+
+        for observation in self.history(dep_city, dest_city, flight_date, passengers, start, end):
+            first = int((max(observation.observed, start) - start) // bucket)
+            last = int((min(observation.last_seen, end) - start) // bucket)
+
+            for index in range(first, last + 1):
+                point = points.get(index)
+
+                if point is None:
+                    points[index] = [observation.price] * 3
+                else:
+                    point[0] = min(point[0], observation.price)
+                    point[1] = max(point[1], observation.price)
+                    # Observations are ordered by time
+                    point[2] = observation.price
+
+        return [
+            TrendPoint(start + index * bucket, *point) for index, point in sorted(points.items())
+        ]
+
+    def compact(self) -> int:
+        """Merge consecutive rows with equal fares, e.g. recorded by older versions.
+
+        Returns:
+            int -- number of removed rows.
+        """
+        removed = []
+        # Rowid, key, fares, last_seen and whether following rows were merged
+        kept_rows = []
+
+        with self._lock, self._connection:
+            rows = self._connection.execute(
+                f'''SELECT rowid, dep_city, dest_city, flight_date, passengers, last_seen,
+                {", ".join(VALUE_FIELDS)} FROM fares
+                ORDER BY dep_city, dest_city, flight_date, passengers, observed'''
+            ).fetchall()
+            kept = None
+
+            for rowid, dep_city, dest_city, flight_date, passengers, last_seen, *values in rows:
+                key = (dep_city, dest_city, flight_date, passengers)
+
+                if kept is not None and kept[1] == key and kept[2] == values:
+                    removed.append((rowid,))
+                    kept[3] = max(kept[3], last_seen)
+                    kept[4] = True
+                else:
+                    kept = [rowid, key, values, last_seen, False]
+                    kept_rows.append(kept)
+
+            self._connection.executemany(
+                'UPDATE fares SET last_seen = ? WHERE rowid = ?',
+                ((last_seen, rowid) for rowid, _, _, last_seen, merged in kept_rows if merged)
+            )
+            self._connection.executemany('DELETE FROM fares WHERE rowid = ?', removed)
+
+        return len(removed)
+
+    def stats(self) -> Dict[str, int]:
+        """Return number of stored rows and flights."""
+        with self._lock:
+            rows = self._connection.execute('SELECT COUNT(*) FROM fares').fetchone()[0]
+            flights = self._connection.execute(
+                '''SELECT COUNT(*) FROM (
+                    SELECT DISTINCT dep_city, dest_city, flight_date, passengers FROM fares
+                )'''
+            ).fetchone()[0]
+
+        return {'rows': rows, 'flights': flights}
+
+    def close(self) -> None:
+        """Close database connection."""
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def positive_number(value: str) -> float:
+    """Parse positive number of command line argument.
+
+    Raises:
+        argparse.ArgumentTypeError -- value is not positive.
+    """
+    number = float(value)
+
+    if number <= 0:
+        raise argparse.ArgumentTypeError('Value must be positive')
+
+    return number
+
+
+def parse_arguments(args: List) -> argparse.Namespace:
+    """Handle command line arguments of fare history.
+
+    Arguments:
+        args -- command line arguments without 'history' command.
+
+    Returns:
+        argparse.Namespace -- parsed arguments.
+    """
+    argument_parser = argparse.ArgumentParser(
+        prog='main.py history',
+        description='Show how fare of flight moved, searches with --history record fares'
+    )
+    argument_parser.add_argument(
+        'dep_city', help='departure city IATA code', type=script.validate_city_code
+    )
+    argument_parser.add_argument(
+        'dest_city', help='destination city IATA code', type=script.validate_city_code
+    )
+    argument_parser.add_argument(
+        'flight_date', help='flight date', type=lambda value: script.parse_flight_date(value).date()
+    )
+    argument_parser.add_argument(
+        'passengers', help='total number of passengers', type=script.validate_passengers
+    )
+    argument_parser.add_argument(
+        '--days', type=float, default=30, help='show observations of last days'
+    )
+    argument_parser.add_argument(
+        '--bucket', type=positive_number, default=24, help='hours summarized by one row'
+    )
+    argument_parser.add_argument(
+        '--compact', action='store_true', help='merge repeated observations before showing'
+    )
+    argument_parser.add_argument(
+        '--path', default=DEFAULT_HISTORY_PATH, help='history database file'
+    )
+
+    return argument_parser.parse_args(args)
+
+
+def main(arguments: List) -> int:
+    """Print price trend of flight.
+
+    Arguments:
+        arguments -- command line arguments without 'history' command.
+
+    Returns:
+        int -- exit status, 1 if flight was never observed.
+    """
+    args = parse_arguments(arguments)
+    end = time.time()
+
+    with FareHistory(args.path) as history:
+        if args.compact:
+            print(f'Removed {history.compact()} repeated observations.', file=sys.stderr)
+
+        points = history.trend(
+            args.dep_city, args.dest_city, args.flight_date, args.passengers,
+            end - args.days * SECONDS_PER_DAY, end, args.bucket * SECONDS_PER_HOUR
+        )
+
+    if not points:
+        print('Fares of the flight were not recorded.')
+
+        return 1
+
+    row = '{:<17} {:<13} {:<13} {}'
+    print(row.format('Observed', 'Lowest', 'Highest', 'Last'))
+
+    for point in points:
+        print(row.format(
+            f'{datetime.fromtimestamp(point.start):%d.%m.%Y %H:%M}',
+            format_price(point.low), format_price(point.high), format_price(point.close)
+        ))
+
+    return 0
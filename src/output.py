@@ -0,0 +1,200 @@
+import abc
+import csv
+import json
+from typing import Dict, Any, IO, List, Union
+from src.flight import CURRENCY, Flight, format_flight, format_price
+from src.times import format_minutes
+
+
+# Characters or bytes collected before writing them to stream at once
+BUFFER_SIZE = 64 * 1024
+# Fields of machine readable records, price is in cents
+RECORD_FIELDS = (
+    'direction', 'date', 'departure', 'arrival', 'duration',
+    'dep_city', 'dest_city', 'price', 'currency', 'extra_info'
+)
+TABLE_COLUMNS = (
+    ('Direction', 12), ('Date', 17), ('Departure', 10), ('Arrival', 10),
+    ('Flight duration', 15), ('From', 20), ('To', 20), ('Price', 13),
+    ('Additional information', 20)
+)
+
+
+def flight_record(direction: str, flight: Flight) -> Dict[str, Any]:
+    """Convert flight into record with ISO date and numeric duration and price.
+
+    Arguments:
+        direction -- 'Outbound' or 'Inbound'.
+        flight -- parsed flight.
+
+    Returns:
+        dict -- values of RECORD_FIELDS.
+    """
+    return {
+        'direction': direction,
+        'date': flight.date.isoformat(),
+        'departure': format_minutes(flight.departure),
+        'arrival': format_minutes(flight.arrival),
+        'duration': flight.duration,
+        'dep_city': flight.dep_city,
+        'dest_city': flight.dest_city,
+        'price': flight.price,
+        'currency': CURRENCY,
+        'extra_info': flight.extra_info
+    }
+
+
+class FlightWriter(abc.ABC):
+    """Write flights of search results to stream as they are produced.
+
+    Output is collected into chunks of about BUFFER_SIZE and every chunk
+    is written to stream with one call, results are never accumulated.
+    """
+
+    binary = False
+
+    def __init__(self, stream: Union[IO[str], IO[bytes]], buffer_size: int = BUFFER_SIZE):
+        """Create writer.
+
+        Arguments:
+            stream -- text stream, binary stream for binary writers.
+            buffer_size -- max number of characters or bytes kept before
+                writing them to stream.
+        """
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self._chunks: List[Union[str, bytes]] = []
+        self._size = 0
+
+    def _write(self, data: Union[str, bytes]) -> None:
+        self._chunks.append(data)
+        self._size += len(data)
+
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def write_flights(self, flights: Dict[str, Flight]) -> None:
+        """Write all flights of one search result."""
+        for direction, flight in flights.items():
+            self.write_flight(direction, flight)
+
+    @abc.abstractmethod
+    def write_flight(self, direction: str, flight: Flight) -> None:
+        """Write one flight of search result.
+
+        Arguments:
+            direction -- 'Outbound' or 'Inbound'.
+            flight -- parsed flight.
+        """
+
+    def flush(self) -> None:
+        """Write buffered output to stream."""
+        if self._chunks:
+            self.stream.write(self._chunks[0][:0].join(self._chunks))
+            self._chunks.clear()
+            self._size = 0
+
+        self.stream.flush()
+
+    def close(self) -> None:
+        """Flush buffered output, stream stays open."""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TableWriter(FlightWriter):
+    """Fixed width table with total cost of every result with several flights."""
+
+    def __init__(self, stream: IO[str], buffer_size: int = BUFFER_SIZE):
+        super().__init__(stream, buffer_size)
+        self._header_written = False
+
+    @staticmethod
+    def format_row(values: List[str]) -> str:
+        return ' '.join(
+            f'{value:<{width}}' for value, (_, width) in zip(values, TABLE_COLUMNS)
+        ).rstrip() + '\n'
+
+    def write_flights(self, flights: Dict[str, Flight]) -> None:
+        super().write_flights(flights)
+
+        if len(flights) > 1:
+            total = sum(flight.price for flight in flights.values())
+            self._write(self.format_row(['Total cost', format_price(total)]))
+
+    def write_flight(self, direction: str, flight: Flight) -> None:
+        if not self._header_written:
+            self._write(self.format_row([name for name, _ in TABLE_COLUMNS]))
+            self._header_written = True
+
+        self._write(self.format_row([direction, *format_flight(flight).values()]))
+
+
+class JsonLinesWriter(FlightWriter):
+    """One JSON object per flight."""
+
+    def write_flight(self, direction: str, flight: Flight) -> None:
+        self._write(json.dumps(flight_record(direction, flight), ensure_ascii=False) + '\n')
+
+
+class CsvWriter(FlightWriter):
+    """CSV with header row, stream should be opened with newline=''."""
+
+    def __init__(self, stream: IO[str], buffer_size: int = BUFFER_SIZE):
+        super().__init__(stream, buffer_size)
+        # csv writer formats rows into this writer, which buffers them
+        self._csv = csv.writer(self)
+        self._csv.writerow(RECORD_FIELDS)
+
+    def write(self, row: str) -> None:
+        self._write(row)
+
+    def write_flight(self, direction: str, flight: Flight) -> None:
+        self._csv.writerow(flight_record(direction, flight).values())
+
+
+class MsgpackWriter(FlightWriter):
+    """Stream of msgpack maps, requires msgpack package."""
+
+    binary = True
+
+    def __init__(self, stream: IO[bytes], buffer_size: int = BUFFER_SIZE):
+        import msgpack
+
+        super().__init__(stream, buffer_size)
+        self._packer = msgpack.Packer()
+
+    def write_flight(self, direction: str, flight: Flight) -> None:
+        self._write(self._packer.pack(flight_record(direction, flight)))
+
+
+WRITERS = {
+    'table': TableWriter,
+    'jsonl': JsonLinesWriter,
+    'csv': CsvWriter,
+    'msgpack': MsgpackWriter,
+}
+
+
+def open_writer(output_format: str, stream: IO[str], buffer_size: int = BUFFER_SIZE) -> FlightWriter:
+    """Create writer of format for text stream, binary formats use its buffer.
+
+    Arguments:
+        output_format -- one of WRITERS.
+        stream -- text stream, e.g. sys.stdout.
+        buffer_size -- max number of characters or bytes kept in memory.
+
+    Raises:
+        ImportError -- optional package required by format is not installed.
+
+    Returns:
+        FlightWriter -- writer, close it to flush output.
+    """
+    writer = WRITERS[output_format]
+
+    return writer(stream.buffer if writer.binary else stream, buffer_size)
@@ -0,0 +1,159 @@
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Union
+from lxml import etree
+from lxml.html import HtmlElement
+from src.profiling import count, stage
+
+
+# Length of the suffix shared by all rows of one flight
+FLIGHT_ID_LENGTH = 5
+QUOTES_TABLE_ID = 'flywiz_tblQuotes'
+
+
+def parse_quotes_table(table: HtmlElement) -> List[Dict[str, Any]]:
+    """Walk rows of flywiz_tblQuotes table once and group them by flight ID.
+
+    Every flight is described by a "rinf" row (date, times and cities)
+    and by one or more rows with price and additional information.
+    Rows of the same flight differ only in the last 5 chars of their IDs.
+
+    Arguments:
+        table -- table with full information about flights.
+
+    Returns:
+        list -- flights in order of their "rinf" rows, every flight is a dict
+            with keys: flight_id, info (cells of "rinf" row) and
+            price_and_extra_info (cells with text of remaining rows).
+    """
+    flights = {}
+    extra_cells = {}
+
+    for row in table.iterchildren('tr'):
+        row_id = row.get('id')
+
+        if not row_id:
+            continue
+
+        flight_id = row_id[-FLIGHT_ID_LENGTH:]
+
+        if 'rinf' in row_id:
+            flights[flight_id] = row.getchildren()
+        else:
+            # Same cells as './tr[...]/td[text()]' XPath query
+            extra_cells.setdefault(flight_id, []).extend(
+                cell for cell in row.iterchildren('td') if cell.text
+            )
+
+    count('flights', len(flights))
+
+    return [
+        {
+            'flight_id': flight_id,
+            'info': info,
+            'price_and_extra_info': extra_cells.get(flight_id, [])
+        }
+        for flight_id, info in flights.items()
+    ]
+
+
+def iter_quote_rows(
+        chunks: Iterable[Union[bytes, str]],
+        encoding: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """Parse flywiz_tblQuotes table incrementally while page is downloaded.
+
+    Rows are detached from the document as soon as they are closed and
+    everything outside the table is discarded, so memory does not grow with
+    page size. Flight is emitted when "rinf" row of the next flight or end
+    of the table is reached, so rows of one flight must be adjacent.
+    Closing the generator closes chunks too, e.g. releases the response
+    when reader does not need the rest of the page.
+
+    Arguments:
+        chunks -- parts of HTML page.
+        encoding -- page encoding, detected by parser if None.
+
+    Raises:
+        ValueError -- page does not contain quotes table.
+
+    Yields:
+        dict -- flights in the same format as parse_quotes_table returns.
+    """
+    parser = etree.HTMLPullParser(events=('start', 'end'), encoding=encoding)
+    table = None
+    table_found = False
+    current = None
+    # Price rows which came before their "rinf" row
+    orphans = {}
+
+    def events():
+        try:
+            for chunk in chunks:
+                with stage('parse'):
+                    parser.feed(chunk)
+                    chunk_events = list(parser.read_events())
+
+                yield from chunk_events
+        finally:
+            # Reader stopped before end of page, let source release response
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+        with stage('parse'):
+            parser.close()
+            chunk_events = list(parser.read_events())
+
+        yield from chunk_events
+
+    for event, element in events():
+        if table is None:
+            if event == 'start' and element.tag == 'table'\
+                    and element.get('id') == QUOTES_TABLE_ID:
+                table = element
+                table_found = True
+            elif event == 'end':
+                # Element is complete and does not contain the table
+                element.clear()
+            continue
+
+        if event == 'end' and element is table:
+            table = None
+            continue
+
+        if event != 'end' or element.tag != 'tr' or element.getparent() is None:
+            continue
+
+        element.getparent().remove(element)
+        row_id = element.get('id')
+
+        if not row_id:
+            continue
+
+        flight_id = row_id[-FLIGHT_ID_LENGTH:]
+
+        if 'rinf' in row_id:
+            if current is not None:
+                if current['flight_id'] == flight_id:
+                    continue
+
+                count('flights')
+                yield current
+
+            current = {
+                'flight_id': flight_id,
+                'info': element.getchildren(),
+                'price_and_extra_info': orphans.pop(flight_id, [])
+            }
+        else:
+            cells = [cell for cell in element.iterchildren('td') if cell.text]
+
+            if current is not None and current['flight_id'] == flight_id:
+                current['price_and_extra_info'].extend(cells)
+            else:
+                orphans.setdefault(flight_id, []).extend(cells)
+
+    if not table_found:
+        raise ValueError('Quotes table not found')
+
+    if current is not None:
+        count('flights')
+        yield current
@@ -0,0 +1,121 @@
+import argparse
+import threading
+from typing import Dict, Callable, List, Optional
+import src.script as script
+from src.flight import Flight
+
+
+def with_passengers(args: argparse.Namespace, passengers: int) -> argparse.Namespace:
+    """Copy flight parameters with another number of passengers.
+
+    Arguments:
+        args -- flight parameters, argparse.Namespace or SearchQuery.
+        passengers -- total number of passengers.
+
+    Returns:
+        argparse.Namespace -- flight parameters of the same type as args.
+    """
+    if hasattr(args, '_replace'):
+        return args._replace(passengers=passengers)
+
+    return argparse.Namespace(**dict(vars(args), passengers=passengers))
+
+
+def scale_fares(flights: Dict[str, Flight], passengers: int) -> Dict[str, Flight]:
+    """Derive flights for passengers from one passenger fares.
+
+    Arguments:
+        flights -- flights by direction with prices for one passenger.
+        passengers -- total number of passengers.
+
+    Returns:
+        dict -- flights by direction with prices for all passengers.
+    """
+    return {
+        direction: flight._replace(price=flight.price * passengers)
+        for direction, flight in flights.items()
+    }
+
+
+def check_linear_pricing(pages: Dict[int, str], args: argparse.Namespace) -> List[str]:
+    """Compare pages fetched for different passengers with one passenger page.
+
+    Deriving prices locally is safe only if the site shows the same flights
+    and the same fare per person regardless of paxcount.
+
+    Arguments:
+        pages -- HTML pages by number of passengers, must contain page for 1.
+        args -- flight parameters.
+
+    Returns:
+        list -- descriptions of mismatches, empty if pricing is linear.
+    """
+    single_fares = script.extract_flights(pages[1], with_passengers(args, 1))
+    mismatches = []
+
+    for passengers, page in sorted(pages.items()):
+        expected = scale_fares(single_fares, passengers)
+        actual = script.extract_flights(page, with_passengers(args, passengers))
+
+        for direction in sorted(expected.keys() | actual.keys()):
+            if expected.get(direction) != actual.get(direction):
+                mismatches.append(
+                    f'{passengers} passengers, {direction}: expected '
+                    f'{expected.get(direction)}, got {actual.get(direction)}'
+                )
+
+    return mismatches
+
+
+class PassengerFareCache:
+    """Fetch flights once per route and dates, answer any passengers number."""
+
+    def __init__(self, fetch: Callable[..., str] = script.fetch_quotes_page):
+        """Create empty cache.
+
+        Arguments:
+            fetch -- function downloading page for url parameters,
+                accepts the same arguments as fetch_quotes_page.
+        """
+        self.fetch = fetch
+        self._fares = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(args: argparse.Namespace) -> tuple:
+        """Return key of flights for all passengers numbers."""
+        return args.dep_city, args.dest_city, args.dep_date, args.return_date
+
+    def find(self, args: argparse.Namespace, *fetch_args, **fetch_kwargs) -> Dict[str, Flight]:
+        """Find flights for args.passengers using one passenger fares.
+
+        Arguments:
+            args -- flight parameters.
+            fetch_args -- extra positional arguments of fetch.
+            fetch_kwargs -- extra keyword arguments of fetch.
+
+        Returns:
+            dict -- Available flights by direction.
+        """
+        key = self.make_key(args)
+
+        with self._lock:
+            fares = self._fares.get(key)
+
+        if fares is None:
+            single = with_passengers(args, 1)
+            page = self.fetch(script.create_url_parameters(single), *fetch_args, **fetch_kwargs)
+            fares = script.extract_flights(page, single)
+
+            with self._lock:
+                self._fares[key] = fares
+
+        return scale_fares(fares, args.passengers)
+
+    def clear(self, args: Optional[argparse.Namespace] = None) -> None:
+        """Forget fares for args or all fares if args is None."""
+        with self._lock:
+            if args is None:
+                self._fares.clear()
+            else:
+                self._fares.pop(self.make_key(args), None)
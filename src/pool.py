@@ -0,0 +1,250 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+import requests
+import src.script as script
+from src.cache import QuoteCache
+from src.fetch import Fetcher
+from src.parser import iter_quote_rows
+from src.search import DEFAULT_CONCURRENCY, WINDOW_FACTOR, SearchQuery, SearchResult, create_session
+
+
+# Number of pages sent to worker at once, amortizes pickling and IPC
+DEFAULT_CHUNK_SIZE = 16
+
+
+class PageJob(NamedTuple):
+    """Downloaded page and query whose flights are extracted from it."""
+
+    query: SearchQuery
+    body: Union[bytes, str]
+    encoding: Optional[str] = None
+
+
+def parse_job(job: PageJob) -> SearchResult:
+    """Extract flights matching query from page, runs in worker process.
+
+    Arguments:
+        job -- page and query.
+
+    Returns:
+        SearchResult -- flights or parsing error.
+    """
+    try:
+        flights = script.match_flights(iter_quote_rows((job.body,), job.encoding), job.query)
+    except (ValueError, IndexError) as error:
+        return SearchResult(job.query, None, error)
+
+    return SearchResult(job.query, flights, status=script.PARSED)
+
+
+def parse_jobs(jobs: List[PageJob]) -> List[SearchResult]:
+    """Parse chunk of pages in one worker call."""
+    return [parse_job(job) for job in jobs]
+
+
+class ParserPool:
+    """Process pool extracting flights from pages in parallel.
+
+    Parsing holds the GIL, so pages are parsed in worker processes while
+    the main process keeps downloading. Workers return Flight records,
+    not lxml trees.
+    """
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """Create pool, worker processes start with the first page.
+
+        Workers are started by forkserver or spawn, not fork: they start
+        while download threads are running and fork would copy locks held
+        by those threads.
+
+        Arguments:
+            workers -- number of worker processes, number of CPUs if None
+                and parsing in the calling process if 0.
+            chunk_size -- max number of pages sent to worker at once.
+        """
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.chunk_size = chunk_size
+        self.executor = None
+
+        if self.workers:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self.executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context(method)
+            )
+
+    def map(self, jobs: Iterable[PageJob], ordered: bool = True) -> Iterator[SearchResult]:
+        """Parse many pages.
+
+        Arguments:
+            jobs -- pages and queries.
+            ordered -- yield results in order of jobs, otherwise in order
+                of completion of chunks.
+
+        Yields:
+            SearchResult -- flights or parsing error for every job.
+        """
+        if self.executor is None:
+            yield from map(parse_job, jobs)
+            return
+
+        jobs = iter(jobs)
+        chunks = iter(lambda: list(itertools.islice(jobs, self.chunk_size)), [])
+
+        if not ordered:
+            futures = [self.executor.submit(parse_jobs, chunk) for chunk in chunks]
+
+            for future in as_completed(futures):
+                yield from future.result()
+
+            return
+
+        # Jobs are read lazily, two chunks per worker keep workers busy
+        futures = deque()
+
+        for chunk in chunks:
+            futures.append(self.executor.submit(parse_jobs, chunk))
+
+            if len(futures) >= 2 * self.workers:
+                yield from futures.popleft().result()
+
+        while futures:
+            yield from futures.popleft().result()
+
+    async def parse(self, job: PageJob) -> SearchResult:
+        """Parse one page without blocking event loop."""
+        if self.executor is None:
+            return parse_job(job)
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, parse_job, job)
+
+    async def parse_many(self, jobs: List[PageJob]) -> List[SearchResult]:
+        """Parse chunk of pages in one worker call without blocking event loop."""
+        if self.executor is None:
+            return parse_jobs(jobs)
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, parse_jobs, jobs)
+
+    def close(self) -> None:
+        """Stop worker processes."""
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def fetch_job(
+        query: SearchQuery,
+        session: Fetcher,
+        url: str = script.QUOTES_URL,
+        cache: Optional[QuoteCache] = None
+) -> PageJob:
+    """Check route and download page for query.
+
+    Raises:
+        KeyError -- unavailable route or dates.
+        ValueError -- departure date is later than return date.
+        requests.RequestException -- page could not be downloaded.
+    """
+    script.check_search(query, session)
+    page = script.fetch_quotes_page(script.create_url_parameters(query), session, url, cache)
+
+    return PageJob(query, page)
+
+
+async def search_parallel(
+        queries: Iterable[SearchQuery],
+        pool: ParserPool,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        session: Optional[Fetcher] = None,
+        url: str = script.QUOTES_URL,
+        cache: Optional[QuoteCache] = None,
+        ordered: bool = False
+) -> AsyncIterator[SearchResult]:
+    """Download pages in threads and parse them in worker processes.
+
+    Downloaded pages are sent to workers in chunks of up to
+    pool.chunk_size pages. Smaller chunk is sent only when some worker
+    would be idle otherwise or all pages are downloaded. Like search_many,
+    queries are taken from iterable only when there is room for them in
+    window of concurrency * WINDOW_FACTOR downloads.
+
+    Arguments:
+        queries -- search parameters.
+        pool -- parser workers.
+        concurrency -- max number of simultaneous requests.
+        session -- shared session, created with pool of concurrency
+            connections if None.
+        url -- address of quote3.aspx.
+        cache -- cache of downloaded pages shared by all queries.
+        ordered -- yield results in order of queries, otherwise in order
+            of completion.
+
+    Yields:
+        SearchResult -- flight or error for every query.
+    """
+    queries = enumerate(queries)
+    own_session = session is None
+    session = session or create_session(concurrency)
+    loop = asyncio.get_running_loop()
+    # Results by index of query, waiting for their turn if ordered
+    results: Dict[int, SearchResult] = {}
+    next_index = 0
+    chunk: List[Tuple[int, PageJob]] = []
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            downloads: Dict[asyncio.Future, Tuple[int, SearchQuery]] = {}
+            parsing: Dict[asyncio.Future, List[int]] = {}
+
+            def submit(number: int) -> None:
+                for index, query in itertools.islice(queries, number):
+                    future = loop.run_in_executor(executor, fetch_job, query, session, url, cache)
+                    downloads[future] = index, query
+
+            submit(concurrency * WINDOW_FACTOR)
+
+            while downloads or parsing or chunk:
+                if chunk and (
+                        len(chunk) >= pool.chunk_size or not downloads
+                        or len(parsing) < max(pool.workers, 1)
+                ):
+                    indexes, jobs = zip(*chunk)
+                    parsing[asyncio.ensure_future(pool.parse_many(list(jobs)))] = list(indexes)
+                    chunk = []
+
+                done, _ = await asyncio.wait(
+                    [*downloads, *parsing], return_when=asyncio.FIRST_COMPLETED
+                )
+
+                for future in done:
+                    if future in downloads:
+                        index, query = downloads.pop(future)
+
+                        try:
+                            chunk.append((index, future.result()))
+                        except (KeyError, ValueError, requests.RequestException) as error:
+                            results[index] = SearchResult(query, None, error)
+                    else:
+                        results.update(zip(parsing.pop(future), future.result()))
+
+                submit(concurrency * WINDOW_FACTOR - len(downloads))
+
+                if ordered:
+                    while next_index in results:
+                        yield results.pop(next_index)
+                        next_index += 1
+                else:
+                    for index in list(results):
+                        yield results.pop(index)
+    finally:
+        if own_session:
+            session.close()
@@ -0,0 +1,196 @@
+import sys
+import threading
+import time
+from typing import Dict, Any, Callable, IO, List, NamedTuple, Optional
+
+
+# Stages of one search in pipeline order, used for ordering the report
+STAGES = ('cache', 'fetch', 'decode', 'parse', 'extract', 'format')
+
+
+class StageEvent(NamedTuple):
+    """Finished stage or counter increment passed to hooks.
+
+    seconds is exclusive time of the stage, time of stages nested in it
+    is not included. Counter increments have zero seconds.
+    """
+
+    name: str
+    seconds: float
+    count: int = 1
+
+
+Hook = Callable[[StageEvent], None]
+
+
+class _NullStage:
+    """Stage used when profiling is off, costs one method call."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """Timer of one stage run, excludes time of nested stages."""
+
+    __slots__ = ('profiler', 'name', 'start', 'children')
+
+    def __init__(self, profiler: 'Profiler', name: str):
+        self.profiler = profiler
+        self.name = name
+        self.children = 0.0
+
+    def __enter__(self):
+        self.profiler._stack().append(self)
+        self.start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        stack = self.profiler._stack()
+        stack.pop()
+
+        if stack:
+            stack[-1].children += elapsed
+
+        self.profiler._emit(StageEvent(self.name, elapsed - self.children))
+
+        return False
+
+
+class Profiler:
+    """Stage timers and counters of the search pipeline.
+
+    Stages are measured only when profiler is enabled or has hooks,
+    otherwise stage and count do nothing.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.hooks: List[Hook] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._seconds: Dict[str, float] = {}
+        self._calls: Dict[str, int] = {}
+        self._profile = None
+        self._output = None
+
+    @property
+    def active(self) -> bool:
+        return self.enabled or bool(self.hooks)
+
+    def _stack(self) -> List[_Stage]:
+        stack = getattr(self._local, 'stack', None)
+
+        if stack is None:
+            stack = self._local.stack = []
+
+        return stack
+
+    def _emit(self, event: StageEvent) -> None:
+        if self.enabled:
+            with self._lock:
+                self._seconds[event.name] = self._seconds.get(event.name, 0.0) + event.seconds
+                self._calls[event.name] = self._calls.get(event.name, 0) + event.count
+
+        for hook in self.hooks:
+            hook(event)
+
+    def stage(self, name: str):
+        """Return context manager measuring one run of stage."""
+        if not self.active:
+            return _NULL_STAGE
+
+        return _Stage(self, name)
+
+    def count(self, name: str, count: int = 1) -> None:
+        """Increase counter, e.g. number of parsed rows."""
+        if self.active:
+            self._emit(StageEvent(name, 0.0, count))
+
+    def add_hook(self, hook: Hook) -> None:
+        """Call hook with every StageEvent, e.g. to forward it to metrics collector."""
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: Hook) -> None:
+        self.hooks.remove(hook)
+
+    def enable(self, output: Optional[str] = None) -> None:
+        """Start collecting stage times, optionally run cProfile too.
+
+        Arguments:
+            output -- file for pstats data of cProfile, no cProfile if None.
+        """
+        self.enabled = True
+
+        if output is not None:
+            import cProfile
+
+            self._output = output
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return total seconds and number of calls of every stage or counter."""
+        with self._lock:
+            names = sorted(
+                self._seconds,
+                key=lambda name: (STAGES.index(name) if name in STAGES else len(STAGES), name)
+            )
+
+            return {
+                name: {'seconds': self._seconds[name], 'calls': self._calls[name]}
+                for name in names
+            }
+
+    def reset(self) -> None:
+        """Forget collected times and counters."""
+        with self._lock:
+            self._seconds.clear()
+            self._calls.clear()
+
+    def format_report(self) -> str:
+        """Return table of stages with total time, share and number of calls."""
+        snapshot = self.snapshot()
+        total = sum(stage['seconds'] for stage in snapshot.values())
+        lines = ['{:<10} {:>10} {:>7} {:>7}'.format('Stage', 'Time, ms', 'Share', 'Calls')]
+
+        for name, stage in snapshot.items():
+            share = stage['seconds'] / total if total else 0.0
+            lines.append('{:<10} {:>10.3f} {:>6.1%} {:>7}'.format(
+                name, stage['seconds'] * 1000, share, stage['calls']
+            ))
+
+        lines.append('{:<10} {:>10.3f}'.format('Total', total * 1000))
+
+        return '\n'.join(lines)
+
+    def finish(self, stream: IO[str] = sys.stderr) -> None:
+        """Stop profiling, dump cProfile data and print report if enabled."""
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self._output)
+            self._profile = None
+
+        if self.enabled:
+            print(self.format_report(), file=stream)
+
+            if self._output is not None:
+                print(f'cProfile data saved to {self._output}', file=stream)
+
+            self.enabled = False
+            self._output = None
+
+
+PROFILER = Profiler()
+stage = PROFILER.stage
+count = PROFILER.count
+add_hook = PROFILER.add_hook
+remove_hook = PROFILER.remove_hook
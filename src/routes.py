@@ -0,0 +1,148 @@
+import json
+import os
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+DEFAULT_ROUTES_PATH = os.environ.get(
+    'FLIGHTS_INFO_ROUTES', os.path.join(os.path.dirname(__file__), 'data', 'routes.json')
+)
+
+Route = Tuple[str, str]
+
+
+class RouteIndex:
+    """Schedule of available routes with sorted flight dates per route."""
+
+    def __init__(self, schedule: Dict[Route, Iterable[date]]):
+        """Build index.
+
+        Arguments:
+            schedule -- flight dates by (departure city, destination city).
+        """
+        self._dates = {route: sorted(set(dates)) for route, dates in schedule.items()}
+        self._description = None
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_ROUTES_PATH) -> 'RouteIndex':
+        """Load schedule from JSON file.
+
+        File contains object with "routes" list, every route is an object
+        with "dep", "dest" and "dates" in format YYYY-MM-DD.
+
+        Arguments:
+            path -- path to JSON file.
+
+        Returns:
+            RouteIndex -- loaded schedule.
+        """
+        with open(path) as routes_file:
+            routes = json.load(routes_file)['routes']
+
+        return cls({
+            (route['dep'], route['dest']): map(date.fromisoformat, route['dates'])
+            for route in routes
+        })
+
+    def __contains__(self, route: Route) -> bool:
+        return route in self._dates
+
+    def __len__(self) -> int:
+        return len(self._dates)
+
+    def routes(self) -> List[Route]:
+        """Return all routes in order of loading."""
+        return list(self._dates)
+
+    def dates(self, dep_city: str, dest_city: str) -> List[date]:
+        """Return sorted flight dates of route, empty list for unknown route."""
+        return self._dates.get((dep_city, dest_city), [])
+
+    def describe_routes(self) -> str:
+        """Return listing of routes like '(CPH, BOJ),(BOJ, CPH)'."""
+        if self._description is None:
+            self._description = ','.join(
+                f'({dep_city}, {dest_city})' for dep_city, dest_city in self._dates
+            )
+
+        return self._description
+
+    def has_flight(self, dep_city: str, dest_city: str, flight_date: date) -> bool:
+        """Check whether route has flight on flight_date."""
+        dates = self.dates(dep_city, dest_city)
+        position = bisect_left(dates, flight_date)
+
+        return position < len(dates) and dates[position] == flight_date
+
+    def nearest_dates(
+            self, dep_city: str, dest_city: str, flight_date: date
+    ) -> Tuple[Optional[date], Optional[date]]:
+        """Find closest flight dates around flight_date.
+
+        Arguments:
+            dep_city -- departure city.
+            dest_city -- destination city.
+            flight_date -- desired flight date.
+
+        Returns:
+            tuple -- latest date before and earliest date after flight_date,
+                None if there is no such date.
+        """
+        dates = self.dates(dep_city, dest_city)
+        before = bisect_left(dates, flight_date)
+        after = bisect_right(dates, flight_date)
+
+        return (
+            dates[before - 1] if before > 0 else None,
+            dates[after] if after < len(dates) else None
+        )
+
+    def dates_between(
+            self, dep_city: str, dest_city: str, start: date, end: date
+    ) -> List[date]:
+        """Return flight dates of route from start to end inclusive."""
+        dates = self.dates(dep_city, dest_city)
+
+        return dates[bisect_left(dates, start):bisect_right(dates, end)]
+
+    def round_trips(
+            self,
+            dep_city: str,
+            dest_city: str,
+            start: date = date.min,
+            end: date = date.max,
+            min_stay: int = 0,
+            max_stay: Optional[int] = None
+    ) -> Iterator[Tuple[date, date]]:
+        """Enumerate pairs of outbound and inbound dates.
+
+        Arguments:
+            dep_city -- departure city.
+            dest_city -- destination city.
+            start -- earliest outbound date.
+            end -- latest inbound date.
+            min_stay -- min number of days between flights.
+            max_stay -- max number of days between flights, unlimited if None.
+
+        Yields:
+            tuple -- outbound and inbound dates sorted by outbound date.
+        """
+        inbound_dates = self.dates(dest_city, dep_city)
+
+        for outbound in self.dates_between(dep_city, dest_city, start, end):
+            first = bisect_left(inbound_dates, outbound + timedelta(days=min_stay))
+            last = bisect_right(inbound_dates, end)
+
+            if max_stay is not None:
+                last = min(last, bisect_right(inbound_dates, outbound + timedelta(days=max_stay)))
+
+            for inbound in inbound_dates[first:last]:
+                yield outbound, inbound
+
+
+@lru_cache(maxsize=None)
+def load_route_index(path: str = DEFAULT_ROUTES_PATH) -> RouteIndex:
+    """Load route index once per path."""
+    return RouteIndex.from_file(path)
@@ -1,34 +1,40 @@
 import sys
 import argparse
-from datetime import datetime, timedelta
-from typing import Dict, Any, List
-import lxml.html
-from lxml.html import HtmlElement
-import requests
-
-
+import contextlib
+import hashlib
+import threading
+from datetime import date, datetime
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Any, Iterable, List, Optional, Tuple, Union
+from src.cache import DEFAULT_TTL, ParsedPage, QuoteCache
+from src.flight import Flight, parse_price
+from src.output import TableWriter
+from src.profiling import PROFILER, count, stage
+from src.routes import load_route_index
+from src.times import duration_minutes, format_minutes, parse_minutes
+
+# Network and parsing stacks are imported by functions which need them,
+# so invalid arguments are rejected without loading them
+if TYPE_CHECKING:
+    import requests
+    from lxml.html import HtmlElement
+
+
+QUOTES_URL = 'https://apps.penguin.bg/fly/quote3.aspx'
+# Bytes of response passed to parser at once
+CHUNK_SIZE = 16 * 1024
+# How flights of revalidate_flights were obtained: server confirmed cached
+# page is current, page did not change since it was parsed or page was parsed
+REVALIDATED = 'revalidated'
+UNCHANGED = 'unchanged'
+PARSED = 'parsed'
+
+# Rows of quotes tables matched and skipped by match_flights in this process,
+# counted even when profiling is off
+_EXTRACTION_COUNTS = {'rows_matched': 0, 'rows_skipped': 0}
+_EXTRACTION_LOCK = threading.Lock()
 VALID_CITY_CODES = frozenset(('CPH', 'BLL', 'PDV', 'BOJ', 'SOF', 'VAR'))
 
-# All available routes and dates
-DATES = {
-    ('CPH', 'BOJ'): frozenset((
-        '26.06.2019', '03.07.2019', '10.07.2019', '17.07.2019', '24.07.2019',
-        '31.07.2019', '07.08.2019'
-    )),
-    ('BOJ', 'CPH'): frozenset((
-        '27.06.2019', '04.07.2019', '11.07.2019', '18.07.2019', '25.07.2019',
-        '01.08.2019', '08.08.2019'
-    )),
-    ('BOJ', 'BLL'): frozenset((
-        '01.07.2019', '08.07.2019', '15.07.2019', '22.07.2019', '29.07.2019',
-        '05.08.2019'
-    )),
-    ('BLL', 'BOJ'): frozenset((
-        '01.07.2019', '08.07.2019', '15.07.2019', '22.07.2019', '29.07.2019',
-        '05.08.2019'
-    ))
-}
-
 
 def calculate_flight_duration(departure_time: str, arrival_time: str) -> str:
     """Calculate flight duration, max duration is 24:00.
@@ -37,23 +43,16 @@ def calculate_flight_duration(departure_time: str, arrival_time: str) -> str:
         departure_time -- time of departing from departure city.
         arrival_time -- time of arrival to destination city.
 
+    Raises:
+        ValueError -- invalid time.
+
     Returns:
         str -- flight duration in format hh:mm.
     """
-    dep_time = datetime.strptime(departure_time, '%H:%M')
-    arr_time = datetime.strptime(arrival_time, '%H:%M')
-    duration = timedelta(
-        hours=arr_time.hour - dep_time.hour,
-        minutes=arr_time.minute - dep_time.minute
+    return format_minutes(
+        duration_minutes(parse_minutes(departure_time), parse_minutes(arrival_time))
     )
 
-    hours = duration.seconds // 3600
-    minutes = (duration.seconds - hours * 3600) // 60
-    formatted_hours = hours if hours >= 10 else f'0{hours}'
-    formatted_minutes = minutes if minutes >= 10 else f'0{minutes}'
-
-    return f'{formatted_hours}:{formatted_minutes}'
-
 
 def check_route(dep_city: str, dest_city: str, flight_date: datetime) -> None:
     """Search route based of passed args in database.
@@ -66,17 +65,68 @@ def check_route(dep_city: str, dest_city: str, flight_date: datetime) -> None:
         KeyError -- unavailable route.
         KeyError -- no available flights for passed dates.
     """
-    current_route = (dep_city, dest_city)
+    routes = load_route_index()
+
+    if (dep_city, dest_city) not in routes:
+        raise KeyError(f'Route not found. Available routes:{routes.describe_routes()}')
 
-    if current_route not in DATES:
-        available_routes = ','.join(
-            f'({dep_city}, {dest_city})' for dep_city, dest_city in DATES
+    if isinstance(flight_date, datetime):
+        flight_date = flight_date.date()
+
+    if not routes.has_flight(dep_city, dest_city, flight_date):
+        nearest = ', '.join(
+            f'{nearest_date:%d.%m.%Y}'
+            for nearest_date in routes.nearest_dates(dep_city, dest_city, flight_date)
+            if nearest_date is not None
         )
-        raise KeyError(f'Route not found. Available routes:{available_routes}')
+        raise KeyError(f'Flights for chosen dates not found. Nearest available dates: {nearest}')
+
+
+def check_search(
+        args: argparse.Namespace,
+        session: Optional[Any] = None,
+        parameters: Optional[Dict[str, Any]] = None
+) -> None:
+    """Check trip unless session replays recorded response of the search.
+
+    Recorded responses stay replayable after their dates leave the schedule.
+
+    Arguments:
+        args -- flight parameters.
+        session -- session which will download the page.
+        parameters -- url parameters, created from args if None.
+
+    Raises:
+        KeyError -- unavailable route or no available flights for passed dates.
+        ValueError -- departure date is later than return date.
+    """
+    if session is not None:
+        from src.archive import ReplaySession
+
+        if isinstance(session, ReplaySession)\
+                and (parameters or create_url_parameters(args)) in session.archive:
+            return
+
+    check_trip(args)
+
+
+def check_trip(args: argparse.Namespace) -> None:
+    """Check both directions of the trip.
+
+    Arguments:
+        args -- flight parameters.
+
+    Raises:
+        KeyError -- unavailable route or no available flights for passed dates.
+        ValueError -- departure date is later than return date.
+    """
+    check_route(args.dep_city, args.dest_city, args.dep_date)
+
+    if args.return_date is not None:
+        if args.dep_date > args.return_date:
+            raise ValueError('Departure date is in the past in comparison with return date')
 
-    if flight_date.strftime('%d.%m.%Y') not in DATES[current_route]:
-        message = 'Flights for chosen dates not found. Available dates: '
-        raise KeyError(f'{message}{", ".join(DATES[current_route])}')
+        check_route(args.dest_city, args.dep_city, args.return_date)
 
 
 def create_url_parameters(args: argparse.Namespace) -> Dict[str, Any]:
@@ -108,95 +158,340 @@ def create_url_parameters(args: argparse.Namespace) -> Dict[str, Any]:
     return parameters
 
 
-def find_flight_info(arguments: List) -> Dict[str, Any]:
+def extract_flights(page: str, args: argparse.Namespace) -> Dict[str, Flight]:
+    """Find flights matching search parameters on quote3.aspx page.
+
+    Arguments:
+        page -- HTML page with flywiz_tblQuotes table.
+        args -- flight parameters.
+
+    Raises:
+        ValueError -- page or flight date could not be parsed.
+
+    Returns:
+        dict -- Available flights by direction.
+    """
+    import lxml.html
+    from src.parser import parse_quotes_table
+
+    try:
+        with stage('parse'):
+            html_page = lxml.html.document_fromstring(page)
+    except ValueError:
+        message = 'Could not parse response, please try again. '
+
+        if args.verbose:
+            raise ValueError(message + page)
+
+        raise ValueError(message + 'Use --verbose for more details.')
+
+    with stage('parse'):
+        # First element of the table contains tbody => full table
+        table = html_page.xpath('//table[@id="flywiz_tblQuotes"]')[0]
+        flights = parse_quotes_table(table)
+
+    with stage('extract'):
+        return match_flights(flights, args)
+
+
+def fetch_quotes_page(
+        parameters: Dict[str, Any],
+        session: Optional['requests.Session'] = None,
+        url: str = QUOTES_URL,
+        cache: Optional[QuoteCache] = None
+) -> str:
+    """Download page with available flights.
+
+    Arguments:
+        parameters -- url parameters created by create_url_parameters.
+        session -- session or Fetcher for reusing connections, shared
+            Fetcher if None.
+        url -- address of quote3.aspx.
+        cache -- cache of downloaded pages, always download if None.
+
+    Returns:
+        str -- HTML page.
+    """
+    from src.fetch import default_fetcher
+
+    if cache is not None:
+        with stage('cache'):
+            page = cache.get(parameters)
+
+        if page is not None:
+            return page
+
+    with stage('fetch'):
+        response = (session or default_fetcher()).get(url, params=parameters)
+
+    with stage('decode'):
+        page = response.text
+
+    if cache is not None and response.ok:
+        with stage('cache'):
+            cache.put(parameters, page)
+
+    return page
+
+
+def fetch_quotes_stream(
+        parameters: Dict[str, Any],
+        session: Optional['requests.Session'] = None,
+        url: str = QUOTES_URL,
+        cache: Optional[QuoteCache] = None
+) -> Tuple[Iterable[Union[bytes, str]], Optional[str]]:
+    """Start downloading page with available flights without reading body.
+
+    Arguments:
+        parameters -- url parameters created by create_url_parameters.
+        session -- session or Fetcher for reusing connections, shared
+            Fetcher if None.
+        url -- address of quote3.aspx.
+        cache -- cache of downloaded pages, always download if None.
+
+    Returns:
+        tuple -- iterable of page chunks and page encoding.
+    """
+    from src.fetch import default_fetcher
+
+    if cache is not None:
+        with stage('cache'):
+            page = cache.get(parameters)
+
+        if page is not None:
+            return (page,), None
+
+    with stage('fetch'):
+        response = (session or default_fetcher()).get(url, params=parameters, stream=True)
+
+    def read_chunks():
+        chunks = []
+
+        with response:
+            content = response.iter_content(CHUNK_SIZE)
+
+            while True:
+                # Stage must not span yield, other stages run while suspended
+                with stage('fetch'):
+                    chunk = next(content, None)
+
+                if chunk is None:
+                    break
+
+                if cache is not None:
+                    chunks.append(chunk)
+
+                try:
+                    yield chunk
+                except GeneratorExit:
+                    if cache is None:
+                        raise
+
+                    # Flights were found before end of page, the rest is read only for cache
+                    with stage('fetch'):
+                        chunks.extend(content)
+
+                    break
+
+        if cache is not None and response.ok:
+            with stage('decode'):
+                page = b''.join(chunks).decode(response.encoding or 'utf-8')
+
+            with stage('cache'):
+                cache.put(parameters, page)
+
+    return read_chunks(), response.encoding
+
+
+def find_flights(arguments: List) -> Dict[str, Flight]:
     """Handle arguments and search for available flights on flybulgarien.dk.
 
     Arguments:
         arguments -- command line arguments.
 
     Returns:
-        dict -- Available information about flights.
+        dict -- Available flights by direction.
     """
     args = parse_arguments(arguments)
 
-    try:
-        check_route(args.dep_city, args.dest_city, args.dep_date)
-        if args.return_date is not None:
-            if args.dep_date > args.return_date:
-                raise ValueError('Departure date is in the past in comparison with return date')
+    if args.profile:
+        PROFILER.enable(args.profile_output)
 
-            check_route(args.dest_city, args.dep_city, args.return_date)
-    except KeyError as key_error:
-        if args.verbose is not None:
-            raise key_error
+    if args.purge_cache:
+        with QuoteCache() as cache:
+            cache.purge()
 
-        print(sys.exc_info()[1])
-        sys.exit()
+    parameters = create_url_parameters(args)
 
-    response = requests.get(
-        'https://apps.penguin.bg/fly/quote3.aspx',
-        params=create_url_parameters(args)
-    )
+    if args.derive_passengers:
+        # Price on the page is per person, so one passenger page fits all
+        parameters['paxcount'] = 1
 
-    try:
-        html_page = lxml.html.document_fromstring(response.text)
-    except ValueError:
-        message = 'Could not parse response, please try again. '
+    if args.record or args.replay:
+        from src.archive import archive_session
 
-        if args.verbose:
-            raise ValueError(message + response.text)
+        # Archive bypasses cache, so every request is recorded or replayed
+        session_context = archive_session(args.record, args.replay)
+    else:
+        session_context = contextlib.nullcontext()
 
-        raise ValueError(message + 'Use --verbose for more details.')
+    with session_context as session:
+        try:
+            check_search(args, session, parameters)
+        except KeyError as key_error:
+            if args.verbose is not None:
+                raise key_error
 
-    # First element of the table contains tbody => full table
-    table = html_page.xpath('//table[@id="flywiz_tblQuotes"]')[0]
-    meta_info_about_flights = table.xpath('tr[contains(@id,"rinf")]')
-    # IDs differ only in last 5 elements
-    flight_ids = tuple(item[-5:] for item in table.xpath('./tr[contains(@id,"rinf")]/@id'))
-    flights = dict(zip(flight_ids, meta_info_about_flights))
+            print(sys.exc_info()[1])
+            sys.exit()
 
-    flights_data = {}
+        if session is not None:
+            flights = stream_flights(parameters, args, session)
+        elif args.no_cache:
+            flights = stream_flights(parameters, args)
+        else:
+            with QuoteCache(ttl=args.cache_ttl) as cache:
+                # Status is counted by revalidate_flights and shown by --profile
+                flights, _ = revalidate_flights(parameters, args, cache=cache)
 
-    for flight_id, flight_info in flights.items():
-        # flight_info[0] contains unnecessary info about radio button
-        try:
-            flight_date = datetime.strptime(flight_info[1].text, '%a, %d %b %y')
-        except BaseException:
-            raise ValueError('Could not correctly parse flight date.')
+    if args.history:
+        from src.history import FareHistory
+
+        with FareHistory() as history:
+            history.record(flights.values(), args.passengers)
+
+    return flights
+
+
+def flight_date_texts(flight_date: datetime) -> Tuple[str, str]:
+    """Return flight date as written on the page, with and without zero padded day."""
+    return f'{flight_date:%a}, {flight_date.day} {flight_date:%b %y}', f'{flight_date:%a, %d %b %y}'
+
+
+def match_flights(
+        flights: Iterable[Dict[str, Any]],
+        args: argparse.Namespace
+) -> Dict[str, Flight]:
+    """Choose outbound and inbound flights matching search parameters.
+
+    Rows are compared with searched dates and cities by their raw text
+    ignoring case, only matching rows are converted into Flight. The first
+    matching row of every direction wins and later rows with the same date
+    and cities are ignored, like rows with other or unreadable dates.
+    Scanning stops as soon as every searched direction is found, so the
+    rest of the page is not parsed.
+    Matched and skipped rows are counted by extraction_stats and passed to
+    profiler as 'rows_matched' and 'rows_skipped'.
+
+    Arguments:
+        flights -- flights grouped by parse_quotes_table or iter_quote_rows.
+        args -- flight parameters.
+
+    Returns:
+        dict -- Available flights by direction.
+    """
+    # (date text, departure city, destination city): (direction, date)
+    targets = {}
+
+    for direction, flight_date, dep_city, dest_city in (
+            ('Outbound', args.dep_date, args.dep_city, args.dest_city),
+            ('Inbound', args.return_date, args.dest_city, args.dep_city)
+    ):
+        if flight_date is not None:
+            for text in flight_date_texts(flight_date):
+                targets.setdefault(
+                    (text.lower(), dep_city.upper(), dest_city.upper()), (direction, flight_date)
+                )
+
+    directions = len({direction for direction, _ in targets.values()})
+    flights_data = {}
+    scanned = 0
 
+    for flight in flights:
+        scanned += 1
+        # flight_info[0] contains unnecessary info about radio button,
         # IATA city codes are at the end of flight_info[4].text
-        dep_city = flight_info[4].text[-4:-1]
-        dest_city = flight_info[5].text[-4:-1]
-
-        if flight_date == args.dep_date and args.dep_city == dep_city\
-                and args.dest_city == dest_city:
-            # Parsed_flight_info list structure: info about radio button, date,
-            # departure time, arrival time, departure city, destination city
-            flights_data['Outbound'] = write_flight_information(
-                *flight_info[1:], flight_id, table, args.passengers
-            )
-        elif flight_date == args.return_date and args.dep_city in dest_city\
-                and args.dest_city in dep_city:
-            flights_data['Inbound'] = write_flight_information(
-                *flight_info[1:], flight_id, table, args.passengers
-            )
+        flight_info = flight['info']
+        target = targets.get((
+            ' '.join((flight_info[1].text or '').split()).lower(),
+            flight_info[4].text[-4:-1].upper(), flight_info[5].text[-4:-1].upper()
+        ))
+
+        if target is None or target[0] in flights_data:
+            continue
+
+        direction, flight_date = target
+        # Parsed_flight_info list structure: info about radio button, date,
+        # departure time, arrival time, departure city, destination city
+        flights_data[direction] = write_flight_information(
+            flight_date.date(), *flight_info[2:6],
+            flight['price_and_extra_info'], args.passengers
+        )
+
+        if len(flights_data) == directions:
+            break
+
+    skipped = scanned - len(flights_data)
+
+    with _EXTRACTION_LOCK:
+        _EXTRACTION_COUNTS['rows_matched'] += len(flights_data)
+        _EXTRACTION_COUNTS['rows_skipped'] += skipped
+
+    count('rows_matched', len(flights_data))
+    count('rows_skipped', skipped)
 
     return flights_data
 
 
-def parse_arguments(args: List) -> argparse.Namespace:
-    """Handle command line arguments using argparse.
+def extraction_stats(reset: bool = False) -> Dict[str, Any]:
+    """Summarize rows scanned by match_flights in this process.
 
-    Arguments:
-        args -- command line arguments.
+    Rows parsed in ParserPool worker processes are counted by the workers.
 
-    Raises:
-        argparse.ArgumentTypeError -- invalid argument type.
+    Arguments:
+        reset -- start counting from zero after reading.
 
     Returns:
-        argparse.Namespace -- parsed arguments of valid type.
+        dict -- numbers of matched and skipped rows and share of matched rows.
     """
-    argument_parser = argparse.ArgumentParser(description="Flight informer")
+    with _EXTRACTION_LOCK:
+        matched = _EXTRACTION_COUNTS['rows_matched']
+        skipped = _EXTRACTION_COUNTS['rows_skipped']
+
+        if reset:
+            _EXTRACTION_COUNTS.update(rows_matched=0, rows_skipped=0)
+
+    scanned = matched + skipped
+
+    return {
+        'rows_matched': matched,
+        'rows_skipped': skipped,
+        'hit_rate': matched / scanned if scanned else 0.0
+    }
+
+
+@lru_cache(maxsize=None)
+def cache_arguments() -> argparse.ArgumentParser:
+    """Build parent parser with response cache options shared by commands."""
+    argument_parser = argparse.ArgumentParser(add_help=False)
+    argument_parser.add_argument(
+        '--no-cache', help='always download flights, do not create or read response cache',
+        action='store_true'
+    )
+    argument_parser.add_argument(
+        '--cache-ttl', help='seconds after which cached response expires',
+        type=float, default=DEFAULT_TTL
+    )
+
+    return argument_parser
+
+
+@lru_cache(maxsize=None)
+def build_argument_parser() -> argparse.ArgumentParser:
+    """Build parser of command line arguments once, it is reused by every call."""
+    argument_parser = argparse.ArgumentParser(
+        description="Flight informer", parents=[cache_arguments()]
+    )
 
     argument_parser.add_argument(
         'dep_city', help='departure city IATA code', type=validate_city_code
@@ -205,59 +500,227 @@ def parse_arguments(args: List) -> argparse.Namespace:
         'dest_city', help='destination city IATA code', type=validate_city_code
     )
     argument_parser.add_argument(
-        'dep_date', help='departure flight date', type=validate_date
+        'dep_date', help='departure flight date', type=parse_flight_date
     )
     argument_parser.add_argument(
         'passengers', help='total number of passengers',
         type=validate_passengers
     )
     argument_parser.add_argument(
-        '-return_date', help='return flight date', type=validate_date
+        '-return_date', help='return flight date', type=parse_flight_date
     )
     argument_parser.add_argument(
         '-v', '--verbose', help='verbose output about errors',
         action='store_true'
     )
+    argument_parser.add_argument(
+        '--purge-cache', help='remove all cached responses before search',
+        action='store_true'
+    )
+    argument_parser.add_argument(
+        '--derive-passengers',
+        help='fetch fares for one passenger and multiply them locally',
+        action='store_true'
+    )
+    argument_parser.add_argument(
+        '--profile', help='print time spent in every stage of search',
+        action='store_true'
+    )
+    argument_parser.add_argument(
+        '--profile-output', help='also save cProfile data to file for pstats',
+        metavar='FILE', default=None
+    )
+    archive = argument_parser.add_mutually_exclusive_group()
+    archive.add_argument(
+        '--record', metavar='ARCHIVE', default=None,
+        help='download flights and append responses to zip archive'
+    )
+    archive.add_argument(
+        '--replay', metavar='ARCHIVE', default=None,
+        help='read responses from zip archive instead of network'
+    )
+    argument_parser.add_argument(
+        '--history', help='append found fares to fare history, see main.py history',
+        action='store_true'
+    )
 
     def raise_value_error(err_msg):
         raise argparse.ArgumentTypeError(err_msg)
 
     argument_parser.error = raise_value_error
 
+    return argument_parser
+
+
+def parse_arguments(args: List) -> argparse.Namespace:
+    """Handle command line arguments using argparse.
+
+    Arguments:
+        args -- command line arguments.
+
+    Raises:
+        argparse.ArgumentTypeError -- invalid argument type.
+
+    Returns:
+        argparse.Namespace -- parsed arguments of valid type.
+    """
+    argument_parser = build_argument_parser()
+
     try:
-        return argument_parser.parse_args(args)
+        args = argument_parser.parse_args(args)
+
+        # Replayed searches were recorded when their dates were ahead
+        if args.replay is None:
+            for name in ('dep_date', 'return_date'):
+                if getattr(args, name) is not None and datetime.today() > getattr(args, name):
+                    argument_parser.error(f'argument {name}: Date in the past')
+
+        return args
     except BaseException:
         print(sys.exc_info()[1])
         sys.exit()
 
 
-def print_flights_information(flights_info: Dict[str, Any]) -> None:
+def print_flights_information(flights_info: Dict[str, Flight]) -> None:
     """Show information about flights.
 
     Arguments:
-        flights_info -- parsed information about flights.
+        flights_info -- parsed flights by direction.
     """
-    # Table header
-    print(
-        '{:<12} {:<17} {:<10} {:<10} {:<15} {:<20} {:<20} {:<13} {:<20}\
-        '.format('Direction', *flights_info['Outbound'].keys())
-    )
-    # Outbound flight
-    print(
-        '{:<12} {:<17} {:<10} {:<10} {:<15} {:<20} {:<20} {:<13} {:<20}\
-        '.format('Outbound', *flights_info['Outbound'].values())
-    )
-    # Inbound flight
-    if 'Inbound' in flights_info:
-        # Last 7 chars of price contains ".00 EUR"
-        total_cost = int(flights_info['Outbound']['Price'][:-7])\
-            + int(flights_info['Inbound']['Price'][:-7])
-
-        print(
-            '{:<12} {:<17} {:<10} {:<10} {:<15} {:<20} {:<20} {:<13} {:<20}\
-            '.format('Inbound', *flights_info['Inbound'].values())
-        )
-        print('{:<12} {:<10}'.format('Total cost', f'{total_cost}.00 EUR'))
+    with TableWriter(sys.stdout) as writer, stage('format'):
+        writer.write_flights(flights_info)
+
+
+def page_digest(page: str) -> str:
+    """Return hash identifying page content."""
+    return hashlib.blake2b(page.encode(), digest_size=16).hexdigest()
+
+
+def revalidate_flights(
+        parameters: Dict[str, Any],
+        args: argparse.Namespace,
+        session: Optional['requests.Session'] = None,
+        url: str = QUOTES_URL,
+        cache: Optional[QuoteCache] = None
+) -> Tuple[Dict[str, Flight], str]:
+    """Get flights without parsing page which did not change since last search.
+
+    Fresh cached page is not downloaded again. Otherwise request is sent with
+    ETag and Last-Modified of the previous page, so server may answer
+    304 Not Modified. Page is parsed only if its digest differs from digest
+    of the page flights were parsed from last time.
+
+    Arguments:
+        parameters -- url parameters created by create_url_parameters.
+        args -- flight parameters.
+        session -- session or Fetcher for reusing connections, shared
+            Fetcher if None.
+        url -- address of quote3.aspx.
+        cache -- cache of pages and parsed flights, always download and
+            parse if None.
+
+    Raises:
+        ValueError -- page or flight date could not be parsed.
+
+    Returns:
+        tuple -- available flights by direction and status: REVALIDATED,
+            UNCHANGED or PARSED.
+    """
+    from src.fetch import default_fetcher
+    from src.parser import iter_quote_rows
+
+    if cache is None:
+        return stream_flights(parameters, args, session, url), PARSED
+
+    # Prices of flights are multiplied by number of passengers while parsing
+    parsed_key = dict(parameters, passengers=args.passengers)
+
+    with stage('cache'):
+        parsed = cache.get_parsed(parsed_key)
+        page = cache.get(parameters)
+
+    if page is None:
+        headers = {}
+
+        if parsed is not None and parsed.etag:
+            headers['If-None-Match'] = parsed.etag
+
+        if parsed is not None and parsed.last_modified:
+            headers['If-Modified-Since'] = parsed.last_modified
+
+        with stage('fetch'):
+            response = (session or default_fetcher()).get(url, params=parameters, headers=headers)
+
+        if response.status_code == 304 and parsed is not None:
+            count(REVALIDATED)
+
+            return parsed.flights, REVALIDATED
+
+        with stage('decode'):
+            page = response.text
+
+        if response.ok:
+            with stage('cache'):
+                cache.put(parameters, page)
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+    else:
+        etag = parsed and parsed.etag
+        last_modified = parsed and parsed.last_modified
+
+    digest = page_digest(page)
+
+    if parsed is not None and parsed.digest == digest:
+        status, flights = UNCHANGED, parsed.flights
+    else:
+        with stage('extract'):
+            status, flights = PARSED, match_flights(iter_quote_rows((page,)), args)
+
+    if status == PARSED or (etag, last_modified) != (parsed.etag, parsed.last_modified):
+        with stage('cache'):
+            cache.put_parsed(parsed_key, ParsedPage(digest, flights, etag, last_modified))
+
+    count(status)
+
+    return flights, status
+
+
+def stream_flights(
+        parameters: Dict[str, Any],
+        args: argparse.Namespace,
+        session: Optional['requests.Session'] = None,
+        url: str = QUOTES_URL,
+        cache: Optional[QuoteCache] = None
+) -> Dict[str, Flight]:
+    """Download page and parse flights while the page is being received.
+
+    Arguments:
+        parameters -- url parameters created by create_url_parameters.
+        args -- flight parameters.
+        session -- session or Fetcher for reusing connections, shared
+            Fetcher if None.
+        url -- address of quote3.aspx.
+        cache -- cache of downloaded pages, always download if None.
+
+    Raises:
+        ValueError -- page could not be parsed.
+
+    Returns:
+        dict -- Available flights by direction.
+    """
+    from src.parser import iter_quote_rows
+
+    chunks, encoding = fetch_quotes_stream(parameters, session, url, cache)
+    rows = iter_quote_rows(chunks, encoding)
+
+    try:
+        # Fetch and parse stages run nested while rows are consumed
+        with stage('extract'):
+            return match_flights(rows, args)
+    finally:
+        # Extraction may stop before end of page, release the response
+        rows.close()
 
 
 def validate_city_code(code: str) -> str:
@@ -280,6 +743,31 @@ def validate_city_code(code: str) -> str:
     return code
 
 
+def parse_flight_date(flight_date: str) -> datetime:
+    """Convert date in format dd.mm.yyyy without strptime, past dates are allowed.
+
+    Arguments:
+        flight_date -- date like 01.07.2019, day and month may have one digit.
+
+    Raises:
+        TypeError -- flight_date is not str.
+        ValueError -- invalid format or date.
+
+    Returns:
+        datetime -- midnight of the date.
+    """
+    if not isinstance(flight_date, str):
+        raise TypeError(f'Date must be str, not {type(flight_date).__name__}')
+
+    parts = flight_date.split('.')
+
+    if len(parts) != 3 or not (0 < len(parts[0]) < 3 and 0 < len(parts[1]) < 3 and len(parts[2]) == 4)\
+            or not all(part.isascii() and part.isdigit() for part in parts):
+        raise ValueError(f"time data {flight_date!r} does not match format '%d.%m.%Y'")
+
+    return datetime(int(parts[2]), int(parts[1]), int(parts[0]))
+
+
 def validate_date(flight_date: str) -> datetime:
     """Validate flight date for correctness.
 
@@ -292,7 +780,7 @@ def validate_date(flight_date: str) -> datetime:
     Returns:
         datetime -- valid flight date.
     """
-    parsed_date = datetime.strptime(flight_date, '%d.%m.%Y')
+    parsed_date = parse_flight_date(flight_date)
 
     if datetime.today() > parsed_date:
         raise argparse.ArgumentTypeError('Date in the past')
@@ -325,46 +813,40 @@ def validate_passengers(passengers: str) -> int:
 
 
 def write_flight_information(
-        date: HtmlElement,
-        dep_time: HtmlElement,
-        arr_time: HtmlElement,
-        dep_city: HtmlElement,
-        dest_city: HtmlElement,
-        flight_id: str,
-        table: HtmlElement,
+        flight_date: date,
+        dep_time: 'HtmlElement',
+        arr_time: 'HtmlElement',
+        dep_city: 'HtmlElement',
+        dest_city: 'HtmlElement',
+        price_and_extra_info: List['HtmlElement'],
         passengers: int
-) -> Dict[str, Any]:
+) -> Flight:
     """Parse flight information.
 
     Arguments:
-        date -- flight date.
+        flight_date -- parsed flight date.
         dep_time -- departure time.
         arr_time -- arrival time.
         dep_city -- full departure city name and IATA code.
         dest_city -- full destination city name and IATA code.
-        flight_id -- ID of current flight.
-        table -- table with full information about flights.
+        price_and_extra_info -- cells with price and additional information.
         passengers -- total number passengers.
     Returns:
-        dict -- parsed flight information.
+        Flight -- parsed flight information.
     """
-    price_and_extra_info = table.xpath(
-        f'./tr[contains(@id,"{flight_id}")and not(contains(@id, "rinf"))]/td[text()]'
-    )
     price = price_and_extra_info[0].text
     extra_info = price_and_extra_info[1].text if len(price_and_extra_info) > 1 else ''
-
-    # price_and_extra_info[0] contains extra "Price: " and "EUR"
-    total_cost = int(price[7:-7]) * passengers
-    flight_duration = calculate_flight_duration(dep_time.text, arr_time.text)
-
-    return {
-        'Date': date.text,
-        'Departure': dep_time.text,
-        'Arrival': arr_time.text,
-        'Flight duration': flight_duration,
-        'From': dep_city.text,
-        'To': dest_city.text,
-        'Price': f'{total_cost}.00 EUR',
-        'Additional information': extra_info
-    }
+    departure = parse_minutes(dep_time.text)
+    arrival = parse_minutes(arr_time.text)
+
+    return Flight(
+        date=flight_date,
+        departure=departure,
+        arrival=arrival,
+        duration=duration_minutes(departure, arrival),
+        # IATA city codes are at the end of city cells
+        dep_city=dep_city.text[-4:-1].upper(),
+        dest_city=dest_city.text[-4:-1].upper(),
+        price=parse_price(price) * passengers,
+        extra_info=extra_info
+    )
@@ -0,0 +1,191 @@
+import argparse
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, AsyncIterator, Iterable, List, NamedTuple, Optional
+import requests
+import src.script as script
+from src.cache import QuoteCache
+from src.fetch import Fetcher
+from src.flight import Flight
+from src.passengers import PassengerFareCache
+
+
+DEFAULT_CONCURRENCY = 8
+# Queries submitted to executor per download thread, the rest of input
+# is read only as searches complete
+WINDOW_FACTOR = 2
+
+
+class SearchQuery(NamedTuple):
+    """Parameters of one search, same fields as parsed command line arguments."""
+
+    dep_city: str
+    dest_city: str
+    dep_date: datetime
+    passengers: int
+    return_date: Optional[datetime] = None
+    verbose: bool = False
+
+
+class SearchResult(NamedTuple):
+    """Flights found for query or error which stopped the search.
+
+    status tells whether flights were revalidated, unchanged or parsed,
+    see script.revalidate_flights.
+    """
+
+    query: SearchQuery
+    flights: Optional[Dict[str, Flight]]
+    error: Optional[Exception] = None
+    status: Optional[str] = None
+
+
+def create_session(pool_size: int = DEFAULT_CONCURRENCY, rate: Optional[float] = None) -> Fetcher:
+    """Create fetcher keeping up to pool_size alive connections per host.
+
+    Arguments:
+        pool_size -- max number of connections to one host.
+        rate -- max number of requests per second shared by all
+            queries, unlimited if None.
+
+    Returns:
+        Fetcher -- session with connection pool, timeouts and retries.
+    """
+    return Fetcher(pool_size, rate=rate)
+
+
+@lru_cache(maxsize=None)
+def concurrency_arguments() -> argparse.ArgumentParser:
+    """Build parent parser with options of create_session shared by commands."""
+    argument_parser = argparse.ArgumentParser(add_help=False)
+    argument_parser.add_argument(
+        '--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+        help='max number of simultaneous requests'
+    )
+    argument_parser.add_argument(
+        '--rate', type=float, default=None,
+        help='max number of requests per second, unlimited by default'
+    )
+
+    return argument_parser
+
+
+def run_query(
+        query: SearchQuery,
+        session: Fetcher,
+        url: str = script.QUOTES_URL,
+        cache: Optional[QuoteCache] = None,
+        fares: Optional[PassengerFareCache] = None
+) -> SearchResult:
+    """Check route, download and parse flights for one query.
+
+    Arguments:
+        query -- search parameters.
+        session -- session for reusing connections.
+        url -- address of quote3.aspx.
+        cache -- cache of downloaded pages and parsed flights.
+        fares -- cache of one passenger fares, fetch every passengers
+            number separately if None.
+
+    Returns:
+        SearchResult -- found flights or error.
+    """
+    try:
+        script.check_search(query, session)
+
+        if fares is not None:
+            return SearchResult(query, fares.find(query, session, url, cache))
+
+        flights, status = script.revalidate_flights(
+            script.create_url_parameters(query), query, session, url, cache
+        )
+
+        return SearchResult(query, flights, status=status)
+    except (KeyError, ValueError, IndexError, requests.RequestException) as error:
+        return SearchResult(query, None, error)
+
+
+async def search_many(
+        queries: Iterable[SearchQuery],
+        concurrency: int = DEFAULT_CONCURRENCY,
+        session: Optional[Fetcher] = None,
+        url: str = script.QUOTES_URL,
+        cache: Optional[QuoteCache] = None,
+        fares: Optional[PassengerFareCache] = None
+) -> AsyncIterator[SearchResult]:
+    """Search flights for many queries concurrently.
+
+    Arguments:
+        queries -- search parameters.
+        concurrency -- max number of simultaneous requests.
+        session -- shared session, created with pool of concurrency
+            connections if None.
+        url -- address of quote3.aspx.
+        cache -- cache of downloaded pages shared by all queries.
+        fares -- cache of one passenger fares shared by all queries.
+
+    Queries are taken from iterable only when there is room for them in
+    window of concurrency * WINDOW_FACTOR searches, so results of queries
+    read so far are yielded while the rest of input is still arriving.
+
+    Yields:
+        SearchResult -- results in order of completion.
+    """
+    own_session = session is None
+    session = session or create_session(concurrency)
+    loop = asyncio.get_running_loop()
+    queries = iter(queries)
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            def submit(number: int) -> set:
+                return {
+                    loop.run_in_executor(
+                        executor, run_query, query, session, url, cache, fares
+                    )
+                    for query in itertools.islice(queries, number)
+                }
+
+            pending = submit(concurrency * WINDOW_FACTOR)
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending |= submit(len(done))
+
+                for task in done:
+                    yield task.result()
+    finally:
+        if own_session:
+            session.close()
+
+
+def search(
+        queries: Iterable[SearchQuery],
+        concurrency: int = DEFAULT_CONCURRENCY,
+        session: Optional[Fetcher] = None,
+        url: str = script.QUOTES_URL,
+        cache: Optional[QuoteCache] = None,
+        fares: Optional[PassengerFareCache] = None
+) -> List[SearchResult]:
+    """Blocking wrapper around search_many.
+
+    Arguments:
+        queries -- search parameters.
+        concurrency -- max number of simultaneous requests.
+        session -- shared session.
+        url -- address of quote3.aspx.
+        cache -- cache of downloaded pages.
+        fares -- cache of one passenger fares.
+
+    Returns:
+        list -- results in order of completion.
+    """
+    async def collect():
+        return [result async for result in search_many(
+            queries, concurrency, session, url, cache, fares
+        )]
+
+    return asyncio.run(collect())
@@ -0,0 +1,268 @@
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Callable, Hashable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+import src.script as script
+from src.batch import describe_query, to_query
+from src.cache import QuoteCache
+from src.flight import format_flights
+from src.routes import load_route_index
+from src.search import (
+    DEFAULT_CONCURRENCY, SearchQuery, SearchResult, concurrency_arguments, create_session, run_query
+)
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+# Number of latest requests used for latency percentiles
+LATENCY_WINDOW = 10000
+
+
+class RequestCoalescer:
+    """Run one call per key at a time, concurrent callers share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def run(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """Call function or wait for the call already running for key.
+
+        Arguments:
+            key -- identity of the call.
+            function -- function without arguments.
+
+        Returns:
+            any -- result of function, exceptions are raised in all callers.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            future.set_result(function())
+        except BaseException as error:
+            future.set_exception(error)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+        return future.result()
+
+
+class LatencyStats:
+    """Sliding window of request latencies with percentiles."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds: float) -> None:
+        """Record latency of one request."""
+        with self._lock:
+            self._latencies.append(seconds)
+            self.count += 1
+
+    def percentiles(self, points: Tuple[int, ...] = (50, 90, 99)) -> Dict[str, float]:
+        """Return latency percentiles and max in milliseconds, nearest rank method."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+
+        if not latencies:
+            return {}
+
+        result = {
+            f'p{point}': latencies[max(0, -(-len(latencies) * point // 100) - 1)] * 1000
+            for point in points
+        }
+        result['max'] = latencies[-1] * 1000
+
+        return result
+
+
+class FlightServer(ThreadingHTTPServer):
+    """HTTP server answering flight searches with warm connections and caches."""
+
+    daemon_threads = True
+
+    def __init__(
+            self,
+            address: Tuple[str, int] = (DEFAULT_HOST, DEFAULT_PORT),
+            concurrency: int = DEFAULT_CONCURRENCY,
+            cache: Optional[QuoteCache] = None,
+            url: str = script.QUOTES_URL,
+            query_parser: Callable[[Dict[str, Any]], SearchQuery] = to_query,
+            rate: Optional[float] = None
+    ):
+        """Create server, route index is loaded immediately.
+
+        Arguments:
+            address -- host and port, port 0 picks free port.
+            concurrency -- max number of kept alive upstream connections.
+            cache -- cache of downloaded pages.
+            url -- address of quote3.aspx.
+            query_parser -- converts query string fields into SearchQuery.
+            rate -- max number of upstream requests per second, unlimited
+                if None.
+        """
+        super().__init__(address, SearchRequestHandler)
+        self.session = create_session(concurrency, rate)
+        self.cache = cache
+        self.url = url
+        self.query_parser = query_parser
+        self.routes = load_route_index()
+        self.coalescer = RequestCoalescer()
+        self.latency = LatencyStats()
+
+    def search(self, query: SearchQuery) -> SearchResult:
+        """Search flights, identical concurrent queries share one upstream fetch."""
+        key = QuoteCache.make_key(script.create_url_parameters(query))
+
+        return self.coalescer.run(
+            key, lambda: run_query(query, self.session, self.url, self.cache)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters and latency percentiles."""
+        stats = {
+            'requests': self.latency.count,
+            'upstream_searches': self.coalescer.calls,
+            'coalesced_searches': self.coalescer.coalesced,
+            'latency_ms': self.latency.percentiles()
+        }
+
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+
+        stats['upstream'] = self.session.stats()
+        stats['extraction'] = script.extraction_stats()
+
+        return stats
+
+    def server_close(self):
+        super().server_close()
+        self.session.close()
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    """Handle GET /search and GET /stats."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        start = time.perf_counter()
+        request = urlparse(self.path)
+
+        if request.path == '/search':
+            status, body = self.search(request.query)
+            # Counted before response is sent, so client reading /stats
+            # right after its search sees it
+            self.server.latency.add(time.perf_counter() - start)
+        elif request.path == '/stats':
+            status, body = 200, self.server.stats()
+        else:
+            status, body = 404, {'error': 'Not found'}
+
+        self.send_json(status, body)
+
+    def search(self, query_string: str) -> Tuple[int, Dict[str, Any]]:
+        """Validate query string and search flights.
+
+        Returns:
+            tuple -- HTTP status and JSON body.
+        """
+        fields = {key: values[0] for key, values in parse_qs(query_string).items()}
+
+        try:
+            query = self.server.query_parser(fields)
+        except (KeyError, ValueError, TypeError, argparse.ArgumentTypeError) as error:
+            return 400, {'error': f'Invalid query: {error}'}
+
+        result = self.server.search(query)
+
+        if isinstance(result.error, KeyError):
+            return 404, {'query': describe_query(query), 'error': str(result.error)}
+
+        if result.error is not None:
+            return 502, {'query': describe_query(query), 'error': str(result.error)}
+
+        return 200, {
+            'query': describe_query(query),
+            'flights': format_flights(result.flights),
+            'status': result.status
+        }
+
+    def send_json(self, status: int, body: Dict[str, Any]) -> None:
+        content = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+def parse_arguments(args: List) -> argparse.Namespace:
+    """Handle command line arguments of server mode.
+
+    Arguments:
+        args -- command line arguments without 'serve' command.
+
+    Returns:
+        argparse.Namespace -- parsed arguments.
+    """
+    argument_parser = argparse.ArgumentParser(
+        prog='main.py serve', description='Serve flight searches over HTTP',
+        parents=[script.cache_arguments(), concurrency_arguments()]
+    )
+    argument_parser.add_argument('--host', default=DEFAULT_HOST, help='address to listen on')
+    argument_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on')
+
+    return argument_parser.parse_args(args)
+
+
+def main(arguments: List) -> int:
+    """Run server until interrupted.
+
+    Arguments:
+        arguments -- command line arguments without 'serve' command.
+
+    Returns:
+        int -- exit status.
+    """
+    args = parse_arguments(arguments)
+    cache = None if args.no_cache else QuoteCache(':memory:', ttl=args.cache_ttl)
+    server = FlightServer((args.host, args.port), args.concurrency, cache, rate=args.rate)
+    print(f'Serving on http://{args.host}:{server.server_port}/search')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+        if cache is not None:
+            cache.close()
+
+    return 0
@@ -0,0 +1,146 @@
+from array import array
+from functools import lru_cache
+from typing import Sequence
+
+
+MINUTES_PER_DAY = 24 * 60
+# ord('0') * 10 + ord('0'), subtracted from two ASCII digits combined as number
+_TWO_DIGITS_OFFSET = 48 * 11
+
+
+@lru_cache(maxsize=None)
+def load_numpy():
+    """Import numpy on first use of columns, None if it is not installed.
+
+    Single searches use only scalar functions, so they never pay for
+    importing numpy.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+
+    return numpy
+
+
+def parse_minutes(time: str) -> int:
+    """Convert time in format hh:mm into minutes since midnight.
+
+    Arguments:
+        time -- time in format hh:mm, hours may have one digit.
+
+    Raises:
+        ValueError -- invalid time.
+
+    Returns:
+        int -- minutes since midnight.
+    """
+    hours, separator, minutes = time.partition(':')
+
+    if not separator or not 0 < len(hours) < 3 or len(minutes) != 2\
+            or not hours.isdigit() or not minutes.isdigit():
+        raise ValueError(f'Invalid time: {time!r}')
+
+    hours = int(hours)
+    minutes = int(minutes)
+
+    if hours > 23 or minutes > 59:
+        raise ValueError(f'Invalid time: {time!r}')
+
+    return hours * 60 + minutes
+
+
+def format_minutes(minutes: int) -> str:
+    """Convert minutes into time or duration in format hh:mm."""
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def is_overnight(departure: int, arrival: int) -> bool:
+    """Check whether flight arrives next day, times are minutes since midnight."""
+    return arrival < departure
+
+
+def duration_minutes(departure: int, arrival: int) -> int:
+    """Calculate flight duration in minutes, duration is less than 24 hours.
+
+    Arrival earlier than departure means arrival next day.
+
+    Arguments:
+        departure -- departure time in minutes since midnight.
+        arrival -- arrival time in minutes since midnight.
+
+    Returns:
+        int -- flight duration in minutes.
+    """
+    if is_overnight(departure, arrival):
+        return arrival + MINUTES_PER_DAY - departure
+
+    return arrival - departure
+
+
+def parse_minutes_column(times: Sequence[str]):
+    """Convert column of times in format hh:mm into minutes since midnight.
+
+    Arguments:
+        times -- times with two digit hours and minutes.
+
+    Raises:
+        ValueError -- invalid time in column.
+
+    Returns:
+        numpy.ndarray or array -- minutes since midnight, numpy array of
+            int32 if numpy is installed and array of ints otherwise.
+    """
+    data = ''.join(times).encode('ascii', 'replace')
+
+    if len(data) != 5 * len(times) or data[2::5] != b':' * len(times)\
+            or data.count(b':') != len(times) or not data.replace(b':', b'').isdigit():
+        raise ValueError('Invalid time in column, expected format hh:mm')
+
+    numpy = load_numpy()
+
+    if numpy is not None:
+        digits = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, 5).astype(numpy.int32) - 48
+        hours = digits[:, 0] * 10 + digits[:, 1]
+        minutes = digits[:, 3] * 10 + digits[:, 4]
+        valid = bool((hours < 24).all() and (minutes < 60).all())
+        result = hours * 60 + minutes
+    else:
+        hours = [a * 10 + b - _TWO_DIGITS_OFFSET for a, b in zip(data[::5], data[1::5])]
+        minutes = [a * 10 + b - _TWO_DIGITS_OFFSET for a, b in zip(data[3::5], data[4::5])]
+        valid = max(hours, default=0) < 24 and max(minutes, default=0) < 60
+        result = array('i', [hour * 60 + minute for hour, minute in zip(hours, minutes)])
+
+    if not valid:
+        raise ValueError('Invalid time in column, hours or minutes out of range')
+
+    return result
+
+
+def duration_column(departures: Sequence[str], arrivals: Sequence[str]):
+    """Calculate flight durations in minutes for columns of times.
+
+    Arguments:
+        departures -- departure times in format hh:mm.
+        arrivals -- arrival times in format hh:mm, earlier than departure
+            time means arrival next day.
+
+    Raises:
+        ValueError -- columns differ in length or contain invalid time.
+
+    Returns:
+        numpy.ndarray or array -- durations in minutes.
+    """
+    if len(departures) != len(arrivals):
+        raise ValueError('Columns of departure and arrival times differ in length')
+
+    departure_minutes = parse_minutes_column(departures)
+    arrival_minutes = parse_minutes_column(arrivals)
+
+    if load_numpy() is not None:
+        return (arrival_minutes - departure_minutes) % MINUTES_PER_DAY
+
+    return array('i', [
+        (arrival - departure) % MINUTES_PER_DAY
+        for departure, arrival in zip(departure_minutes, arrival_minutes)
+    ])
@@ -0,0 +1,391 @@
+import argparse
+import heapq
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import date, datetime
+from typing import Dict, Any, Callable, IO, Iterable, List, Optional
+import src.script as script
+from src.batch import describe_query, open_input, read_queries
+from src.cache import DEFAULT_CACHE_PATH, QuoteCache
+from src.fetch import Fetcher
+from src.output import flight_record
+from src.search import (
+    DEFAULT_CONCURRENCY, SearchQuery, SearchResult, concurrency_arguments, create_session, search
+)
+
+
+# Seconds between polls of a query departing within a day
+DEFAULT_MIN_INTERVAL = 5 * 60
+# Seconds between polls of a query which does not change
+DEFAULT_MAX_INTERVAL = 6 * 60 * 60
+# Interval is multiplied by factor after every poll without changes
+BACKOFF_FACTOR = 2
+# Interval stops growing after this many polls without changes
+MAX_UNCHANGED = 16
+# Watcher keeps pages expired, so they must not share file with other commands
+WATCH_CACHE_PATH = os.path.join(os.path.dirname(DEFAULT_CACHE_PATH), 'watch.sqlite3')
+
+
+def poll_interval(
+        days_left: int,
+        unchanged: int,
+        min_interval: float = DEFAULT_MIN_INTERVAL,
+        max_interval: float = DEFAULT_MAX_INTERVAL
+) -> float:
+    """Return seconds until the next poll of query.
+
+    Interval grows linearly with days left to departure and exponentially
+    with number of polls since the last change.
+
+    Arguments:
+        days_left -- days from today to departure.
+        unchanged -- number of polls since flights changed.
+        min_interval -- interval for departure within a day right after change.
+        max_interval -- max interval.
+
+    Returns:
+        float -- seconds.
+    """
+    return min(
+        max_interval,
+        min_interval * max(days_left, 1) * BACKOFF_FACTOR ** min(unchanged, MAX_UNCHANGED)
+    )
+
+
+def diff_flights(
+        old: Dict[str, Dict[str, Any]],
+        new: Dict[str, Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Compare snapshots of flight records by direction.
+
+    Arguments:
+        old -- previous records.
+        new -- current records.
+
+    Returns:
+        list -- 'added', 'removed' and 'changed' events, changed events
+            contain old and new value of every changed field.
+    """
+    events = []
+
+    for direction, record in new.items():
+        previous = old.get(direction)
+
+        if previous is None:
+            events.append({'event': 'added', 'direction': direction, 'flight': record})
+        elif previous != record:
+            events.append({
+                'event': 'changed', 'direction': direction, 'flight': record,
+                'changes': {
+                    name: [previous.get(name), value]
+                    for name, value in record.items()
+                    if previous.get(name) != value
+                }
+            })
+
+    for direction, record in old.items():
+        if direction not in new:
+            events.append({'event': 'removed', 'direction': direction, 'flight': record})
+
+    return events
+
+
+def watch_key(query: SearchQuery) -> str:
+    """Return key of query in watchlist and state file."""
+    return json.dumps(describe_query(query), sort_keys=True)
+
+
+class WatchItem:
+    """Watched query with its last snapshot and polling state."""
+
+    def __init__(self, query: SearchQuery, snapshot: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.query = query
+        self.key = watch_key(query)
+        self.snapshot = snapshot
+        self.error: Optional[str] = None
+        self.unchanged = 0
+        self.due = 0.0
+
+
+class JsonLinesSink:
+    """Write every event as JSON line."""
+
+    def __init__(self, stream: IO[str]):
+        self.stream = stream
+
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            self.stream.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+        self.stream.flush()
+
+
+class WebhookSink:
+    """POST events of one poll as JSON object {"events": [...]} to url."""
+
+    def __init__(self, url: str, timeout: float = 10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, events: List[Dict[str, Any]]) -> None:
+        request = urllib.request.Request(
+            self.url, json.dumps({'events': events}, ensure_ascii=False).encode(),
+            {'Content-Type': 'application/json'}
+        )
+
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+        except (urllib.error.URLError, OSError) as error:
+            # Watching goes on, events are not retried
+            print(f'Webhook {self.url} failed: {error}', file=sys.stderr)
+
+
+class Watcher:
+    """Poll queries on adaptive schedule and send changes of their flights.
+
+    Only queries whose time has come are fetched, so number of requests
+    depends on how often flights change, not on size of watchlist.
+    """
+
+    def __init__(
+            self,
+            queries: Iterable[SearchQuery],
+            sink,
+            session: Optional[Fetcher] = None,
+            url: str = script.QUOTES_URL,
+            cache: Optional[QuoteCache] = None,
+            concurrency: int = DEFAULT_CONCURRENCY,
+            min_interval: float = DEFAULT_MIN_INTERVAL,
+            max_interval: float = DEFAULT_MAX_INTERVAL,
+            state_path: Optional[str] = None,
+            clock: Callable[[], float] = time.time,
+            sleep: Callable[[float], None] = time.sleep
+    ):
+        """Create watcher, every query is due immediately.
+
+        Arguments:
+            queries -- watchlist.
+            sink -- object with send(events) method.
+            session -- shared session.
+            url -- address of quote3.aspx.
+            cache -- cache of downloaded pages and parsed flights.
+            concurrency -- max number of simultaneous requests.
+            min_interval -- seconds between polls of query departing
+                within a day right after change.
+            max_interval -- max seconds between polls.
+            state_path -- JSON file keeping snapshots between runs.
+            clock -- returns current time in seconds since epoch.
+            sleep -- waits passed number of seconds.
+        """
+        self.sink = sink
+        self.session = session
+        self.url = url
+        self.cache = cache
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.state_path = state_path
+        self.clock = clock
+        self.sleep = sleep
+        self.polls = 0
+        snapshots = self.load_state()
+        self.items: Dict[str, WatchItem] = {}
+
+        for query in queries:
+            key = watch_key(query)
+            self.items.setdefault(key, WatchItem(query, snapshots.get(key)))
+
+        self._schedule = [(item.due, key) for key, item in self.items.items()]
+        heapq.heapify(self._schedule)
+
+    def load_state(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Read snapshots saved by previous run."""
+        if self.state_path is None or not os.path.exists(self.state_path):
+            return {}
+
+        with open(self.state_path) as state_file:
+            return json.load(state_file)
+
+    def save_state(self) -> None:
+        """Replace state file with current snapshots."""
+        if self.state_path is None:
+            return
+
+        temporary = self.state_path + '.tmp'
+
+        with open(temporary, 'w') as state_file:
+            json.dump(
+                {key: item.snapshot for key, item in self.items.items() if item.snapshot is not None},
+                state_file
+            )
+
+        os.replace(temporary, self.state_path)
+
+    def next_due(self) -> Optional[float]:
+        """Return time of the next poll, None if watchlist is empty."""
+        return self._schedule[0][0] if self._schedule else None
+
+    def poll(self) -> List[Dict[str, Any]]:
+        """Fetch due queries, send and return events of changed flights."""
+        now = self.clock()
+        today = date.fromtimestamp(now)
+        due = []
+        events = []
+
+        while self._schedule and self._schedule[0][0] <= now:
+            item = self.items[heapq.heappop(self._schedule)[1]]
+
+            if item.query.dep_date.date() < today:
+                events.append(self.event(item, {'event': 'expired'}, now))
+                del self.items[item.key]
+            else:
+                due.append(item)
+
+        results = search(
+            [item.query for item in due], self.concurrency, self.session, self.url, self.cache
+        ) if due else []
+
+        for result in results:
+            item = self.items[watch_key(result.query)]
+            changes = self.update(item, result)
+            events.extend(self.event(item, change, now) for change in changes)
+            item.unchanged = 0 if changes else item.unchanged + 1
+            item.due = now + poll_interval(
+                (item.query.dep_date.date() - today).days, item.unchanged,
+                self.min_interval, self.max_interval
+            )
+            heapq.heappush(self._schedule, (item.due, item.key))
+
+        self.polls += len(results)
+
+        if events:
+            self.sink.send(events)
+            self.save_state()
+
+        return events
+
+    @staticmethod
+    def update(item: WatchItem, result: SearchResult) -> List[Dict[str, Any]]:
+        """Store new snapshot of item and return its changes."""
+        if result.error is not None:
+            error = str(result.error)
+            changed = error != item.error
+            item.error = error
+
+            return [{'event': 'error', 'error': error}] if changed else []
+
+        item.error = None
+        snapshot = {
+            direction: flight_record(direction, flight)
+            for direction, flight in result.flights.items()
+        }
+        changes = diff_flights(item.snapshot or {}, snapshot)
+        item.snapshot = snapshot
+
+        return changes
+
+    @staticmethod
+    def event(item: WatchItem, change: Dict[str, Any], now: float) -> Dict[str, Any]:
+        return {
+            'time': datetime.fromtimestamp(now).isoformat(timespec='seconds'),
+            'query': describe_query(item.query),
+            **change
+        }
+
+    def run(self, max_polls: Optional[int] = None) -> None:
+        """Poll until watchlist is empty or max_polls queries were fetched."""
+        while self._schedule and (max_polls is None or self.polls < max_polls):
+            self.sleep(max(0.0, self.next_due() - self.clock()))
+            self.poll()
+
+
+def parse_arguments(args: List) -> argparse.Namespace:
+    """Handle command line arguments of watch mode.
+
+    Arguments:
+        args -- command line arguments without 'watch' command.
+
+    Returns:
+        argparse.Namespace -- parsed arguments.
+    """
+    argument_parser = argparse.ArgumentParser(
+        prog='main.py watch',
+        description='Poll watchlist of queries and report changes of flights as JSON lines',
+        parents=[concurrency_arguments()]
+    )
+    argument_parser.add_argument(
+        'input', nargs='?', default='-',
+        help='watchlist file with JSON lines or CSV queries, stdin if omitted or -'
+    )
+    argument_parser.add_argument(
+        '--format', choices=('auto', 'jsonl', 'csv'), default='auto',
+        help='watchlist format, detected by the first line by default'
+    )
+    argument_parser.add_argument(
+        '--webhook', metavar='URL', default=None,
+        help='POST events to URL instead of writing them to stdout'
+    )
+    argument_parser.add_argument(
+        '--state', metavar='FILE', default=None,
+        help='JSON file keeping snapshots of flights between runs'
+    )
+    argument_parser.add_argument(
+        '--min-interval', type=float, default=DEFAULT_MIN_INTERVAL,
+        help='seconds between polls of query departing within a day'
+    )
+    argument_parser.add_argument(
+        '--max-interval', type=float, default=DEFAULT_MAX_INTERVAL,
+        help='max seconds between polls of query'
+    )
+    argument_parser.add_argument(
+        '--no-cache', help='download whole pages, do not send conditional requests',
+        action='store_true'
+    )
+
+    return argument_parser.parse_args(args)
+
+
+def main(arguments: List) -> int:
+    """Run watch mode until every watched departure date has passed.
+
+    Arguments:
+        arguments -- command line arguments without 'watch' command.
+
+    Returns:
+        int -- exit status, 1 if watchlist contains invalid queries.
+    """
+    args = parse_arguments(arguments)
+    queries = []
+    invalid = 0
+
+    with open_input(args.input) as stream:
+        for item in read_queries(stream, args.format):
+            if isinstance(item, SearchQuery):
+                queries.append(item)
+            else:
+                invalid += 1
+                print(f'Invalid query {item[0]}: {item[1]}', file=sys.stderr)
+
+    sink = WebhookSink(args.webhook) if args.webhook else JsonLinesSink(sys.stdout)
+    # Pages always expire, so every poll revalidates them with conditional request
+    cache = None if args.no_cache else QuoteCache(WATCH_CACHE_PATH, ttl=0)
+
+    try:
+        with create_session(args.concurrency, args.rate) as session:
+            Watcher(
+                queries, sink, session, cache=cache, concurrency=args.concurrency,
+                min_interval=args.min_interval, max_interval=args.max_interval,
+                state_path=args.state
+            ).run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if cache is not None:
+            cache.close()
+
+    return int(bool(invalid))
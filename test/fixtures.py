@@ -0,0 +1,227 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+CITIES = (
+    ('Copenhagen', 'CPH'), ('Billund', 'BLL'), ('Burgas', 'BOJ'),
+    ('Plovdiv', 'PDV'), ('Sofia', 'SOF'), ('Varna', 'VAR')
+)
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), 'pages')
+
+
+def build_quotes_page(flights: Iterable[Tuple]) -> str:
+    """Build HTML page with flywiz_tblQuotes table like quote3.aspx does.
+
+    Arguments:
+        flights -- tuples of flight ID, date, departure time, arrival time,
+            departure city, destination city, price and additional information.
+
+    Returns:
+        str -- HTML page.
+    """
+    rows = []
+
+    for flight_id, date, dep_time, arr_time, dep_city, dest_city, price, extra in flights:
+        rows.append(
+            f'<tr id="flywiz_rinf{flight_id}">'
+            f'<td><input type="radio" name="flywiz_rd" value="{flight_id}"/></td>'
+            f'<td>{date}</td><td>{dep_time}</td><td>{arr_time}</td>'
+            f'<td>{dep_city}</td><td>{dest_city}</td></tr>'
+        )
+        extra_cell = f'<td>{extra}</td>' if extra else '<td></td>'
+        rows.append(
+            f'<tr id="flywiz_rprc{flight_id}">'
+            f'<td>Price: {price}.00 EUR</td>{extra_cell}</tr>'
+        )
+
+    return (
+        '<html><head><title>Quote</title></head><body>'
+        '<table id="flywiz_tblQuotes">'
+        '<tr><th></th><th>Date</th><th>Departure</th><th>Arrival</th>'
+        '<th>From</th><th>To</th></tr>'
+        f'{"".join(rows)}'
+        '</table></body></html>'
+    )
+
+
+def generate_flights(rows: int, start: datetime = datetime(2019, 6, 26)) -> List[Tuple]:
+    """Generate synthetic flights, every flight takes two table rows.
+
+    Arguments:
+        rows -- total number of table rows.
+        start -- date of the first flight.
+
+    Returns:
+        list -- flights accepted by build_quotes_page.
+    """
+    flights = []
+
+    for index in range(rows // 2):
+        dep_name, dep_code = CITIES[index % len(CITIES)]
+        dest_name, dest_code = CITIES[(index + 1) % len(CITIES)]
+        date = start + timedelta(days=index % 365)
+        dep_minutes = (index * 35) % 1440
+        arr_minutes = (dep_minutes + 110 + index % 120) % 1440
+
+        flights.append((
+            f'{index:05d}',
+            f'{date:%a}, {date.day} {date:%b %y}',
+            f'{dep_minutes // 60:02d}:{dep_minutes % 60:02d}',
+            f'{arr_minutes // 60:02d}:{arr_minutes % 60:02d}',
+            f'{dep_name} ({dep_code})',
+            f'{dest_name} ({dest_code})',
+            100 + index % 150,
+            'Last seats' if index % 7 == 0 else ''
+        ))
+
+    return flights
+
+
+def page_name(parameters: Dict[str, str]) -> str:
+    """Return name of recorded page for quote3.aspx url parameters."""
+    name = f'{parameters["aptcode1"]}_{parameters["aptcode2"]}_{parameters["depdate"]}'
+
+    if parameters.get('rtdate'):
+        name += f'_rt_{parameters["rtdate"]}'
+    else:
+        name += '_ow'
+
+    return f'{name.lower()}.html'
+
+
+class QuotesRequestHandler(BaseHTTPRequestHandler):
+    """Serve recorded quote3.aspx pages from PAGES_DIR."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        parameters = {key: values[0] for key, values in query.items()}
+        self.server.requests_count += 1
+        self.server.requested.append(parameters)
+        status, body = self.read_page(parameters)
+        headers = self.page_headers(status, body)
+
+        if headers.get('ETag') and self.headers.get('If-None-Match') == headers['ETag']:
+            self.server.not_modified_count += 1
+            status, body = 304, b''
+
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+
+            for name, value in headers.items():
+                self.send_header(name, value)
+
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client timed out and closed connection
+            pass
+
+    def read_page(self, parameters: Dict[str, str]) -> Tuple[int, bytes]:
+        """Return HTTP status and page for url parameters."""
+        try:
+            with open(os.path.join(PAGES_DIR, page_name(parameters)), 'rb') as page:
+                return 200, page.read()
+        except (KeyError, OSError):
+            return 404, b'<html><body>Not found</body></html>'
+
+    def page_headers(self, status: int, body: bytes) -> Dict[str, str]:
+        """Return additional response headers."""
+        return {}
+
+    def log_message(self, *args):
+        pass
+
+
+class ETagQuotesRequestHandler(QuotesRequestHandler):
+    """Send ETag of page and answer 304 Not Modified if it matches If-None-Match."""
+
+    def page_headers(self, status: int, body: bytes) -> Dict[str, str]:
+        if status != 200:
+            return {}
+
+        return {'ETag': f'"{hashlib.sha1(body).hexdigest()}"'}
+
+
+class FlakyQuotesRequestHandler(QuotesRequestHandler):
+    """Delay every response by server.delay seconds and answer the first
+    server.failures requests with 503 status.
+    """
+
+    def read_page(self, parameters: Dict[str, str]) -> Tuple[int, bytes]:
+        time.sleep(getattr(self.server, 'delay', 0))
+
+        if self.server.requests_count <= getattr(self.server, 'failures', 0):
+            return 503, b'<html><body>Service unavailable</body></html>'
+
+        return super().read_page(parameters)
+
+
+def synthetic_price(dep_city: str, dest_city: str, flight_date: datetime) -> int:
+    """Return deterministic price per person in EUR for synthetic pages."""
+    return 100 + (flight_date.day * 7 + flight_date.month * 3 + ord(dep_city[0])) % 60
+
+
+class SyntheticQuotesRequestHandler(QuotesRequestHandler):
+    """Serve page with one flight at 10:00-12:00 for every requested date."""
+
+    def read_page(self, parameters: Dict[str, str]) -> Tuple[int, bytes]:
+        legs = [(parameters['aptcode1'], parameters['aptcode2'], parameters['depdate'])]
+
+        if parameters.get('rtdate'):
+            legs.append((parameters['aptcode2'], parameters['aptcode1'], parameters['rtdate']))
+
+        names = dict((code, name) for name, code in CITIES)
+        flights = []
+
+        for index, (dep_city, dest_city, flight_date) in enumerate(legs):
+            flight_date = datetime.strptime(flight_date, '%d.%m.%Y')
+            flights.append((
+                f'{index:05d}',
+                f'{flight_date:%a}, {flight_date.day} {flight_date:%b %y}',
+                '10:00', '12:00',
+                f'{names[dep_city]} ({dep_city})', f'{names[dest_city]} ({dest_city})',
+                synthetic_price(dep_city, dest_city, flight_date), ''
+            ))
+
+        return 200, build_quotes_page(flights).encode()
+
+
+class QuotesStubServer:
+    """Local HTTP server replaying recorded pages, usable as context manager."""
+
+    def __init__(self, handler=QuotesRequestHandler):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.server.daemon_threads = True
+        self.server.requests_count = 0
+        self.server.requested = []
+        self.server.not_modified_count = 0
+        self.url = f'http://127.0.0.1:{self.server.server_port}/fly/quote3.aspx'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def requests_count(self) -> int:
+        return self.server.requests_count
+
+    @property
+    def requested(self) -> List[Dict[str, str]]:
+        return self.server.requested
+
+    def __enter__(self):
+        self.thread.start()
+
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
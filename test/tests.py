@@ -1,8 +1,47 @@
+import os
+import subprocess
+import tempfile
+import sys
+import threading
+import time
 import unittest
 import argparse
+import asyncio
+import io
 import itertools
-from datetime import datetime
+import json
+import socket
+import urllib.error
+import urllib.request
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import lxml.html
+import requests
 import src.script as source
+from src.archive import NotRecordedError, QuoteArchive, archive_session
+from src.batch import QueryValidator, read_queries, run_batch
+from src.cache import DEFAULT_TTL, ParsedPage, QuoteCache
+from src.columns import FareTable, numpy
+from src.connections import LegGraph, SearchLegFetcher, cheapest_itinerary, departure_time, arrival_time, earliest_arrival
+from src.fares import cheapest_round_trips, fetch_calendar, rank_round_trips
+from src.fetch import Fetcher, TokenBucket
+from src.flight import Flight, format_flight, format_flights, format_price, parse_price
+from src.history import FareHistory, TrendPoint, parse_arguments as history_arguments
+from src.output import CsvWriter, FlightWriter, JsonLinesWriter, TableWriter, open_writer
+from src.parser import iter_quote_rows, parse_quotes_table
+from src.pool import PageJob, ParserPool, search_parallel
+from src.profiling import Profiler, PROFILER
+from src.passengers import PassengerFareCache, check_linear_pricing
+from src.routes import RouteIndex, load_route_index
+from src.search import WINDOW_FACTOR, SearchQuery, SearchResult, run_query, search, search_many
+from src.server import FlightServer, LatencyStats, RequestCoalescer
+from src.watch import Watcher, diff_flights, poll_interval, watch_key
+from src.times import duration_column, duration_minutes, parse_minutes
+from test.fixtures import (
+    PAGES_DIR, ETagQuotesRequestHandler, FlakyQuotesRequestHandler, QuotesRequestHandler, QuotesStubServer, SyntheticQuotesRequestHandler,
+    build_quotes_page, generate_flights, synthetic_price
+)
 
 
 class TestValidateDate(unittest.TestCase):
@@ -45,6 +84,18 @@ class TestValidateDate(unittest.TestCase):
         with self.assertRaises(argparse.ArgumentTypeError):
             source.validate_date('26.01.2019')
 
+    def test_parse_flight_date(self):
+        args = (('01.07.2019', datetime(2019, 7, 1)), ('1.7.2019', datetime(2019, 7, 1)))
+
+        for flight_date, expected in args:
+            with self.subTest(flight_date):
+                self.assertEqual(source.parse_flight_date(flight_date), expected)
+
+        for flight_date in ('001.07.2019', '01.07.02019', '29.02.2019', '1.٧.2019', '+1.07.2019'):
+            with self.subTest(flight_date):
+                with self.assertRaises(ValueError):
+                    source.parse_flight_date(flight_date)
+
 
 class TestValidateCityCodes(unittest.TestCase):
 
@@ -134,6 +185,46 @@ class TestCalculateFlightDuration(unittest.TestCase):
             with self.subTest(time):
                 self.assertEqual(source.calculate_flight_duration(time, time), '00:00')
 
+    def test_invalid_time(self):
+        args = ('24:00', '12:60', '1200', '12:5', 'ab:cd', '')
+
+        for time in args:
+            with self.subTest(time):
+                with self.assertRaises(ValueError):
+                    source.calculate_flight_duration(time, '12:00')
+
+
+class TestTimes(unittest.TestCase):
+
+    def test_parse_minutes(self):
+        args = (('00:00', 0), ('9:05', 545), ('16:00', 960), ('23:59', 1439))
+
+        for time, minutes in args:
+            with self.subTest(time):
+                self.assertEqual(parse_minutes(time), minutes)
+
+    def test_overnight_duration(self):
+        self.assertEqual(duration_minutes(1410, 45), 75)
+        self.assertEqual(duration_minutes(45, 1410), 1365)
+
+    def test_duration_column(self):
+        departures = ['12:40', '23:30', '16:00', '02:34']
+        arrivals = ['13:35', '00:15', '15:00', '02:34']
+
+        self.assertEqual(list(duration_column(departures, arrivals)), [55, 45, 1380, 0])
+
+    def test_invalid_column(self):
+        args = (['12:40', '24:00'], ['12:40', '1:00'], ['12:40', '12:3:'], ['12:40', 'ab:cd'])
+
+        for departures in args:
+            with self.subTest(departures):
+                with self.assertRaises(ValueError):
+                    duration_column(departures, ['00:00', '00:00'])
+
+    def test_columns_of_different_length(self):
+        with self.assertRaises(ValueError):
+            duration_column(['12:40'], [])
+
 
 class TestCheckRoute(unittest.TestCase):
 
@@ -184,8 +275,64 @@ class TestCheckRoute(unittest.TestCase):
                     with self.assertRaises(KeyError):
                         source.check_route(route[0], route[1], invalid_date)
 
+    def test_suggest_nearest_dates(self):
+        with self.assertRaises(KeyError) as context:
+            source.check_route('CPH', 'BOJ', datetime(2019, 7, 5))
+
+        self.assertIn('03.07.2019, 10.07.2019', str(context.exception))
+
+
+class TestRouteIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = RouteIndex({
+            ('CPH', 'BOJ'): [date(2019, 7, 10), date(2019, 6, 26), date(2019, 7, 3)],
+            ('BOJ', 'CPH'): [date(2019, 6, 27), date(2019, 7, 4), date(2019, 7, 11)],
+        })
+
+    def test_load_default_schedule(self):
+        index = load_route_index()
+
+        self.assertEqual(len(index), 4)
+        self.assertIn(('BOJ', 'BLL'), index)
+        self.assertEqual(index.dates('CPH', 'BOJ')[0], date(2019, 6, 26))
+
+    def test_has_flight(self):
+        self.assertTrue(self.index.has_flight('CPH', 'BOJ', date(2019, 7, 3)))
+        self.assertFalse(self.index.has_flight('CPH', 'BOJ', date(2019, 7, 4)))
+        self.assertFalse(self.index.has_flight('CPH', 'BLL', date(2019, 7, 3)))
+
+    def test_nearest_dates(self):
+        args = (
+            (date(2019, 7, 1), (date(2019, 6, 26), date(2019, 7, 3))),
+            (date(2019, 7, 3), (date(2019, 6, 26), date(2019, 7, 10))),
+            (date(2019, 1, 1), (None, date(2019, 6, 26))),
+            (date(2019, 9, 1), (date(2019, 7, 10), None)),
+        )
+
+        for flight_date, expected in args:
+            with self.subTest(flight_date):
+                self.assertEqual(self.index.nearest_dates('CPH', 'BOJ', flight_date), expected)
+
+    def test_dates_between(self):
+        self.assertEqual(
+            self.index.dates_between('CPH', 'BOJ', date(2019, 6, 26), date(2019, 7, 9)),
+            [date(2019, 6, 26), date(2019, 7, 3)]
+        )
+
+    def test_round_trips(self):
+        trips = list(self.index.round_trips('CPH', 'BOJ', min_stay=1, max_stay=8))
+
+        self.assertEqual(trips, [
+            (date(2019, 6, 26), date(2019, 6, 27)),
+            (date(2019, 6, 26), date(2019, 7, 4)),
+            (date(2019, 7, 3), date(2019, 7, 4)),
+            (date(2019, 7, 3), date(2019, 7, 11)),
+            (date(2019, 7, 10), date(2019, 7, 11)),
+        ])
 
-class TestFindFlightInfo(unittest.TestCase):
+
+class TestFindFlights(unittest.TestCase):
 
     def test_return_valid_data_one_way(self):
         args = ('BLL', 'BOJ', '22.07.2019', '7')
@@ -203,7 +350,7 @@ class TestFindFlightInfo(unittest.TestCase):
             }
         }
 
-        self.assertEqual(source.find_flight_info(args), expected_data)
+        self.assertEqual(format_flights(source.find_flights(args)), expected_data)
 
     def test_return_valid_data_two_way(self):
         args = ('BOJ', 'BLL', '01.07.2019', '2', '-return_date=05.08.2019')
@@ -229,13 +376,13 @@ class TestFindFlightInfo(unittest.TestCase):
             }
         }
 
-        self.assertEqual(source.find_flight_info(args), expected_data)
+        self.assertEqual(format_flights(source.find_flights(args)), expected_data)
 
     def test_dep_date_in_the_past(self):
         args = ('CPH', 'BOJ', '10.07.2019', '3', '-return_date=03.07.2019')
 
         with self.assertRaises(ValueError):
-            source.find_flight_info(args)
+            source.find_flights(args)
 
 
 class TestParseArguments(unittest.TestCase):
@@ -249,7 +396,16 @@ class TestParseArguments(unittest.TestCase):
             dep_date=date,
             passengers=2,
             return_date=None,
-            verbose=False
+            verbose=False,
+            no_cache=False,
+            purge_cache=False,
+            cache_ttl=DEFAULT_TTL,
+            derive_passengers=False,
+            profile=False,
+            profile_output=None,
+            record=None,
+            replay=None,
+            history=False
         )
 
         self.assertEqual(source.parse_arguments(args), expected_args)
@@ -265,7 +421,16 @@ class TestParseArguments(unittest.TestCase):
             dep_date=date,
             passengers=3,
             return_date=return_date,
-            verbose=False
+            verbose=False,
+            no_cache=False,
+            purge_cache=False,
+            cache_ttl=DEFAULT_TTL,
+            derive_passengers=False,
+            profile=False,
+            profile_output=None,
+            record=None,
+            replay=None,
+            history=False
         )
 
         self.assertEqual(source.parse_arguments(args), expected_args)
@@ -376,5 +541,1433 @@ class TestCreateUrlParameters(unittest.TestCase):
         self.assertEqual(source.create_url_parameters(args), expected_args)
 
 
+class TestParseQuotesTable(unittest.TestCase):
+
+    @staticmethod
+    def get_table(html: str):
+        page = lxml.html.document_fromstring(html)
+
+        return page.xpath('//table[@id="flywiz_tblQuotes"]')[0]
+
+    def test_group_rows_by_flight_id(self):
+        table = self.get_table(build_quotes_page(generate_flights(20)))
+        flights = parse_quotes_table(table)
+
+        self.assertEqual(len(flights), 10)
+        self.assertEqual(flights[0]['flight_id'], '00000')
+        self.assertEqual(flights[0]['info'][1].text, 'Wed, 26 Jun 19')
+        self.assertEqual(
+            [cell.text for cell in flights[0]['price_and_extra_info']],
+            ['Price: 100.00 EUR', 'Last seats']
+        )
+        self.assertEqual(
+            [cell.text for cell in flights[1]['price_and_extra_info']],
+            ['Price: 101.00 EUR']
+        )
+
+    def test_price_rows_before_info_rows(self):
+        table = self.get_table(
+            '<table id="flywiz_tblQuotes">'
+            '<tr id="flywiz_rprc12345"><td>Price: 210.00 EUR</td></tr>'
+            '<tr id="flywiz_rinf12345"><td></td><td>Mon, 1 Jul 19</td></tr>'
+            '</table>'
+        )
+        flights = parse_quotes_table(table)
+
+        self.assertEqual(len(flights), 1)
+        self.assertEqual(flights[0]['price_and_extra_info'][0].text, 'Price: 210.00 EUR')
+
+    def test_empty_table(self):
+        table = self.get_table('<table id="flywiz_tblQuotes"><tr><th></th></tr></table>')
+
+        self.assertEqual(parse_quotes_table(table), [])
+
+
+class TestFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.flight = Flight(
+            date=date(2019, 7, 1), departure=960, arrival=1070, duration=110,
+            dep_city='BOJ', dest_city='BLL', price=21000
+        )
+
+    def test_format_flight(self):
+        expected_data = {
+            'Date': 'Mon, 1 Jul 19',
+            'Departure': '16:00',
+            'Arrival': '17:50',
+            'Flight duration': '01:50',
+            'From': 'Burgas (BOJ)',
+            'To': 'Billund (BLL)',
+            'Price': '210.00 EUR',
+            'Additional information': ''
+        }
+
+        self.assertEqual(format_flight(self.flight), expected_data)
+
+    def test_parse_price(self):
+        args = (
+            ('Price: 105.00 EUR', 10500), ('Price: 99.5 EUR', 9950),
+            ('Price: 1204.75 EUR', 120475), ('Price: 7 EUR', 700)
+        )
+
+        for price, cents in args:
+            with self.subTest(price):
+                self.assertEqual(parse_price(price), cents)
+
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(self.flight, '__dict__'))
+
+
+class TestOutputWriters(unittest.TestCase):
+
+    def setUp(self):
+        self.flights = {
+            'Outbound': Flight(date(2019, 7, 1), 960, 1070, 110, 'BOJ', 'BLL', 21000),
+            'Inbound': Flight(date(2019, 8, 5), 1140, 1380, 240, 'BLL', 'BOJ', 10550, 'Via SOF'),
+        }
+
+    def test_writer_requires_write_flight(self):
+        with self.assertRaises(TypeError):
+            FlightWriter(io.StringIO())
+
+    def test_table_total_cost(self):
+        output = io.StringIO()
+
+        with TableWriter(output) as writer:
+            writer.write_flights(self.flights)
+            writer.write_flights({'Outbound': self.flights['Outbound']})
+
+        lines = output.getvalue().splitlines()
+
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[0].startswith('Direction    Date'))
+        self.assertEqual(lines[3], 'Total cost   315.50 EUR')
+        self.assertTrue(lines[4].startswith('Outbound'))
+
+    def test_json_lines(self):
+        output = io.StringIO()
+
+        with JsonLinesWriter(output) as writer:
+            writer.write_flights(self.flights)
+
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        self.assertEqual(records[1], {
+            'direction': 'Inbound', 'date': '2019-08-05', 'departure': '19:00',
+            'arrival': '23:00', 'duration': 240, 'dep_city': 'BLL', 'dest_city': 'BOJ',
+            'price': 10550, 'currency': 'EUR', 'extra_info': 'Via SOF'
+        })
+
+    def test_csv(self):
+        output = io.StringIO()
+
+        with CsvWriter(output) as writer:
+            writer.write_flights(self.flights)
+
+        self.assertEqual(output.getvalue().splitlines()[:2], [
+            'direction,date,departure,arrival,duration,dep_city,dest_city,price,currency,extra_info',
+            'Outbound,2019-07-01,16:00,17:50,110,BOJ,BLL,21000,EUR,'
+        ])
+
+    def test_output_is_buffered(self):
+        output = io.StringIO()
+        writer = open_writer('jsonl', output, buffer_size=1000)
+        writer.write_flights(self.flights)
+
+        self.assertEqual(output.getvalue(), '')
+
+        for _ in range(10):
+            writer.write_flights(self.flights)
+
+        self.assertTrue(output.getvalue())
+
+        writer.close()
+
+        self.assertEqual(len(output.getvalue().splitlines()), 22)
+
+
+class TestIterQuoteRows(unittest.TestCase):
+
+    @staticmethod
+    def to_text(flights):
+        return [
+            (
+                flight['flight_id'],
+                [cell.text for cell in flight['info']],
+                [cell.text for cell in flight['price_and_extra_info']]
+            )
+            for flight in flights
+        ]
+
+    def test_same_rows_as_full_parsing(self):
+        page = build_quotes_page(generate_flights(50)).encode()
+        table = lxml.html.document_fromstring(page).xpath('//table[@id="flywiz_tblQuotes"]')[0]
+        chunks = [page[start:start + 7] for start in range(0, len(page), 7)]
+
+        self.assertEqual(
+            self.to_text(iter_quote_rows(chunks)), self.to_text(parse_quotes_table(table))
+        )
+
+    def test_emit_flight_before_page_end(self):
+        page = build_quotes_page(generate_flights(100)).encode()
+        chunks = [page[start:start + 512] for start in range(0, len(page), 512)]
+        consumed = []
+
+        def read_chunks():
+            for chunk in chunks:
+                consumed.append(chunk)
+                yield chunk
+
+        first = next(iter_quote_rows(read_chunks()))
+
+        self.assertEqual(first['flight_id'], '00000')
+        self.assertLess(len(consumed), len(chunks))
+
+    def test_price_row_before_info_row(self):
+        page = (
+            '<html><body><p>Header</p><table id="flywiz_tblQuotes">'
+            '<tr id="flywiz_rprc12345"><td>Price: 210.00 EUR</td></tr>'
+            '<tr id="flywiz_rinf12345"><td></td><td>Mon, 1 Jul 19</td></tr>'
+            '</table></body></html>'
+        )
+        flights = list(iter_quote_rows([page]))
+
+        self.assertEqual(self.to_text(flights), [
+            ('12345', [None, 'Mon, 1 Jul 19'], ['Price: 210.00 EUR'])
+        ])
+
+    def test_missing_table(self):
+        with self.assertRaises(ValueError):
+            list(iter_quote_rows([b'<html><body>Not found</body></html>']))
+
+    def test_stream_flights_from_server(self):
+        query = SearchQuery('CPH', 'BOJ', datetime(2019, 6, 26), 4, datetime(2019, 7, 4))
+
+        with QuotesStubServer() as server:
+            flights = source.stream_flights(
+                source.create_url_parameters(query), query, url=server.url
+            )
+
+        self.assertEqual(flights['Outbound'].price, 58000)
+        self.assertEqual(flights['Inbound'].date, date(2019, 7, 4))
+
+
+class TestMatchFlights(unittest.TestCase):
+
+    def setUp(self):
+        self.flights = generate_flights(200)
+        # Inbound flight of round trip SOF - VAR, outbound is flights[10]
+        self.flights[20] = (
+            '99999', 'Tue, 16 Jul 19', '10:00', '12:00', 'Varna (VAR)', 'Sofia (SOF)', 300, ''
+        )
+        self.page = build_quotes_page(self.flights).encode()
+        self.chunks = [self.page[start:start + 512] for start in range(0, len(self.page), 512)]
+        self.events = []
+        PROFILER.add_hook(self.events.append)
+
+    def tearDown(self):
+        if self.events.append in PROFILER.hooks:
+            PROFILER.remove_hook(self.events.append)
+
+    def counters(self):
+        return {
+            name: sum(event.count for event in self.events if event.name == name)
+            for name in ('rows_matched', 'rows_skipped')
+        }
+
+    def test_stop_after_searched_directions(self):
+        query = SearchQuery('SOF', 'VAR', datetime(2019, 7, 6), 1, datetime(2019, 7, 16))
+        consumed = []
+
+        def read_chunks():
+            for chunk in self.chunks:
+                consumed.append(chunk)
+                yield chunk
+
+        flights = source.match_flights(iter_quote_rows(read_chunks()), query)
+
+        self.assertEqual(flights['Outbound'].departure, parse_minutes('05:50'))
+        self.assertEqual(flights['Inbound'].price, 30000)
+        self.assertLess(len(consumed), len(self.chunks) / 2)
+        self.assertEqual(self.counters(), {'rows_matched': 2, 'rows_skipped': 19})
+
+    def test_extraction_stats_without_profiling(self):
+        PROFILER.remove_hook(self.events.append)
+        query = SearchQuery('SOF', 'VAR', datetime(2019, 7, 6), 1, datetime(2019, 7, 16))
+        source.extraction_stats(reset=True)
+        source.match_flights(iter_quote_rows(self.chunks), query)
+
+        self.assertFalse(PROFILER.active)
+        self.assertEqual(
+            source.extraction_stats(reset=True),
+            {'rows_matched': 2, 'rows_skipped': 19, 'hit_rate': 2 / 21}
+        )
+        self.assertEqual(source.extraction_stats()['rows_matched'], 0)
+
+    def test_skipped_rows_are_not_parsed(self):
+        self.flights[0] = ('00000', 'Unknown', '', '', 'Nowhere', 'Nowhere', 0, '')
+        query = SearchQuery('SOF', 'VAR', datetime(2019, 7, 6), 1)
+
+        with mock.patch.object(
+                source, 'write_flight_information', wraps=source.write_flight_information
+        ) as write_flight_information:
+            flights = source.match_flights(
+                iter_quote_rows([build_quotes_page(self.flights)]), query
+            )
+
+        self.assertEqual(list(flights), ['Outbound'])
+        self.assertEqual(write_flight_information.call_count, 1)
+        self.assertEqual(self.counters(), {'rows_matched': 1, 'rows_skipped': 10})
+
+    def test_zero_padded_date(self):
+        self.flights[10] = (
+            '00010', 'Sat,  06 Jul 19', '05:50', '08:30', 'Sofia (SOF)', 'Varna (VAR)', 110, ''
+        )
+        query = SearchQuery('SOF', 'VAR', datetime(2019, 7, 6), 1)
+        flights = source.match_flights(iter_quote_rows([build_quotes_page(self.flights)]), query)
+
+        self.assertEqual(flights['Outbound'].date, date(2019, 7, 6))
+
+    def test_first_matching_row_ignoring_case(self):
+        self.flights[10] = (
+            '00010', 'SAT, 6 JUL 19', '05:50', '08:30', 'Sofia (sof)', 'Varna (Var)', 110, ''
+        )
+        self.flights.insert(11, (
+            '00099', 'Sat, 6 Jul 19', '06:50', '09:30', 'Sofia (SOF)', 'Varna (VAR)', 90, ''
+        ))
+        query = SearchQuery('SOF', 'VAR', datetime(2019, 7, 6), 1)
+        flights = source.match_flights(iter_quote_rows([build_quotes_page(self.flights)]), query)
+
+        self.assertEqual(flights['Outbound'].departure, parse_minutes('05:50'))
+        self.assertEqual(flights['Outbound'].dep_city, 'SOF')
+        self.assertEqual(flights['Outbound'].price, 11000)
+
+    def test_early_exit_caches_whole_page(self):
+        query = SearchQuery('BLL', 'BOJ', datetime(2019, 7, 22), 7)
+        parameters = source.create_url_parameters(query)
+        cache = QuoteCache(':memory:')
+
+        with QuotesStubServer() as server, mock.patch.object(source, 'CHUNK_SIZE', 256):
+            flights = source.stream_flights(parameters, query, url=server.url, cache=cache)
+
+        self.assertEqual(flights['Outbound'].date, date(2019, 7, 22))
+        self.assertEqual(self.counters(), {'rows_matched': 1, 'rows_skipped': 1})
+        self.assertEqual(len(list(iter_quote_rows([cache.get(parameters)]))), 3)
+        cache.close()
+
+
+class TestSearchMany(unittest.TestCase):
+
+    def setUp(self):
+        self.queries = [
+            SearchQuery('BLL', 'BOJ', datetime(2019, 7, 22), 7),
+            SearchQuery('BOJ', 'BLL', datetime(2019, 7, 1), 2, datetime(2019, 8, 5)),
+            SearchQuery('CPH', 'BOJ', datetime(2019, 6, 26), 4, datetime(2019, 7, 4)),
+        ]
+
+    def test_return_results_for_all_queries(self):
+        with QuotesStubServer() as server:
+            results = search(self.queries, concurrency=2, url=server.url)
+
+        self.assertEqual(server.requests_count, 3)
+        self.assertEqual({result.query for result in results}, set(self.queries))
+
+        flights = {result.query: result.flights for result in results}
+        self.assertEqual(flights[self.queries[0]]['Outbound'].price, 120400)
+        self.assertEqual(flights[self.queries[1]]['Inbound'].date, date(2019, 8, 5))
+        self.assertEqual(flights[self.queries[2]]['Inbound'].extra_info, 'Night flight')
+
+    def test_report_errors_per_query(self):
+        queries = [
+            SearchQuery('CPH', 'BLL', datetime(2019, 7, 1), 1),
+            SearchQuery('BOJ', 'BLL', datetime(2019, 7, 8), 1),
+        ]
+
+        with QuotesStubServer() as server:
+            results = search(queries, url=server.url)
+
+        errors = {result.query: type(result.error) for result in results}
+        # Unknown route is rejected before request, second page is not recorded
+        self.assertEqual(errors, {queries[0]: KeyError, queries[1]: ValueError})
+        self.assertEqual(server.requests_count, 1)
+
+    def test_take_queries_as_results_complete(self):
+        read = []
+
+        def queries():
+            for query in self.queries * 10:
+                read.append(query)
+                yield query
+
+        async def first_result():
+            async for result in search_many(queries(), concurrency=1):
+                return len(read)
+
+        with mock.patch('src.search.run_query', lambda query, *args: SearchResult(query, {})):
+            self.assertLessEqual(asyncio.run(first_result()), 1 + 2 * WINDOW_FACTOR)
+
+
+class TestFetcher(unittest.TestCase):
+
+    parameters = {
+        'ow': '', 'lang': 'en', 'depdate': '22.07.2019',
+        'aptcode1': 'BLL', 'aptcode2': 'BOJ', 'paxcount': 1
+    }
+
+    def test_retry_server_errors(self):
+        with QuotesStubServer(FlakyQuotesRequestHandler) as server, \
+                Fetcher(backoff=0.01) as fetcher:
+            server.server.failures = 2
+            response = fetcher.get(server.url, params=self.parameters)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(server.requests_count, 3)
+
+        self.assertEqual(fetcher.timings[-1].attempts, 3)
+        self.assertEqual(fetcher.stats()['retries'], 2)
+        self.assertEqual(fetcher.stats()['failures'], 0)
+
+    def test_return_last_response_after_retries(self):
+        with QuotesStubServer(FlakyQuotesRequestHandler) as server, \
+                Fetcher(retries=1, backoff=0.01) as fetcher:
+            server.server.failures = 5
+            response = fetcher.get(server.url, params=self.parameters)
+
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(server.requests_count, 2)
+
+        self.assertEqual(fetcher.stats()['failures'], 1)
+
+    def test_read_timeout(self):
+        with QuotesStubServer(FlakyQuotesRequestHandler) as server, \
+                Fetcher(timeout=0.05, retries=1, backoff=0.01) as fetcher:
+            server.server.delay = 0.5
+
+            with self.assertRaises(requests.Timeout):
+                fetcher.get(server.url, params=self.parameters)
+
+            self.assertEqual(server.requests_count, 2)
+
+        self.assertIsNotNone(fetcher.timings[-1].error)
+
+    def test_connection_error(self):
+        with socket.socket() as closed:
+            closed.bind(('127.0.0.1', 0))
+            port = closed.getsockname()[1]
+
+        with Fetcher(retries=2, backoff=0.01) as fetcher:
+            with self.assertRaises(requests.ConnectionError):
+                fetcher.get(f'http://127.0.0.1:{port}/fly/quote3.aspx')
+
+        self.assertEqual(fetcher.stats()['attempts'], 3)
+
+    def test_token_bucket(self):
+        now = [0.0]
+        waits = []
+        bucket = TokenBucket(2, 2, clock=lambda: now[0], sleep=waits.append)
+
+        for _ in range(4):
+            bucket.acquire()
+
+        self.assertEqual(waits, [0.5, 1.0])
+
+        now[0] = 10.0
+        self.assertEqual(bucket.acquire(), 0.0)
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_disabled_profiler_records_nothing(self):
+        profiler = Profiler()
+
+        with profiler.stage('parse'):
+            profiler.count('flights')
+
+        self.assertEqual(profiler.snapshot(), {})
+
+    def test_nested_stage_time_is_exclusive(self):
+        profiler = Profiler()
+        profiler.enable()
+
+        with profiler.stage('extract'):
+            with profiler.stage('fetch'):
+                time.sleep(0.05)
+
+        snapshot = profiler.snapshot()
+
+        self.assertEqual(list(snapshot), ['fetch', 'extract'])
+        self.assertGreaterEqual(snapshot['fetch']['seconds'], 0.05)
+        self.assertLess(snapshot['extract']['seconds'], 0.05)
+
+    def test_hooks_receive_search_stages(self):
+        events = []
+        PROFILER.add_hook(events.append)
+        query = SearchQuery('BOJ', 'BLL', datetime(2019, 7, 1), 2, datetime(2019, 8, 5))
+
+        try:
+            with QuotesStubServer() as server:
+                source.stream_flights(source.create_url_parameters(query), query, url=server.url)
+        finally:
+            PROFILER.remove_hook(events.append)
+
+        self.assertEqual(
+            {event.name for event in events},
+            {'fetch', 'parse', 'extract', 'flights', 'rows_matched', 'rows_skipped'}
+        )
+        self.assertEqual(sum(event.count for event in events if event.name == 'flights'), 4)
+
+    def test_finish_prints_report_and_saves_pstats(self):
+        import pstats
+
+        profiler = Profiler()
+        report = io.StringIO()
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'search.pstats')
+            profiler.enable(output)
+
+            with profiler.stage('format'):
+                format_price(1000)
+
+            profiler.finish(report)
+
+            self.assertTrue(pstats.Stats(output).total_calls)
+
+        self.assertIn('format', report.getvalue())
+        self.assertFalse(profiler.enabled)
+
+
+class TestParserPool(unittest.TestCase):
+
+    def setUp(self):
+        query = SearchQuery('BOJ', 'BLL', datetime(2019, 7, 1), 2, datetime(2019, 8, 5))
+
+        with open(os.path.join(PAGES_DIR, 'boj_bll_01.07.2019_rt_05.08.2019.html'), 'rb') as page:
+            body = page.read()
+
+        self.jobs = [
+            PageJob(query._replace(passengers=passengers), body) for passengers in range(1, 8)
+        ] + [PageJob(query, b'<html><body>Not found</body></html>')]
+
+    def test_results_match_parsing_in_process(self):
+        with ParserPool(0) as pool:
+            expected = list(pool.map(self.jobs))
+
+        with ParserPool(2, chunk_size=3) as pool:
+            ordered = list(pool.map(self.jobs))
+            completed = list(pool.map(self.jobs, ordered=False))
+
+        self.assertEqual(
+            [result.flights for result in ordered], [result.flights for result in expected]
+        )
+        self.assertEqual(ordered[2].flights['Inbound'].price, 31500)
+        self.assertIsInstance(ordered[-1].error, ValueError)
+        self.assertCountEqual(
+            [result.query for result in completed], [result.query for result in expected]
+        )
+
+    def test_search_parallel(self):
+        queries = [
+            SearchQuery('BLL', 'BOJ', datetime(2019, 7, 22), 7),
+            SearchQuery('BOJ', 'BLL', datetime(2019, 7, 1), 2, datetime(2019, 8, 5)),
+            SearchQuery('CPH', 'BLL', datetime(2019, 7, 1), 1),
+        ]
+
+        async def collect():
+            return [result async for result in search_parallel(queries, pool, 2, url=server.url)]
+
+        with QuotesStubServer() as server, ParserPool(2) as pool:
+            results = {result.query: result for result in asyncio.run(collect())}
+
+        self.assertEqual(results[queries[0]].flights['Outbound'].price, 120400)
+        self.assertEqual(results[queries[1]].flights['Inbound'].date, date(2019, 8, 5))
+        self.assertIsInstance(results[queries[2]].error, KeyError)
+
+    def test_search_parallel_in_chunks(self):
+        queries = [
+            SearchQuery('BOJ', 'BLL', datetime(2019, 7, 1), passengers, datetime(2019, 8, 5))
+            for passengers in range(1, 8)
+        ] + [SearchQuery('CPH', 'BLL', datetime(2019, 7, 1), 1)]
+
+        async def collect():
+            return [
+                result async for result in search_parallel(
+                    queries, pool, 4, url=server.url, ordered=True
+                )
+            ]
+
+        with QuotesStubServer(SyntheticQuotesRequestHandler) as server, \
+                ParserPool(1, chunk_size=3) as pool, \
+                mock.patch.object(pool, 'parse_many', wraps=pool.parse_many) as parse_many:
+            results = asyncio.run(collect())
+
+        self.assertEqual([result.query for result in results], queries)
+        self.assertEqual(results[6].flights['Outbound'].price, 7 * results[0].flights['Outbound'].price)
+        self.assertIsInstance(results[-1].error, KeyError)
+        self.assertLessEqual(max(len(call.args[0]) for call in parse_many.call_args_list), 3)
+        self.assertEqual(sum(len(call.args[0]) for call in parse_many.call_args_list), 7)
+
+
+class TestQuoteArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'quotes.zip')
+        self.queries = [
+            SearchQuery('BLL', 'BOJ', datetime(2019, 7, 22), 7),
+            SearchQuery('BOJ', 'BLL', datetime(2019, 7, 1), 2, datetime(2019, 8, 5)),
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def search(self, session, url='http://127.0.0.1:1/fly/quote3.aspx'):
+        return [
+            source.stream_flights(source.create_url_parameters(query), query, session, url)
+            for query in self.queries
+        ]
+
+    def test_replay_recorded_searches(self):
+        with QuotesStubServer() as server:
+            with archive_session(record=self.path) as session:
+                recorded = self.search(session, server.url)
+
+        with archive_session(replay=self.path) as session:
+            replayed = self.search(session)
+            missing = SearchQuery('BOJ', 'BLL', datetime(2019, 7, 8), 1)
+
+            with self.assertRaises(NotRecordedError):
+                source.stream_flights(source.create_url_parameters(missing), missing, session)
+
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(recorded[1]['Inbound'].price, 21000)
+
+    def test_replay_past_dates_outside_schedule(self):
+        # No flights in schedule on Tuesday, as if schedule changed after recording
+        query = SearchQuery('BOJ', 'BLL', datetime(2019, 7, 2), 2)
+        missing = query._replace(passengers=3)
+
+        with open(os.path.join(PAGES_DIR, 'boj_bll_01.07.2019_rt_05.08.2019.html'), 'rb') as page:
+            body = page.read()
+
+        with QuoteArchive(self.path, 'a') as archive:
+            archive.put(source.create_url_parameters(query), 200, body, 'utf-8')
+
+        with archive_session(replay=self.path) as session:
+            replayed = run_query(query, session)
+            not_recorded = run_query(missing, session)
+
+        self.assertEqual(replayed.error, None)
+        self.assertEqual(replayed.flights, {})
+        self.assertIsInstance(not_recorded.error, KeyError)
+
+        arguments = ['BOJ', 'BLL', '01.07.2019', '2', f'--replay={self.path}']
+        self.assertEqual(source.parse_arguments(arguments).dep_date, datetime(2019, 7, 1))
+
+        with self.assertRaises(SystemExit):
+            source.parse_arguments(arguments[:-1])
+
+        items = list(read_queries(
+            io.StringIO('{"dep_city": "BOJ", "dest_city": "BLL", "dep_date": "01.07.2019", "passengers": 2}'),
+            validator=QueryValidator(allow_past=True)
+        ))
+        self.assertEqual([type(item) for item in items], [SearchQuery])
+
+    def test_append_to_archive(self):
+        parameters = source.create_url_parameters(self.queries[0])
+
+        with QuoteArchive(self.path, 'a') as archive:
+            archive.put(parameters, 503, b'Busy')
+
+        with QuoteArchive(self.path, 'a') as archive:
+            archive.put(parameters, 200, 'Ценa'.encode(), 'utf-8')
+
+        with QuoteArchive(self.path) as archive:
+            response = archive.get(parameters)
+
+            self.assertEqual(len(archive), 1)
+            self.assertEqual((response.status_code, response.text), (200, 'Ценa'))
+            self.assertIsNone(archive.get(source.create_url_parameters(self.queries[1])))
+
+
+class TestRevalidateFlights(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = QuoteCache(':memory:', ttl=0)
+        self.query = SearchQuery('BOJ', 'BLL', datetime(2019, 7, 1), 2, datetime(2019, 8, 5))
+        self.parameters = source.create_url_parameters(self.query)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def revalidate(self, server, query=None):
+        query = query or self.query
+
+        return source.revalidate_flights(
+            source.create_url_parameters(query), query, url=server.url, cache=self.cache
+        )
+
+    def test_not_modified_page(self):
+        with QuotesStubServer(ETagQuotesRequestHandler) as server:
+            flights, first = self.revalidate(server)
+
+            with mock.patch('src.parser.iter_quote_rows') as parser:
+                cached, second = self.revalidate(server)
+
+            self.assertEqual(server.server.not_modified_count, 1)
+
+        parser.assert_not_called()
+        self.assertEqual((first, second), (source.PARSED, source.REVALIDATED))
+        self.assertEqual(cached, flights)
+        self.assertEqual(cached['Inbound'].price, 21000)
+
+    def test_unchanged_page_is_not_parsed(self):
+        with QuotesStubServer() as server:
+            flights, first = self.revalidate(server)
+
+            with mock.patch('src.parser.iter_quote_rows') as parser:
+                cached, second = self.revalidate(server)
+
+            self.assertEqual(server.requests_count, 2)
+
+        parser.assert_not_called()
+        self.assertEqual((first, second), (source.PARSED, source.UNCHANGED))
+        self.assertEqual(cached, flights)
+
+    def test_fresh_page_is_not_downloaded(self):
+        self.cache.ttl = 60
+
+        with QuotesStubServer() as server:
+            self.revalidate(server)
+            _, status = self.revalidate(server)
+
+            self.assertEqual(server.requests_count, 1)
+
+        self.assertEqual(status, source.UNCHANGED)
+
+    def test_changed_page_is_parsed(self):
+        self.cache.put_parsed(
+            dict(self.parameters, passengers=2), ParsedPage('outdated', {}, '"outdated"')
+        )
+
+        with QuotesStubServer(ETagQuotesRequestHandler) as server:
+            flights, status = self.revalidate(server)
+
+        self.assertEqual(status, source.PARSED)
+        self.assertEqual(flights['Outbound'].price, 21000)
+
+    def test_parsed_flights_depend_on_passengers(self):
+        with QuotesStubServer(ETagQuotesRequestHandler) as server:
+            self.revalidate(server)
+            parameters = dict(self.parameters, paxcount=2)
+            query = self.query._replace(passengers=4)
+            flights, status = source.revalidate_flights(
+                parameters, query, url=server.url, cache=self.cache
+            )
+
+        self.assertEqual(status, source.PARSED)
+        self.assertEqual(flights['Outbound'].price, 42000)
+
+
+class TestQuoteCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = QuoteCache(':memory:', ttl=60, max_entries=2)
+        self.parameters = {
+            'rt': None, 'ow': '', 'lang': 'en', 'depdate': '08.07.2019',
+            'aptcode1': 'BOJ', 'rtdate': None, 'aptcode2': 'BLL', 'paxcount': 2
+        }
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_normalized_key(self):
+        reordered = dict(reversed(list(self.parameters.items())))
+        reordered['paxcount'] = '2'
+        reordered['aptcode1'] = 'boj'
+
+        self.assertEqual(
+            QuoteCache.make_key(self.parameters), QuoteCache.make_key(reordered)
+        )
+
+    def test_hits_and_misses(self):
+        self.assertIsNone(self.cache.get(self.parameters))
+        self.cache.put(self.parameters, '<html></html>')
+
+        self.assertEqual(self.cache.get(self.parameters), '<html></html>')
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'entries': 1})
+
+    def test_expired_page(self):
+        self.cache.ttl = 0
+        self.cache.put(self.parameters, '<html></html>')
+
+        self.assertIsNone(self.cache.get(self.parameters))
+
+    def test_short_ttl_keeps_pages_of_other_instances(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'quotes.sqlite3')
+
+            with QuoteCache(path, ttl=60) as cache, QuoteCache(path, ttl=0) as short_cache:
+                cache.put(self.parameters, '<html></html>')
+                short_cache.put(dict(self.parameters, paxcount=1), '<html></html>')
+
+                self.assertEqual(cache.get(self.parameters), '<html></html>')
+                self.assertIsNone(short_cache.get(self.parameters))
+
+    def test_evict_least_recently_used(self):
+        pages = [dict(self.parameters, paxcount=count) for count in (1, 2, 3)]
+        self.cache.put(pages[0], 'first')
+        self.cache.put(pages[1], 'second')
+        # Reading makes first page the most recently used one
+        self.cache.get(pages[0])
+        self.cache.put(pages[2], 'third')
+
+        self.assertEqual(self.cache.get(pages[0]), 'first')
+        self.assertIsNone(self.cache.get(pages[1]))
+        self.assertEqual(self.cache.get(pages[2]), 'third')
+
+    def test_purge(self):
+        self.cache.put(self.parameters, '<html></html>')
+        self.cache.purge()
+
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_search_uses_cache(self):
+        query = SearchQuery('BLL', 'BOJ', datetime(2019, 7, 22), 7)
+
+        with QuotesStubServer() as server:
+            first = search([query], url=server.url, cache=self.cache)
+            second = search([query], url=server.url, cache=self.cache)
+
+        self.assertEqual(server.requests_count, 1)
+        self.assertEqual(first[0].flights, second[0].flights)
+
+
+class TestFareHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.history = FareHistory(':memory:')
+        self.flight = Flight(date(2019, 7, 4), 5, 115, 110, 'BOJ', 'CPH', 58000)
+        self.addCleanup(self.history.close)
+
+    def record_prices(self, prices, passengers=4, step=3600):
+        for index, price in enumerate(prices):
+            self.history.record([self.flight._replace(price=price)], passengers, index * step)
+
+    def test_unchanged_observations_extend_row(self):
+        self.record_prices([58000, 58000, 58000, 60000, 60000, 58000])
+        observations = self.history.history('BOJ', 'CPH', date(2019, 7, 4), 4)
+
+        self.assertEqual(
+            [(observation.price, observation.observed, observation.last_seen) for observation in observations],
+            [(58000, 0, 7200), (60000, 10800, 14400), (58000, 18000, 18000)]
+        )
+        self.assertEqual(observations[0].flight, self.flight)
+        self.assertEqual(self.history.stats(), {'rows': 3, 'flights': 1})
+
+    def test_range_query(self):
+        self.record_prices([58000, 58000, 60000, 61000])
+        self.record_prices([30000], passengers=2)
+
+        self.assertEqual(
+            [observation.price for observation in self.history.history('BOJ', 'CPH', date(2019, 7, 4), 4, 3600, 7200)],
+            [58000, 60000]
+        )
+        self.assertEqual(len(self.history.history('BOJ', 'CPH', date(2019, 7, 4))), 4)
+        self.assertEqual(self.history.history('BOJ', 'CPH', date(2019, 7, 5)), [])
+
+    def test_trend(self):
+        self.record_prices([58000, 58000, 60000, 55000, 55000, 55000], step=12 * 3600)
+
+        self.assertEqual(self.history.trend('BOJ', 'CPH', date(2019, 7, 4), 4, 0, 3 * 86400), [
+            TrendPoint(0, 58000, 58000, 58000),
+            TrendPoint(86400, 55000, 60000, 55000),
+            TrendPoint(2 * 86400, 55000, 55000, 55000),
+        ])
+
+    def test_reject_empty_bucket(self):
+        with self.assertRaises(ValueError):
+            self.history.trend('BOJ', 'CPH', date(2019, 7, 4), 4, 0, 86400, bucket=0)
+
+        with self.assertRaises(SystemExit), mock.patch('sys.stderr', io.StringIO()):
+            history_arguments(['BOJ', 'CPH', '04.07.2019', '4', '--bucket', '0'])
+
+    def test_compact(self):
+        # Rows written without merging, e.g. by concurrent writers
+        for index, price in enumerate([58000, 58000, 60000, 60000, 58000]):
+            self.history._connection.execute(
+                'INSERT INTO fares VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ('BOJ', 'CPH', '2019-07-04', 4, index, index, 5, 115, 110, price, '')
+            )
+
+        self.assertEqual(self.history.compact(), 2)
+        self.assertEqual(
+            [(observation.price, observation.observed, observation.last_seen)
+             for observation in self.history.history('BOJ', 'CPH', date(2019, 7, 4))],
+            [(58000, 0, 1), (60000, 2, 3), (58000, 4, 4)]
+        )
+        self.assertEqual(self.history.compact(), 0)
+
+
+class TestDerivePassengers(unittest.TestCase):
+
+    def setUp(self):
+        self.query = SearchQuery('BOJ', 'BLL', datetime(2019, 7, 8), 1)
+
+        with open(os.path.join(PAGES_DIR, 'pax', 'boj_bll_08.07.2019_ow_1.html')) as page:
+            # Page shows fare per person, so linear pricing gives the same page
+            self.pages = dict.fromkeys((1, 2, 4), page.read())
+
+    def test_detect_group_discount(self):
+        self.assertEqual(check_linear_pricing(self.pages, self.query), [])
+
+        self.pages[4] = self.pages[4].replace('Price: 119.00 EUR', 'Price: 99.00 EUR')
+        mismatches = check_linear_pricing(self.pages, self.query)
+
+        self.assertEqual(len(mismatches), 1)
+        self.assertTrue(mismatches[0].startswith('4 passengers, Outbound'))
+
+    def test_fetch_once_for_all_passengers(self):
+        requested = []
+
+        def fetch(parameters):
+            requested.append(parameters['paxcount'])
+
+            return self.pages[1]
+
+        fares = PassengerFareCache(fetch)
+        prices = [
+            fares.find(self.query._replace(passengers=passengers))['Outbound'].price
+            for passengers in range(1, 9)
+        ]
+
+        self.assertEqual(requested, [1])
+        self.assertEqual(prices, [11900 * passengers for passengers in range(1, 9)])
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_read_json_lines(self):
+        stream = io.StringIO(
+            '{"dep_city": "BOJ", "dest_city": "BLL", "dep_date": "01.07.2099", "passengers": 2}\n'
+            '\n'
+            '{"dep_city": "CPH", "dest_city": "BOJ", "dep_date": "26.06.2099", '
+            '"passengers": "4", "return_date": "04.07.2099"}\n'
+        )
+        self.assertEqual(list(read_queries(stream)), [
+            SearchQuery('BOJ', 'BLL', datetime(2099, 7, 1), 2),
+            SearchQuery('CPH', 'BOJ', datetime(2099, 6, 26), 4, datetime(2099, 7, 4)),
+        ])
+
+    def test_read_csv(self):
+        stream = io.StringIO(
+            'dep_city,dest_city,dep_date,passengers,return_date\n'
+            'BOJ,BLL,01.07.2099,2,\n'
+            'BOJ,B0J,01.07.2099,2,\n'
+            'BOJ,BLL,01.07.2099,10,05.08.2099\n'
+        )
+        query, *invalid = read_queries(stream)
+
+        self.assertEqual(query, SearchQuery('BOJ', 'BLL', datetime(2099, 7, 1), 2))
+        self.assertEqual([record['dest_city'] for record, _ in invalid], ['B0J', 'BLL'])
+
+    def test_query_validator(self):
+        validator = QueryValidator(today=date(2099, 6, 30))
+        record = {'dep_city': 'BOJ', 'dest_city': 'BLL', 'dep_date': '01.07.2099', 'passengers': '2'}
+
+        for _ in range(3):
+            self.assertEqual(
+                validator.to_query(record), SearchQuery('BOJ', 'BLL', datetime(2099, 7, 1), 2)
+            )
+
+        self.assertEqual(validator.parse_date.cache_info().hits, 2)
+
+        with self.assertRaises(argparse.ArgumentTypeError):
+            validator.to_query(dict(record, dep_date='30.06.2099'))
+
+    def test_stream_one_result_per_line(self):
+        queries = [
+            SearchQuery('BLL', 'BOJ', datetime(2019, 7, 22), 7),
+            SearchQuery('BOJ', 'BLL', datetime(2019, 7, 1), 2, datetime(2019, 8, 5)),
+            SearchQuery('BOJ', 'SOF', datetime(2019, 7, 1), 2),
+        ]
+        output = io.StringIO()
+
+        with QuotesStubServer() as server:
+            failed = asyncio.run(run_batch(queries, output, concurrency=2, url=server.url))
+
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        results = {line['query']['dest_city']: line for line in lines}
+
+        self.assertEqual(failed, 1)
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(results['BOJ']['flights']['Outbound']['Price'], '1204.00 EUR')
+        self.assertEqual(results['BLL']['flights']['Inbound']['Date'], 'Mon, 5 Aug 19')
+        self.assertIn('Route not found', results['SOF']['error'])
+
+    def test_write_flights_with_writer(self):
+        queries = [
+            SearchQuery('BOJ', 'BLL', datetime(2019, 7, 1), 2, datetime(2019, 8, 5)),
+            SearchQuery('BOJ', 'SOF', datetime(2019, 7, 1), 2),
+        ]
+        errors = io.StringIO()
+        output = io.StringIO()
+
+        with QuotesStubServer() as server, CsvWriter(output) as writer, \
+                FareHistory(':memory:') as history:
+            failed = asyncio.run(run_batch(
+                queries, errors, url=server.url, writer=writer, history=history
+            ))
+            recorded = history.stats()
+
+        self.assertEqual(failed, 1)
+        self.assertEqual(len(output.getvalue().splitlines()), 3)
+        self.assertEqual(recorded, {'rows': 2, 'flights': 2})
+        self.assertIn('Route not found', json.loads(errors.getvalue())['error'])
+
+
+class SlowQuotesRequestHandler(QuotesRequestHandler):
+
+    def do_GET(self):
+        time.sleep(0.3)
+        super().do_GET()
+
+
+class TestFlightServer(unittest.TestCase):
+
+    def setUp(self):
+        self.upstream = QuotesStubServer(SlowQuotesRequestHandler).__enter__()
+        self.server = FlightServer(
+            ('127.0.0.1', 0), url=self.upstream.url, query_parser=self.parse_query
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.upstream.__exit__()
+
+    @staticmethod
+    def parse_query(fields):
+        # Recorded pages are from 2019, so dates in the past are accepted
+        return SearchQuery(
+            fields['dep_city'], fields['dest_city'],
+            datetime.strptime(fields['dep_date'], '%d.%m.%Y'), int(fields['passengers'])
+        )
+
+    def get(self, path):
+        try:
+            with urllib.request.urlopen(self.url + path) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as error:
+            return error.code, json.load(error)
+
+    def test_coalesce_identical_queries(self):
+        path = '/search?dep_city=BLL&dest_city=BOJ&dep_date=22.07.2019&passengers=7'
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            responses = list(executor.map(self.get, [path] * 4))
+
+        self.assertEqual(self.upstream.requests_count, 1)
+        self.assertEqual({status for status, _ in responses}, {200})
+        self.assertEqual(responses[0][1]['flights']['Outbound']['Price'], '1204.00 EUR')
+
+        _, stats = self.get('/stats')
+
+        self.assertEqual(stats['requests'], 4)
+        self.assertEqual(stats['upstream_searches'], 1)
+        self.assertEqual(stats['coalesced_searches'], 3)
+        self.assertEqual(stats['upstream']['requests'], 1)
+        self.assertEqual(set(stats['latency_ms']), {'p50', 'p90', 'p99', 'max'})
+
+    def test_error_statuses(self):
+        self.assertEqual(self.get('/search?dep_city=BLL')[0], 400)
+        self.assertEqual(
+            self.get('/search?dep_city=CPH&dest_city=BLL&dep_date=01.07.2019&passengers=1')[0],
+            404
+        )
+        self.assertEqual(self.get('/unknown')[0], 404)
+
+
+class TestRequestCoalescer(unittest.TestCase):
+
+    def test_share_exception(self):
+        coalescer = RequestCoalescer()
+
+        def fail():
+            raise ValueError('upstream failed')
+
+        with self.assertRaises(ValueError):
+            coalescer.run('key', fail)
+
+        self.assertEqual(coalescer.run('key', lambda: 1), 1)
+        self.assertEqual(coalescer.calls, 2)
+
+    def test_latency_percentiles(self):
+        stats = LatencyStats()
+
+        for milliseconds in range(1, 101):
+            stats.add(milliseconds / 1000)
+
+        self.assertEqual(
+            {key: round(value) for key, value in stats.percentiles().items()},
+            {'p50': 50, 'p90': 90, 'p99': 99, 'max': 100}
+        )
+
+
+class TestFareTable(unittest.TestCase):
+
+    def setUp(self):
+        self.flights = [
+            Flight(date(2019, 7, 1), 600, 720, 120, 'BOJ', 'BLL', 10000),
+            Flight(date(2019, 7, 1), 1200, 1320, 120, 'BOJ', 'BLL', 14000, 'Night flight'),
+            Flight(date(2019, 7, 2), 480, 600, 120, 'BOJ', 'BLL', 9000),
+            Flight(date(2019, 7, 1), 900, 1050, 150, 'CPH', 'BOJ', 20000),
+        ]
+        self.table = FareTable.from_results([
+            SearchResult(None, {'Outbound': flight}) for flight in self.flights
+        ] + [SearchResult(None, None, KeyError('Route not found'))])
+
+    def test_columns(self):
+        self.assertEqual(len(self.table), 4)
+        self.assertEqual(list(self.table['price']), [10000, 14000, 9000, 20000])
+        self.assertEqual(list(self.table['dep_city']), [0, 0, 0, 2])
+        self.assertEqual(self.table.decode('dest_city'), ['BLL', 'BLL', 'BLL', 'BOJ'])
+
+    def test_reading_columns_freezes_table(self):
+        table = self.table.filter(dep_city='BOJ')
+        table.extend(self.flights[:1])
+        table.fares_by_route_date()
+        table.append(self.flights[3])
+
+        self.assertEqual(len(table['price']), 5)
+
+        with self.assertRaises(ValueError):
+            table.append(self.flights[0])
+
+    def test_filter(self):
+        table = self.table.filter(dep_city='BOJ', departs_after=540, end=date(2019, 7, 1))
+
+        self.assertEqual(list(table['departure']), [600, 1200])
+        self.assertEqual(len(self.table.filter(dest_city='SOF')), 0)
+        self.assertEqual(list(self.table.filter(max_price=10000)['price']), [10000, 9000])
+
+    def test_filtered_table_has_own_categories(self):
+        table = self.table.filter(dep_city='CPH')
+        table.append(Flight(date(2019, 7, 3), 600, 720, 120, 'SOF', 'BOJ', 8000, 'Charter'))
+
+        self.assertEqual(table.decode('dep_city'), ['CPH', 'SOF'])
+        self.assertIsNone(self.table.code('dep_city', 'SOF'))
+        self.assertEqual(self.table.categories('extra_info'), ['', 'Night flight'])
+
+    def test_fares_by_route_date(self):
+        self.assertEqual(self.table.fares_by_route_date(), {
+            'dep_city': ['BOJ', 'BOJ', 'CPH'],
+            'dest_city': ['BLL', 'BLL', 'BOJ'],
+            'date': [date(2019, 7, 1), date(2019, 7, 2), date(2019, 7, 1)],
+            'min_price': [10000, 9000, 20000],
+            'mean_price': [12000.0, 9000.0, 20000.0],
+            'count': [2, 1, 1]
+        })
+
+    def test_write_csv(self):
+        stream = io.StringIO()
+        self.table.filter(max_price=10000).write_csv(stream)
+
+        self.assertEqual(stream.getvalue().splitlines(), [
+            'date,departure,arrival,duration,dep_city,dest_city,price,extra_info',
+            '2019-07-01,10:00,12:00,120,BOJ,BLL,10000,',
+            '2019-07-02,08:00,10:00,120,BOJ,BLL,9000,'
+        ])
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_to_numpy(self):
+        records = self.table.to_numpy()
+
+        self.assertEqual(records['dep_city'].tolist(), ['BOJ', 'BOJ', 'BOJ', 'CPH'])
+        self.assertEqual(records['extra_info'][1], 'Night flight')
+
+
+class TestFareCalendar(unittest.TestCase):
+
+    @staticmethod
+    def flight(day, price, departure=600, arrival=720):
+        return Flight(date(2019, 7, day), departure, arrival, 120, 'CPH', 'BOJ', price)
+
+    def test_cheapest_return_for_every_outbound(self):
+        outbound = [self.flight(1, 100), self.flight(3, 100)]
+        inbound = [self.flight(2, 50), self.flight(4, 70), self.flight(6, 30)]
+
+        trips = cheapest_round_trips(outbound, inbound, min_stay=1, max_stay=3)
+
+        self.assertEqual(
+            [(trip.outbound.date.day, trip.inbound.date.day, trip.price) for trip in trips],
+            [(3, 6, 130), (1, 2, 150)]
+        )
+
+    def test_same_day_return_after_arrival(self):
+        outbound = [self.flight(1, 100, 600, 720)]
+        inbound = [self.flight(1, 10, 480, 600), self.flight(1, 40, 900, 1020)]
+
+        trips = cheapest_round_trips(outbound, inbound)
+
+        self.assertEqual(trips[0].inbound.departure, 900)
+
+    def test_matches_all_pairs_ranking(self):
+        outbound = [self.flight(day, (day * 37) % 50 * 100) for day in range(1, 29)]
+        inbound = [self.flight(day, (day * 53) % 40 * 100) for day in range(1, 29)]
+        best = {}
+
+        for trip in rank_round_trips(outbound, inbound, 2, 7, limit=len(outbound) ** 2):
+            best.setdefault(trip.outbound, trip.price)
+
+        trips = cheapest_round_trips(outbound, inbound, 2, 7)
+
+        self.assertEqual({trip.outbound: trip.price for trip in trips}, best)
+
+    def test_fetch_calendar_requests_every_leg_once(self):
+        routes = load_route_index()
+        outbound_dates = routes.dates('CPH', 'BOJ')
+        inbound_dates = routes.dates('BOJ', 'CPH')
+
+        with QuotesStubServer(SyntheticQuotesRequestHandler) as server:
+            calendar = asyncio.run(fetch_calendar('CPH', 'BOJ', 1, url=server.url))
+
+            self.assertEqual(server.requests_count, len(outbound_dates) + len(inbound_dates))
+
+        self.assertEqual(calendar.errors, [])
+        self.assertEqual([flight.date for flight in calendar.outbound], outbound_dates)
+        self.assertEqual([flight.date for flight in calendar.inbound], inbound_dates)
+        self.assertEqual(
+            calendar.inbound[0].price,
+            synthetic_price('BOJ', 'CPH', inbound_dates[0]) * 100
+        )
+
+        trips = cheapest_round_trips(calendar.outbound, calendar.inbound, min_stay=3)
+
+        self.assertTrue(all(
+            (trip.inbound.date - trip.outbound.date).days >= 3 for trip in trips
+        ))
+        self.assertEqual(trips, sorted(trips, key=lambda trip: trip.price))
+
+
+class TestConnections(unittest.TestCase):
+
+    def setUp(self):
+        day = date(2019, 7, 1)
+        self.flights = {
+            ('CPH', 'BOJ', day): Flight(day, 600, 720, 120, 'CPH', 'BOJ', 10000),
+            ('BOJ', 'BLL', day): Flight(day, 750, 870, 120, 'BOJ', 'BLL', 10000),
+            ('BOJ', 'BLL', date(2019, 7, 2)): Flight(date(2019, 7, 2), 600, 720, 120, 'BOJ', 'BLL', 9000),
+            ('CPH', 'BLL', date(2019, 7, 3)): Flight(date(2019, 7, 3), 600, 700, 100, 'CPH', 'BLL', 15000),
+        }
+        schedule = {}
+
+        for dep_city, dest_city, flight_date in self.flights:
+            schedule.setdefault((dep_city, dest_city), []).append(flight_date)
+
+        self.routes = RouteIndex(schedule)
+
+    def fetch_legs(self, keys):
+        return {key: self.flights.get(key) for key in keys}
+
+    def test_min_connection(self):
+        graph = LegGraph(self.fetch_legs, self.routes)
+        args = (
+            (60, [('CPH', 'BOJ', 1), ('BOJ', 'BLL', 2)]),
+            (30, [('CPH', 'BOJ', 1), ('BOJ', 'BLL', 1)]),
+        )
+
+        for min_connection, expected in args:
+            with self.subTest(min_connection):
+                itinerary = earliest_arrival(graph, 'CPH', 'BLL', date(2019, 7, 1), min_connection=min_connection)
+
+                self.assertEqual(
+                    [(leg.dep_city, leg.dest_city, leg.date.day) for leg in itinerary.legs], expected
+                )
+
+    def test_cheapest(self):
+        graph = LegGraph(self.fetch_legs, self.routes)
+        itinerary = cheapest_itinerary(graph, 'CPH', 'BLL', date(2019, 7, 1), min_connection=30)
+
+        self.assertEqual(itinerary.price, 15000)
+        self.assertEqual(len(itinerary.legs), 1)
+        self.assertIsNone(
+            cheapest_itinerary(graph, 'CPH', 'BLL', date(2019, 7, 1), date(2019, 7, 2), max_layover=0)
+        )
+
+    def test_large_schedule_fetches_needed_legs(self):
+        cities = [f'C{index:02d}' for index in range(30)]
+        start = date(2019, 7, 1)
+        flights = {}
+
+        for index, dep_city in enumerate(cities):
+            for step in (1, 2):
+                dest_city = cities[(index + step) % len(cities)]
+
+                for days in range(60):
+                    flight_date = start + timedelta(days=days)
+                    departure = (index * 97 + days * 31) % 1200
+                    flights[dep_city, dest_city, flight_date] = Flight(
+                        flight_date, departure, departure + 90 * step, 90 * step,
+                        dep_city, dest_city, 5000 + (index * 13 + days * 7) % 50 * 100
+                    )
+
+        schedule = {}
+
+        for dep_city, dest_city, flight_date in flights:
+            schedule.setdefault((dep_city, dest_city), []).append(flight_date)
+
+        graph = LegGraph(lambda keys: {key: flights.get(key) for key in keys}, RouteIndex(schedule))
+        earliest = earliest_arrival(graph, 'C00', 'C12', start, start + timedelta(days=30))
+        fetched = graph.fetched
+        cheapest = cheapest_itinerary(graph, 'C00', 'C12', start, start + timedelta(days=30))
+
+        self.assertEqual(len(flights), 3600)
+        self.assertLess(fetched, 300)
+        self.assertLessEqual(cheapest.price, earliest.price)
+        self.assertLessEqual(earliest.arrival, cheapest.arrival)
+
+        for itinerary in (earliest, cheapest):
+            self.assertEqual((itinerary.legs[0].dep_city, itinerary.legs[-1].dest_city), ('C00', 'C12'))
+
+            for leg, next_leg in zip(itinerary.legs, itinerary.legs[1:]):
+                self.assertEqual(leg.dest_city, next_leg.dep_city)
+                self.assertGreaterEqual(departure_time(next_leg), arrival_time(leg) + 60)
+
+    def test_fetch_legs_from_server(self):
+        with QuotesStubServer(SyntheticQuotesRequestHandler) as server:
+            fetch_legs = SearchLegFetcher(2, url=server.url)
+            itinerary = earliest_arrival(LegGraph(fetch_legs), 'CPH', 'BLL', date(2019, 6, 26))
+
+        self.assertEqual(
+            [(leg.dep_city, leg.dest_city, leg.date) for leg in itinerary.legs],
+            [('CPH', 'BOJ', date(2019, 6, 26)), ('BOJ', 'BLL', date(2019, 7, 1))]
+        )
+        self.assertEqual(fetch_legs.errors, [])
+
+
+class TestWatcher(unittest.TestCase):
+
+    class Sink:
+
+        def __init__(self):
+            self.sent = []
+
+        def send(self, events):
+            self.sent.append(events)
+
+    def setUp(self):
+        self.now = datetime(2019, 6, 20, 12).timestamp()
+        self.queries = [
+            SearchQuery('BOJ', 'BLL', datetime(2019, 7, 1), 2),
+            SearchQuery('CPH', 'BOJ', datetime(2019, 6, 26), 1, datetime(2019, 7, 4)),
+        ]
+
+    def test_poll_interval(self):
+        self.assertEqual(poll_interval(0, 0, 60, 3600), 60)
+        self.assertEqual(poll_interval(10, 0, 60, 3600), 600)
+        self.assertEqual(poll_interval(10, 1, 60, 3600), 1200)
+        self.assertEqual(poll_interval(10, 100, 60, 3600), 3600)
+
+    def test_diff_flights(self):
+        flight = {'date': '2019-07-01', 'price': 21000}
+        events = diff_flights(
+            {'Outbound': flight, 'Inbound': flight},
+            {'Outbound': dict(flight, price=19000), 'Return': flight}
+        )
+
+        self.assertEqual([(event['event'], event['direction']) for event in events], [
+            ('changed', 'Outbound'), ('added', 'Return'), ('removed', 'Inbound')
+        ])
+        self.assertEqual(events[0]['changes'], {'price': [21000, 19000]})
+        self.assertEqual(diff_flights({'Outbound': flight}, {'Outbound': dict(flight)}), [])
+
+    def test_polls_only_due_queries_and_sends_changes(self):
+        sink = self.Sink()
+
+        with tempfile.TemporaryDirectory() as directory, \
+                QuotesStubServer(SyntheticQuotesRequestHandler) as server:
+            state = os.path.join(directory, 'state.json')
+            watcher = Watcher(
+                self.queries, sink, url=server.url, min_interval=60, max_interval=3600,
+                state_path=state, clock=lambda: self.now
+            )
+            events = watcher.poll()
+
+            self.assertEqual(server.requests_count, 2)
+            self.assertEqual([event['event'] for event in events], ['added'] * 3)
+
+            # Departure in 6 days is polled before departure in 11 days,
+            # its interval doubles when nothing changes
+            start = self.now
+            self.now = watcher.next_due()
+
+            self.assertEqual(self.now, start + 60 * 6)
+            self.assertEqual(watcher.poll(), [])
+            self.assertEqual(server.requests_count, 3)
+            self.assertEqual(watcher.items[watch_key(self.queries[1])].due, self.now + 60 * 6 * 2)
+            self.assertEqual(watcher.next_due(), start + 60 * 11)
+
+            # Snapshots survive restart, unchanged flights are not reported
+            restarted = Watcher(self.queries, sink, url=server.url, state_path=state, clock=lambda: self.now)
+
+            self.assertEqual(restarted.poll(), [])
+            self.assertEqual(len(sink.sent), 1)
+
+    def test_expired_queries_are_dropped(self):
+        sink = self.Sink()
+        self.now = datetime(2019, 7, 2).timestamp()
+        watcher = Watcher(self.queries[:1], sink, clock=lambda: self.now, sleep=mock.Mock())
+        watcher.run()
+
+        self.assertEqual(sink.sent[0][0]['event'], 'expired')
+        self.assertIsNone(watcher.next_due())
+
+
+class TestLazyImports(unittest.TestCase):
+
+    def test_invalid_arguments_do_not_load_network_stack(self):
+        from benchmarks.bench_startup import HEAVY_MODULES, ROOT, parse_importtime
+
+        args = (('BOJ', 'XXX', '01.07.2099', '2'), ('CPH', 'BLL', '01.07.2099', '2'))
+
+        for arguments in args:
+            with self.subTest(arguments):
+                process = subprocess.run(
+                    (sys.executable, '-X', 'importtime', 'main.py', *arguments),
+                    cwd=ROOT, capture_output=True, text=True
+                )
+                _, modules = parse_importtime(process.stderr)
+
+                self.assertFalse(modules & set(HEAVY_MODULES))
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+
+    def test_benchmarks_run_offline(self):
+        import benchmarks.suite  # noqa: F401
+        from benchmarks.harness import REGISTRY
+
+        for bench in REGISTRY:
+            with self.subTest(bench.name):
+                param = 'recorded' if 'recorded' in bench.params else bench.params[0]
+                bench.setup(param)()
+
+    def test_compare_results(self):
+        from benchmarks.harness import compare
+
+        baseline = [{'name': 'parse', 'param': 100, 'median': 1.0}]
+        current = [
+            {'name': 'parse', 'param': 100, 'median': 1.2},
+            {'name': 'new', 'param': None, 'median': 1.0}
+        ]
+
+        self.assertEqual(compare(baseline, current), [('parse', 100, 1.0, 1.2, True)])
+
+
 if __name__ == '__main__':
     unittest.main()